@@ -22,15 +22,104 @@
 
 ''' Build redirection table for the master server '''
 
+#
+# By default we write a shell script that fills the geoloc table of
+# the database of the master server.  With -o we compile, instead, the
+# table and the GeoIP country CSV files given as arguments (IPv4 and/or
+# IPv6) into the binary prefix trie that the rendezvous server loads
+# when rendezvous.server.redir_table is set.
+#
+# With -k count -c centroids, we redirect each country whose centroid
+# is listed in the centroids file (lines like `IT 42.83 12.83`) to its
+# count nearest slivers, by great-circle distance from the centroid to
+# the airport of the sliver (see M-Lab/airports_coords.dat).  Nearer
+# slivers are listed more times, so that they receive more clients.
+# The other countries follow the country/continent policy.
+#
+
 import asyncore
 import collections
+import getopt
+import math
 import sys
 import time
 
+sys.path.insert(0, '.')
+
+from neubot.rendezvous.redir_trie import RedirTrieBuilder
+
+USAGE = ('usage: M-Lab/redir_table.py [-k count -c centroids] '
+         '[-o output geoip.csv...]\n')
+
+# Mean radius of the Earth, in km
+EARTH_RADIUS = 6371.0
+
+# Added to distances, so that very close slivers don't take it all
+DISTANCE_BIAS = 500.0
+
+# Number of times we list the nearest sliver
+MAX_WEIGHT = 4
+
+def load_coords(path):
+    ''' Load a file that maps codes to (latitude, longitude) '''
+    coords = {}
+    filep = open(path, 'rb')
+    for line in filep:
+        vector = line.split('#')[0].split()
+        if len(vector) >= 3:
+            coords[vector[0]] = (float(vector[1]), float(vector[2]))
+    filep.close()
+    return coords
+
+def airport_code(fqdn):
+    ''' Returns the airport code of the site of a node, e.g. trn
+        for mlab1.trn01.measurement-lab.org '''
+    return fqdn.split('.')[1][:3]
+
+def distance(first, second):
+    ''' Great-circle distance, in km, between two (latitude,
+        longitude) pairs, using the haversine formula '''
+    lat1, lon1 = math.radians(first[0]), math.radians(first[1])
+    lat2, lon2 = math.radians(second[0]), math.radians(second[1])
+    value = (math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) *
+             math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(value)))
+
+def nearest_slivers(location, sliver_coords, count):
+    ''' Returns the count slivers nearest to location, each one
+        repeated according to its weight '''
+    ranked = sorted((distance(location, coords), address)
+                    for address, coords in sliver_coords.items())[:count]
+    result = []
+    for dist, address in ranked:
+        weight = (MAX_WEIGHT * (ranked[0][0] + DISTANCE_BIAS) /
+                  (dist + DISTANCE_BIAS))
+        result.extend([address] * max(1, int(round(weight))))
+    return result
+
 def realmain():
 
     ''' Build redirection table for the master server '''
 
+    try:
+        options, arguments = getopt.getopt(sys.argv[1:], 'c:k:o:')
+    except getopt.error:
+        sys.exit(USAGE)
+    output, count, centroids = None, 0, {}
+    for name, value in options:
+        if name == '-c':
+            centroids = load_coords(value)
+        elif name == '-k':
+            count = int(value)
+        elif name == '-o':
+            output = value
+    if (output and not arguments) or (not output and arguments):
+        sys.exit(USAGE)
+    if (count > 0) != bool(centroids):
+        sys.exit(USAGE)
+
+    airports = load_coords('M-Lab/airports_coords.dat')
+
     sys.stderr.write('Loading slivers addresses...\n')
     slivers = {}
     filep = open('M-Lab/ip_addr.dat', 'rb')
@@ -43,6 +132,7 @@ def realmain():
     sys.stderr.write('Loading nodes location...\n')
     nodes_by_country = collections.defaultdict(set)
     nodes_by_continent = collections.defaultdict(set)
+    sliver_coords = {}
     filep = open('M-Lab/servers.dat', 'rb')
     for line in filep:
         fqdn, country, continent = line.split()
@@ -53,6 +143,11 @@ def realmain():
         address = slivers[fqdn]
         nodes_by_continent[continent].add(address)
         nodes_by_country[country].add(address)
+        airport = airport_code(fqdn)
+        if airport in airports:
+            sliver_coords[address] = airports[airport]
+        elif count > 0:
+            sys.stderr.write('No coordinates for: %s\n' % fqdn)
     filep.close()
     sys.stderr.write('Loading nodes location... done\n')
 
@@ -79,6 +174,10 @@ def realmain():
         if line.startswith('#'):
             continue
         continent, country = line.split()[:2]
+        if count > 0 and country in centroids:
+            redir_table[country] = nearest_slivers(centroids[country],
+                                                   sliver_coords, count)
+            continue
         #
         # Simplified policy, which uses just one server per continent
         # to avoid jumping from close to distant servers, which may be
@@ -95,6 +194,20 @@ def realmain():
             redir_table[country] = set(['master.neubot.org'])
     sys.stderr.write('Build redirection table... done\n')
 
+    if output:
+        sys.stderr.write('Compile redirection table...\n')
+        builder = RedirTrieBuilder(dict((country, ['%s:8080' % address
+                                   for address in addresses])
+                                   for country, addresses in
+                                   redir_table.items()))
+        for path in arguments:
+            filep = open(path, 'rb')
+            builder.insert_geoip_csv(filep)
+            filep.close()
+        builder.write(output)
+        sys.stderr.write('Compile redirection table... done\n')
+        return
+
     prefix = 'sqlite3 $database'
     sys.stdout.write('#!/bin/sh\n')
     date = time.asctime(time.gmtime())
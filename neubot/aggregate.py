@@ -0,0 +1,147 @@
+# neubot/aggregate.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Aggregate and downsample rows returned by listify() '''
+
+#
+# The functions in this file work on the list of dictionaries
+# returned by table_xxx.listify(), so that /api/data can reduce
+# the amount of data sent to the browser when the user asks for
+# a long history.  The output of downsample() is again a list of
+# dictionaries ordered by decreasing timestamp, which means that
+# the recipes in WWWDIR/test/*.json keep on working on the reduced
+# data.  Aggregation is done by table_rollup, which uses the names
+# of buckets, statistics and fields defined here.
+#
+
+import math
+
+# Width of the buckets, in seconds
+BUCKETS = {
+    "hour": 3600,
+    "day": 86400,
+}
+
+# The statistics that table_rollup knows how to compute
+STATS = ("mean", "median", "p90")
+
+# The fields that we know how to aggregate
+FIELDS = ("download_speed", "upload_speed", "latency", "connect_time")
+
+# The fields that we know how to group by
+GROUP_BY = ("real_address",)
+
+def select_fields(template, fields=None):
+    ''' Returns the aggregatable fields of template, possibly
+        restricted to the ones listed in fields '''
+    available = [name for name in FIELDS if name in template]
+    if not fields:
+        return available
+    for name in fields:
+        if name not in available:
+            raise ValueError("aggregate: invalid field: %s" % name)
+    return list(fields)
+
+def _group(rows, group_by):
+    ''' Group rows by the value of the group_by key '''
+    if group_by and group_by not in GROUP_BY:
+        raise ValueError("aggregate: cannot group by: %s" % group_by)
+    groups = {}
+    for row in rows:
+        if group_by:
+            key = row.get(group_by, "")
+        else:
+            key = ""
+        groups.setdefault(key, []).append(row)
+    return groups
+
+def _sort_desc(rows):
+    ''' Sort rows by decreasing timestamp, like listify() does '''
+    rows.sort(key=lambda row: row["timestamp"], reverse=True)
+    return rows
+
+def _yvalue(row, field):
+    ''' Returns the value of field as float (None counts as zero) '''
+    value = row.get(field)
+    if value is None:
+        return 0.0
+    return float(value)
+
+def lttb(rows, threshold, field):
+
+    '''
+     Largest-Triangle-Three-Buckets downsampling of rows, using
+     timestamp as X and field as Y.  The rows MUST be sorted by
+     increasing timestamp.  Returns at most threshold rows, picking
+     the ones that best preserve the visual shape of the series.
+    '''
+
+    length = len(rows)
+    if threshold <= 0 or threshold >= length:
+        return list(rows)
+    if threshold < 3:
+        return [rows[0], rows[-1]][:threshold]
+
+    sampled = [rows[0]]
+    every = float(length - 2) / (threshold - 2)
+    anchor = 0
+
+    for index in range(threshold - 2):
+
+        # Average point of the next bucket
+        avg_start = int(math.floor((index + 1) * every)) + 1
+        avg_end = min(int(math.floor((index + 2) * every)) + 1, length)
+        avg_x, avg_y = 0.0, 0.0
+        for row in rows[avg_start:avg_end]:
+            avg_x += row["timestamp"]
+            avg_y += _yvalue(row, field)
+        count = avg_end - avg_start
+        avg_x /= count
+        avg_y /= count
+
+        # Point of current bucket with the largest triangle area
+        point_x = rows[anchor]["timestamp"]
+        point_y = _yvalue(rows[anchor], field)
+        max_area, chosen = -1.0, None
+        start = int(math.floor(index * every)) + 1
+        end = int(math.floor((index + 1) * every)) + 1
+        for position in range(start, end):
+            row = rows[position]
+            area = abs((point_x - avg_x) * (_yvalue(row, field) - point_y) -
+                       (point_x - row["timestamp"]) * (avg_y - point_y))
+            if area > max_area:
+                max_area, chosen = area, position
+
+        sampled.append(rows[chosen])
+        anchor = chosen
+
+    sampled.append(rows[-1])
+    return sampled
+
+def downsample(rows, threshold, field, group_by=None):
+    ''' Downsample each group of rows to threshold points using LTTB
+        and return them ordered by decreasing timestamp '''
+    result = []
+    for vector in _group(rows, group_by).values():
+        vector = sorted(vector, key=lambda row: row["timestamp"])
+        result.extend(lttb(vector, threshold, field))
+    return _sort_desc(result)
@@ -37,8 +37,10 @@ from neubot.config import ConfigError
 from neubot.debug import objgraph
 from neubot.http.message import Message
 from neubot.http.server import ServerHTTP
+from neubot.listener import ACCEPT_STATS
 from neubot.net.poller import POLLER
 from neubot.notify import NOTIFIER
+from neubot.resolver import RESOLVER
 from neubot.state import STATECHANGE
 from neubot.speedtest.client import QUEUE_HISTORY
 from neubot.state import STATE
@@ -54,6 +56,11 @@ from neubot import utils_hier
 
 from neubot.utils_api import NotImplementedTest
 
+try:
+    from neubot import sslstream
+except ImportError:
+    sslstream = None
+
 class ServerAPI(ServerHTTP):
 
     ''' Server for API '''
@@ -125,6 +132,10 @@ class ServerAPI(ServerHTTP):
         debuginfo = {}
         NOTIFIER.snap(debuginfo)
         POLLER.snap(debuginfo)
+        ACCEPT_STATS.snap(debuginfo)
+        debuginfo['resolver'] = RESOLVER.snap()
+        if sslstream:
+            sslstream.snap(debuginfo)
         debuginfo["queue_history"] = QUEUE_HISTORY
         debuginfo["WWWDIR"] = utils_hier.WWWDIR
         gc.collect()
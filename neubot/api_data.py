@@ -30,15 +30,19 @@
 #
 
 import cgi
+import sys
 
 from neubot.compat import json
+from neubot.config import ConfigError
 from neubot.database import DATABASE
 from neubot.database import table_bittorrent
 from neubot.database import table_speedtest
 from neubot.database import table_raw
+from neubot.database import table_rollup
 from neubot.http.message import Message
 from neubot.utils_api import NotImplementedTest
 
+from neubot import aggregate
 from neubot import utils
 
 def api_data(stream, request, query):
@@ -50,10 +54,13 @@ def api_data(stream, request, query):
 
     if "test" in dictionary:
         test = str(dictionary["test"][0])
-    if "since" in dictionary:
-        since = int(dictionary["since"][0])
-    if "until" in dictionary:
-        until = int(dictionary["until"][0])
+    try:
+        if "since" in dictionary:
+            since = int(dictionary["since"][0])
+        if "until" in dictionary:
+            until = int(dictionary["until"][0])
+    except ValueError:
+        raise ConfigError("Invalid since or until")
 
     if test == 'bittorrent':
         table = table_bittorrent
@@ -68,8 +75,48 @@ def api_data(stream, request, query):
     if "debug" in dictionary and utils.intify(dictionary["debug"][0]):
         indent, mimetype, sort_keys = 4, "text/plain", True
 
+    try:
+        lst = _select(test, table, dictionary, since, until)
+    except ValueError:
+        # Report malformed query strings to the caller
+        raise ConfigError(str(sys.exc_info()[1]))
+
     response = Message()
-    lst = table.listify(DATABASE.connection(), since, until)
     body = json.dumps(lst, indent=indent, sort_keys=sort_keys)
     response.compose(code="200", reason="Ok", body=body, mimetype=mimetype)
     stream.send_response(request, response)
+
+def _select(test, table, dictionary, since, until):
+    ''' Returns the results of test, possibly aggregated and/or
+        downsampled according to the query string options '''
+
+    fields = None
+    if "fields" in dictionary:
+        fields = str(dictionary["fields"][0]).split(",")
+    fields = aggregate.select_fields(table.TEMPLATE, fields)
+
+    group_by = None
+    if "group_by" in dictionary:
+        group_by = str(dictionary["group_by"][0])
+
+    if "aggregate" in dictionary:
+        stat = "mean"
+        if "stat" in dictionary:
+            stat = str(dictionary["stat"][0])
+        # Rollups are cheaper and survive table_xxx.prune()
+        lst = table_rollup.listify(DATABASE.connection(), test,
+                                   str(dictionary["aggregate"][0]), stat,
+                                   fields, group_by, since, until)
+    elif (table is table_raw and "series" in dictionary and
+          utils.intify(dictionary["series"][0])):
+        lst = table.listify(DATABASE.connection(), since, until, series=True)
+    else:
+        lst = table.listify(DATABASE.connection(), since, until)
+
+    if "downsample" in dictionary:
+        if not fields:
+            raise ValueError("api_data: nothing to downsample")
+        lst = aggregate.downsample(lst, int(dictionary["downsample"][0]),
+                                   fields[0], group_by)
+
+    return lst
@@ -24,6 +24,7 @@
 ''' API to populate results.html page '''
 
 import cgi
+import copy
 import os
 
 from neubot.compat import json
@@ -50,6 +51,56 @@ COPY_CONFIG_VARIABLES = (
     'www_no_title',
 )
 
+# Cache of the files we read, see _load().  It maps the path of each
+# file to a (stamp, content) tuple, where stamp is computed by _stamp().
+_FILES = {}
+
+# Cache of encoded responses.  It maps (test, debug) to a (fingerprint, body)
+# tuple, where fingerprint captures everything the body depends on.
+_RESPONSES = {}
+
+def _stamp(path):
+    ''' Returns the (mtime, size) of path or None if it does not exist '''
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return (info.st_mtime, info.st_size)
+
+def _load(path, stamp, loader):
+    ''' Returns loader(path) from cache, unless stamp has changed '''
+    entry = _FILES.get(path)
+    if entry is None or entry[0] != stamp:
+        entry = (stamp, loader(path))
+        _FILES[path] = entry
+    return entry[1]
+
+def _list_tests(path):
+    ''' Maps the name of each test described in path to its JSON file '''
+    available_tests = {}
+    for filename in os.listdir(path):
+        if filename.endswith('.json'):
+            index = filename.rfind('.json')
+            if index == -1:
+                raise RuntimeError('api_results: internal error')
+            name = filename[:index]
+            available_tests[name] = filename
+    return available_tests
+
+def _read_json(path):
+    ''' Reads and decodes the JSON file at path '''
+    filep = open(path, 'rb')
+    content = json.loads(filep.read())
+    filep.close()
+    return content
+
+def _read(path):
+    ''' Reads the file at path '''
+    filep = open(path, 'rb')
+    content = filep.read()
+    filep.close()
+    return content
+
 def api_results(stream, request, query):
     ''' Populates www/results.html page '''
 
@@ -58,16 +109,16 @@ def api_results(stream, request, query):
     if 'test' in dictionary:
         test = str(dictionary['test'][0])
 
-    # Read the directory each time, so you don't need to restart the daemon
-    # after you have changed the description of a test.
-    available_tests = {}
-    for filename in os.listdir(TESTDIR):
-        if filename.endswith('.json'):
-            index = filename.rfind('.json')
-            if index == -1:
-                raise RuntimeError('api_results: internal error')
-            name = filename[:index]
-            available_tests[name] = filename
+    # Note: DO NOT sort keys here: order MUST be preserved
+    indent, mimetype = None, 'application/json'
+    if 'debug' in dictionary and utils.intify(dictionary['debug'][0]):
+        indent, mimetype = 4, 'text/plain'
+
+    # Check the mtime of the directory and of the files each time, so you
+    # don't need to restart the daemon after you have changed the description
+    # of a test, but read them again only when they have changed.
+    dirstamp = _stamp(TESTDIR)
+    available_tests = _load(TESTDIR, dirstamp, _list_tests)
     if not test in available_tests:
         raise NotImplementedTest('Test not implemented')
 
@@ -75,23 +126,44 @@ def api_results(stream, request, query):
     # descriptions with local modifications.
     filepath = utils_path.append(TESTDIR, available_tests[test])
     localfilepath = filepath + '.local'
-    if os.path.isfile(localfilepath):
-        filep = open(localfilepath, 'rb')
+    descrpath = filepath.replace('.json', '.html')
+    stamps = (_stamp(filepath), _stamp(localfilepath), _stamp(descrpath))
+
+    # The body also depends on some settings, which may change at runtime
+    # by means of /api/config.
+    settings = tuple(CONFIG[variable] for variable in COPY_CONFIG_VARIABLES)
+
+    fingerprint = (dirstamp, stamps, settings)
+    entry = _RESPONSES.get((test, indent))
+    if entry is None or entry[0] != fingerprint:
+        body = _make_body(test, available_tests, filepath, localfilepath,
+                          descrpath, stamps, indent)
+        entry = (fingerprint, body)
+        _RESPONSES[(test, indent)] = entry
+
+    response = Message()
+    response.compose(code='200', reason='Ok', body=entry[1], mimetype=mimetype)
+    stream.send_response(request, response)
+
+def _make_body(test, available_tests, filepath, localfilepath, descrpath,
+               stamps, indent):
+    ''' Builds and encodes the body of the /api/results response '''
+
+    if stamps[1] is not None:
+        response_body = _load(localfilepath, stamps[1], _read_json)
     else:
-        filep = open(filepath, 'rb')
-    response_body = json.loads(filep.read())
-    filep.close()
+        response_body = _load(filepath, stamps[0], _read_json)
+
+    # The cached descriptor MUST NOT be modified
+    response_body = copy.copy(response_body)
 
     # Add extra information needed to populate results.html selection that
     # allows to select which test results must be shown.
     response_body['available_tests'] = available_tests.keys()
     response_body['selected_test'] = test
 
-    descrpath = filepath.replace('.json', '.html')
-    if os.path.isfile(descrpath):
-        filep = open(descrpath, 'rb')
-        response_body['description'] = filep.read()
-        filep.close()
+    if stamps[2] is not None:
+        response_body['description'] = _load(descrpath, stamps[2], _read)
 
     # Provide the web user interface some settings it needs, but only if they
     # were not already provided by the `.local` file.
@@ -99,12 +171,4 @@ def api_results(stream, request, query):
         if not variable in response_body:
             response_body[variable] = CONFIG[variable]
 
-    # Note: DO NOT sort keys here: order MUST be preserved
-    indent, mimetype = None, 'application/json'
-    if 'debug' in dictionary and utils.intify(dictionary['debug'][0]):
-        indent, mimetype = 4, 'text/plain'
-
-    response = Message()
-    body = json.dumps(response_body, indent=indent)
-    response.compose(code='200', reason='Ok', body=body, mimetype=mimetype)
-    stream.send_response(request, response)
+    return json.dumps(response_body, indent=indent)
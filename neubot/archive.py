@@ -0,0 +1,153 @@
+# neubot/archive.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Read the archives written by the M-Lab backend, i.e. the files
+ below datadir named YYYY/MM/DD/<iso8601>_<test>.gz.  Old archives
+ contain a single JSON document, new ones contain one document per
+ line, possibly split across many gzip members (one per batch).
+ We read archives member by member, so that it is possible to
+ resume from the offset of a member, e.g. when an hourly archive
+ has grown since we last read it.
+'''
+
+import os
+import zlib
+
+from neubot.compat import json
+from neubot.database import table_raw
+
+# The tests whose results we know how to read
+TESTS = ('bittorrent', 'raw', 'speedtest')
+
+# Amount of compressed data read at a time
+CHUNK_SIZE = 262144
+
+def test_of(path):
+    ''' Returns the test of the archive at path or None '''
+    name = os.path.basename(path)
+    if not name.endswith('.gz') or '_' not in name:
+        return None
+    test = name[:-len('.gz')].rsplit('_', 1)[1]
+    if test not in TESTS:
+        return None
+    return test
+
+def walk(datadir):
+    ''' Yields, in order, the path (relative to datadir) of each
+        archive below datadir '''
+    for dirpath, dirnames, filenames in os.walk(datadir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if test_of(name):
+                fullpath = os.path.join(dirpath, name)
+                yield os.path.relpath(fullpath, datadir)
+
+def read_members(path, offset=0):
+
+    ''' Yields (offset, end, content) for each gzip member of the
+        archive at path, starting from the member at offset, where
+        end is the offset of the next member.  A truncated member at
+        the end of the file, e.g. one that is being written, is not
+        returned. '''
+
+    filep = open(path, 'rb')
+    filep.seek(offset)
+    pending = ''
+    while True:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks, start, complete = [], offset, False
+        while True:
+            if not pending:
+                pending = filep.read(CHUNK_SIZE)
+                if not pending:
+                    break
+            chunks.append(decompressor.decompress(pending))
+            if decompressor.unused_data:
+                offset += len(pending) - len(decompressor.unused_data)
+                pending = decompressor.unused_data
+                complete = True
+                break
+            offset += len(pending)
+            pending = ''
+        if not complete:
+            # Either EOF or a member that ends exactly at EOF
+            if offset > start and _is_complete(decompressor):
+                yield start, offset, ''.join(chunks)
+            break
+        yield start, offset, ''.join(chunks)
+    filep.close()
+
+def _is_complete(decompressor):
+    ''' Returns True if the decompressor has seen the end of
+        the member, i.e. further input is unused '''
+    try:
+        decompressor.decompress('\0')
+    except zlib.error:
+        return False
+    return bool(decompressor.unused_data)
+
+def parse_member(content):
+    ''' Yields (line, document) for each document in content '''
+    for line, text in enumerate(content.splitlines()):
+        if text.strip():
+            yield line, json.loads(text)
+
+def read_documents(path, offset=0):
+    ''' Yields (member, end, line, document) for each document in
+        the archive at path, starting from the member at offset '''
+    for member, end, content in read_members(path, offset):
+        for line, document in parse_member(content):
+            yield member, end, line, document
+
+def read_document(path, member, line):
+    ''' Returns the document at the given member and line '''
+    for _, _, content in read_members(path, member):
+        for index, document in parse_member(content):
+            if index == line:
+                return document
+        break
+    raise KeyError('archive: no such document')
+
+def summarize(test, document):
+
+    ''' Returns the timestamp, client address, uuid and metrics of
+        the result of test contained in document '''
+
+    if test == 'raw':
+        row = table_raw.json_to_mapped_row(document)
+        row['timestamp'] = document['server'].get('timestamp',
+                                                  row['timestamp'])
+        row['upload_speed'] = None
+    else:
+        row = document
+
+    return {
+            'timestamp': int(row.get('timestamp', 0)),
+            'test': test,
+            'real_address': row.get('real_address', ''),
+            'uuid': row.get('uuid', ''),
+            'download_speed': row.get('download_speed'),
+            'upload_speed': row.get('upload_speed'),
+            'latency': row.get('latency'),
+            'connect_time': row.get('connect_time'),
+           }
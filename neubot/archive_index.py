@@ -0,0 +1,277 @@
+# neubot/archive_index.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Index of the archives written by the M-Lab backend.  For each result
+ we save the timestamp, the test, the client address, the uuid and
+ the main metrics, plus a pointer to the document (the archive path,
+ the offset of the gzip member and the line within the member), so
+ that queries by time, test and client do not need to decompress
+ the archives.  The index is updated incrementally: we remember how
+ much of each archive we have read and, when an hourly archive grows,
+ we only read the gzip members that were appended.
+'''
+
+import getopt
+import logging
+import os
+import sqlite3
+import sys
+
+from neubot.compat import json
+from neubot.config import CONFIG
+from neubot.database import _table_utils
+
+from neubot import archive
+from neubot import utils
+from neubot import utils_hier
+
+TEMPLATE = {
+    "timestamp": 0,
+    "test": "",
+    "real_address": "",
+    "uuid": "",
+
+    "download_speed": 0.0,
+    "upload_speed": 0.0,
+    "latency": 0.0,
+    "connect_time": 0.0,
+
+    "path": "",
+    "member": 0,
+    "line": 0,
+}
+
+CREATE_TABLE = _table_utils.make_create_table('results', TEMPLATE)
+INSERT_INTO = _table_utils.make_insert_into('results', TEMPLATE)
+
+CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS results_test_timestamp_idx"
+    " ON results (test, timestamp);",
+    _table_utils.make_create_index('results', 'real_address'),
+    _table_utils.make_create_index('results', 'path'),
+]
+
+#
+# For each archive we save size and mtime, to skip archives that did
+# not change, and the offset of the first member not yet indexed.
+#
+CREATE_FILES = """CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY,
+  size INTEGER, mtime REAL, offset INTEGER);"""
+
+DEFAULT_INDEX = 'archive_index.sqlite3'
+
+def connect(path):
+    ''' Open the index at path, creating it if needed '''
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    connection.execute(CREATE_TABLE)
+    for query in CREATE_INDEXES:
+        connection.execute(query)
+    connection.execute(CREATE_FILES)
+    connection.commit()
+    return connection
+
+def _forget(connection, path):
+    ''' Forget everything we know about the archive at path '''
+    connection.execute('DELETE FROM results WHERE path=?;', (path,))
+    connection.execute('DELETE FROM files WHERE path=?;', (path,))
+
+def _index_file(connection, datadir, path, offset):
+    ''' Index the archive at path starting from offset, return the
+        number of results and the offset of the first member that
+        we have not read '''
+    test = archive.test_of(path)
+    count = 0
+    for member, end, line, document in archive.read_documents(
+                                os.path.join(datadir, path), offset):
+        offset = end
+        try:
+            row = archive.summarize(test, document)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            logging.warning('archive_index: %s: cannot summarize result',
+                            path, exc_info=1)
+            continue
+        row['path'] = path
+        row['member'] = member
+        row['line'] = line
+        _table_utils.do_insert_into(connection, INSERT_INTO, row, TEMPLATE,
+                                    False, False)
+        count += 1
+    return count, offset
+
+def update(connection, datadir):
+
+    ''' Bring the index up to date with the archives below datadir,
+        return the number of results that we have added '''
+
+    known = {}
+    for row in connection.execute('SELECT * FROM files;'):
+        known[row['path']] = row
+
+    total = 0
+    for path in archive.walk(datadir):
+        try:
+            stat = os.stat(os.path.join(datadir, path))
+        except OSError:
+            continue
+
+        row = known.pop(path, None)
+        offset = 0
+        if row is not None:
+            if row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+                continue
+            if stat.st_size >= row['size']:
+                offset = row['offset']
+            else:
+                logging.debug('archive_index: %s has shrunk', path)
+                _forget(connection, path)
+
+        try:
+            count, offset = _index_file(connection, datadir, path, offset)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            logging.warning('archive_index: cannot index %s', path,
+                            exc_info=1)
+            connection.rollback()
+            continue
+
+        connection.execute('''INSERT OR REPLACE INTO files (path, size,
+          mtime, offset) VALUES (?, ?, ?, ?);''', (path, stat.st_size,
+          stat.st_mtime, offset))
+        connection.commit()
+        logging.debug('archive_index: %s: %d new results', path, count)
+        total += count
+
+    # Archives that have been removed
+    for path in known:
+        _forget(connection, path)
+    connection.commit()
+
+    return total
+
+def query(connection, since=-1, until=-1, test=None, address=None,
+          uuid=None):
+
+    ''' Returns the list of indexed results that match the given
+        filter, sorted by timestamp '''
+
+    clauses, params = [], {}
+    if since >= 0:
+        clauses.append('timestamp >= :since')
+        params['since'] = since
+    if until >= 0:
+        clauses.append('timestamp < :until')
+        params['until'] = until
+    if test:
+        clauses.append('test = :test')
+        params['test'] = test
+    if address:
+        clauses.append('real_address = :address')
+        params['address'] = address
+    if uuid:
+        clauses.append('uuid = :uuid')
+        params['uuid'] = uuid
+
+    sql = ['SELECT ', ', '.join(sorted(TEMPLATE.keys())), ' FROM results']
+    if clauses:
+        sql.append(' WHERE ')
+        sql.append(' AND '.join(clauses))
+    sql.append(' ORDER BY timestamp;')
+
+    cursor = connection.execute(''.join(sql), params)
+    return [dict(row) for row in cursor]
+
+def fetch(datadir, row):
+    ''' Returns the complete result pointed by an indexed row '''
+    return archive.read_document(os.path.join(datadir, row['path']),
+                                 row['member'], row['line'])
+
+USAGE = '''\
+Neubot archive_index -- Index the results saved by the M-Lab backend
+
+Usage: neubot archive_index [-v] [-d datadir] [-f index] update
+       neubot archive_index [-v] [-d datadir] [-f index] query
+         [-a address] [-s since] [-t test] [-u until] [-U uuid] [-x]
+
+'''
+
+def main(args):
+
+    ''' Index the results saved by the M-Lab backend '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'a:d:f:s:t:U:u:vx')
+    except getopt.GetoptError:
+        sys.stderr.write(USAGE)
+        sys.exit(1)
+
+    if len(arguments) != 1 or arguments[0] not in ('update', 'query'):
+        sys.stderr.write(USAGE)
+        sys.exit(1)
+
+    datadir = utils_hier.LOCALSTATEDIR
+    path = DEFAULT_INDEX
+    filters = {}
+    expand = False
+    for name, value in options:
+        if name == '-a':
+            filters['address'] = value
+        elif name == '-d':
+            datadir = value
+        elif name == '-f':
+            path = value
+        elif name == '-s':
+            filters['since'] = int(value)
+        elif name == '-t':
+            filters['test'] = value
+        elif name == '-U':
+            filters['uuid'] = value
+        elif name == '-u':
+            filters['until'] = int(value)
+        elif name == '-v':
+            CONFIG['verbose'] = 1
+        elif name == '-x':
+            expand = True
+
+    connection = connect(path)
+
+    if arguments[0] == 'update':
+        begin = utils.ticks()
+        count = update(connection, datadir)
+        logging.info('archive_index: %d new results in %s', count,
+                     utils.time_formatter(utils.ticks() - begin))
+
+    else:
+        rows = query(connection, **filters)
+        if expand:
+            rows = [fetch(datadir, row) for row in rows]
+        json.dump(rows, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+
+    connection.close()
+
+if __name__ == '__main__':
+    main(sys.argv)
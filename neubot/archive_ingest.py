@@ -0,0 +1,239 @@
+# neubot/archive_ingest.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Load into a sqlite database the results collected from the servers
+ (e.g. with scripts/collect.sh).  The archives are decompressed, parsed
+ and normalized in a pool of processes, using the same templates of
+ the speedtest, bittorrent and raw tables of the Neubot database, and
+ the parent process bulk-loads the rows, one transaction per archive.
+ For each archive we also save how much of it we have loaded, so
+ that running the command again loads only the new results.
+'''
+
+import getopt
+import logging
+import os
+import sqlite3
+import sys
+
+from neubot.config import CONFIG
+from neubot.database import table_bittorrent
+from neubot.database import table_raw
+from neubot.database import table_speedtest
+
+from neubot import archive
+from neubot import utils
+
+TABLES = {
+    'bittorrent': table_bittorrent,
+    'raw': table_raw,
+    'speedtest': table_speedtest,
+}
+
+#
+# Per-archive checkpoints: size and mtime allow to skip the archives
+# that did not change and offset is the first member not yet loaded.
+#
+CREATE_FILES = """CREATE TABLE IF NOT EXISTS ingested_files (path TEXT
+  PRIMARY KEY, size INTEGER, mtime REAL, offset INTEGER);"""
+
+DEFAULT_DATABASE = 'results.sqlite3'
+
+def connect(path):
+    ''' Open the database at path, creating the tables if needed '''
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    # We write a lot and a checkpoint is committed with its rows
+    connection.execute('PRAGMA synchronous=NORMAL;')
+    for table in TABLES.values():
+        table.create(connection, commit=False)
+    connection.execute(CREATE_FILES)
+    connection.commit()
+    return connection
+
+def normalize(test, document):
+    ''' Returns the row of the table of test that corresponds to
+        document and, for raw, the list of encoded series '''
+    if test == 'raw':
+        row, series = table_raw.encode_result(document)
+        # Like archive.summarize(): goodput ticks are not a Unix time
+        row['timestamp'] = int(document['server']['timestamp'])
+        return row, series
+    template = TABLES[test].TEMPLATE
+    return dict((key, document.get(key)) for key in template), None
+
+def parse(job):
+
+    '''
+     Read the archive at path, starting from offset, and return the
+     path, the offset of the first member not read, the number of
+     documents that we could not normalize and the list of rows.
+     On failure, the offset is None and the last item is the error.
+     This function runs in a worker process.
+    '''
+
+    datadir, path, offset = job
+    test = archive.test_of(path)
+    rows, errors = [], 0
+    try:
+        for _, end, _, document in archive.read_documents(
+                                     os.path.join(datadir, path), offset):
+            offset = end
+            try:
+                rows.append(normalize(test, document))
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                errors += 1
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except:
+        return path, None, errors, str(sys.exc_info()[1])
+    return path, offset, errors, rows
+
+def _load(connection, test, rows):
+    ''' Bulk-load rows into the table of test '''
+    if test == 'raw':
+        for row, series in rows:
+            raw_id = connection.execute(table_raw.INSERT_INTO,
+                                        row).lastrowid
+            table_raw.insert_series(connection, raw_id, series)
+    else:
+        connection.executemany(TABLES[test].INSERT_INTO,
+                               (row for row, _ in rows))
+
+def _jobs(connection, datadir, stats):
+    ''' Yields the (datadir, path, offset) of each archive that has
+        changed since the last run and fills stats '''
+
+    known = {}
+    for row in connection.execute('SELECT * FROM ingested_files;'):
+        known[row['path']] = row
+
+    for path in archive.walk(datadir):
+        try:
+            stat = os.stat(os.path.join(datadir, path))
+        except OSError:
+            continue
+        row = known.get(path)
+        offset = 0
+        if row is not None:
+            if row['size'] == stat.st_size and row['mtime'] == stat.st_mtime:
+                continue
+            if stat.st_size < row['size']:
+                # We cannot tell which results we have already loaded
+                logging.warning('archive_ingest: %s has shrunk; skip', path)
+                continue
+            offset = row['offset']
+        stats[path] = stat
+        yield datadir, path, offset
+
+def ingest(connection, datadir, jobs=1):
+
+    ''' Load the new results below datadir into the database using
+        jobs worker processes, return the number of new results '''
+
+    stats, total = {}, 0
+    # The pool consumes jobs in another thread, but _jobs() needs connection
+    todo = list(_jobs(connection, datadir, stats))
+
+    if jobs > 1 and len(todo) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(jobs, len(todo)))
+        results = pool.imap(parse, todo)
+    else:
+        pool = None
+        results = (parse(job) for job in todo)
+
+    try:
+        for path, offset, errors, rows in results:
+            if offset is None:
+                logging.warning('archive_ingest: cannot read %s: %s',
+                                path, rows)
+                continue
+            if errors:
+                logging.warning('archive_ingest: %s: %d invalid results',
+                                path, errors)
+            stat = stats.pop(path)
+            _load(connection, archive.test_of(path), rows)
+            connection.execute('''INSERT OR REPLACE INTO ingested_files
+              (path, size, mtime, offset) VALUES (?, ?, ?, ?);''',
+              (path, stat.st_size, stat.st_mtime, offset))
+            connection.commit()
+            logging.debug('archive_ingest: %s: %d new results', path,
+                          len(rows))
+            total += len(rows)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    return total
+
+def _cpu_count():
+    ''' Returns the number of CPUs, or 1 if unknown '''
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+USAGE = '''\
+Neubot archive_ingest -- Load collected results into a database
+
+Usage: neubot archive_ingest [-v] [-f database] [-j jobs] datadir
+
+'''
+
+def main(args):
+
+    ''' Load collected results into a database '''
+
+    try:
+        options, arguments = getopt.getopt(args[1:], 'f:j:v')
+    except getopt.GetoptError:
+        sys.stderr.write(USAGE)
+        sys.exit(1)
+    if len(arguments) != 1:
+        sys.stderr.write(USAGE)
+        sys.exit(1)
+
+    path = DEFAULT_DATABASE
+    jobs = _cpu_count()
+    for name, value in options:
+        if name == '-f':
+            path = value
+        elif name == '-j':
+            jobs = int(value)
+        elif name == '-v':
+            CONFIG['verbose'] = 1
+
+    connection = connect(path)
+    begin = utils.ticks()
+    count = ingest(connection, arguments[0], jobs)
+    logging.info('archive_ingest: %d new results in %s', count,
+                 utils.time_formatter(utils.ticks() - begin))
+    connection.close()
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -30,8 +30,8 @@
 # The 'neubot' backend saves the result into an sqlite3 database and
 # is typically used on the user side.
 #
-# The 'mlab' backend follows Measurement Lab conventions and each test
-# is a compressed JSON file in a given directory.
+# The 'mlab' backend follows Measurement Lab conventions and appends the
+# results of each test to hourly compressed JSON files in a given directory.
 #
 # Prototype code for this file discussed with and written by Fabio
 # Forno, thanks!
@@ -165,6 +165,7 @@ def main(args):
 
     BACKEND.bittorrent_store(msg)
     BACKEND.speedtest_store(msg)
+    BACKEND.close()
 
 if __name__ == '__main__':
     main(sys.argv)
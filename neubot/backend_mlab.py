@@ -26,8 +26,23 @@
 # Follows closely the M-Lab specification for saving results
 # in a very scalable way.
 #
+# Results are appended, one JSON document per line, to a per-test
+# file that is rotated every hour, e.g.
+#
+#     2013/04/05/20130405T14:00:00.000000000Z_speedtest.gz
+#
+# Each batch of results is written as a new gzip member, so the
+# file is always a valid (multi-member) gzip file, which can be
+# read with zcat or with python's gzip module.  Compression and
+# writing happen in a background thread, not in the poller.
+#
 
+import Queue
+import atexit
 import gzip
+import logging
+import os
+import threading
 import time
 
 from neubot.compat import json
@@ -35,9 +50,158 @@ from neubot.filesys import FILESYS
 
 from neubot.backend_null import BackendNull
 
+# Max number of seconds a result waits before being written
+FLUSH_DELAY = 5.0
+
+# Max number of results we keep in memory before writing
+FLUSH_BATCH = 256
+
+def archive_components(test, thetime):
+    ''' Returns the path components of the archive of test that
+        contains the results saved at thetime '''
+    gmt = time.gmtime(thetime)
+    return [
+            time.strftime('%Y', gmt),
+            time.strftime('%m', gmt),
+            time.strftime('%d', gmt),
+            '%s_%s.gz' % (time.strftime('%Y%m%dT%H:00:00.000000000Z', gmt),
+                          test),
+           ]
+
+class ArchiveWriter(object):
+
+    ''' Appends results to hourly, per-test gzip archives using
+        a background thread '''
+
+    def __init__(self, filesys=FILESYS, delay=FLUSH_DELAY,
+                 batch=FLUSH_BATCH):
+        self.filesys = filesys
+        self.delay = delay
+        self.batch = batch
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.paths = {}
+        self.registered = False
+
+    def _start(self):
+        ''' Lazily start the background thread, so that we do not
+            start it before going into the background '''
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run,
+                                               name='archive_writer')
+                self.thread.daemon = True
+                self.thread.start()
+                if not self.registered:
+                    atexit.register(self.close)
+                    self.registered = True
+
+    def store(self, test, message, thetime=None):
+        ''' Queue the result of test for writing '''
+        if thetime is None:
+            thetime = time.time()
+        # Serialize now, because message may change later
+        line = json.dumps(message) + '\n'
+        self._start()
+        self.queue.put(('store', (test, thetime, line)))
+
+    def _wait(self, kind):
+        ''' Send a command to the thread and wait for it '''
+        with self.lock:
+            thread = self.thread
+        if thread is None:
+            return
+        event = threading.Event()
+        self.queue.put((kind, event))
+        # Note: wait() without timeout is not interruptible in Python 2
+        while not event.is_set() and thread.is_alive():
+            event.wait(1.0)
+        if kind == 'close':
+            thread.join()
+            with self.lock:
+                self.thread = None
+
+    def flush(self):
+        ''' Wait until the queued results have been written '''
+        self._wait('flush')
+
+    def close(self):
+        ''' Write the queued results and stop the thread '''
+        self._wait('close')
+
+    def _run(self):
+        ''' Background thread main loop '''
+        pending, count, deadline = {}, 0, None
+        while True:
+            try:
+                if deadline is None:
+                    kind, payload = self.queue.get()
+                else:
+                    kind, payload = self.queue.get(True, max(0.0,
+                                      deadline - time.time()))
+            except Queue.Empty:
+                kind, payload = 'timeout', None
+
+            if kind == 'store':
+                test, thetime, line = payload
+                key = tuple(archive_components(test, thetime))
+                pending.setdefault(key, []).append(line)
+                count += 1
+                if deadline is None:
+                    deadline = time.time() + self.delay
+                if count < self.batch:
+                    continue
+
+            self._write(pending)
+            pending, count, deadline = {}, 0, None
+
+            if kind in ('flush', 'close'):
+                payload.set()
+            if kind == 'close':
+                break
+
+    def _write(self, pending):
+        ''' Append each list of lines to its archive '''
+        for components, lines in pending.items():
+            try:
+                fullpath = self._touch(components)
+                filep = open(fullpath, 'ab')
+                zfilep = gzip.GzipFile(filename='', mode='wb', fileobj=filep)
+                zfilep.write(''.join(lines))
+                zfilep.close()
+                filep.close()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                logging.error('backend_mlab: cannot write %d results',
+                              len(lines), exc_info=1)
+                # Next time, start over with datadir_touch()
+                self.paths.pop(components, None)
+
+    def _touch(self, components):
+        ''' Make sure that the archive exists (and that ownership and
+            permissions are OK) the first time we see it and every
+            time someone else removes it '''
+        fullpath = self.paths.get(components)
+        # The collector (or a cleanup job) may have removed it
+        if fullpath is not None and not os.path.exists(fullpath):
+            fullpath = None
+        if fullpath is None:
+            # We need at most one archive per test per hour
+            if len(self.paths) > 64:
+                self.paths.clear()
+            fullpath = self.filesys.datadir_touch(list(components))
+            self.paths[components] = fullpath
+        return fullpath
+
 class BackendMLab(BackendNull):
     ''' M-Lab backend '''
 
+    def __init__(self):
+        BackendNull.__init__(self)
+        self.writer = ArchiveWriter()
+
     def bittorrent_store(self, message):
         ''' Saves the results of a bittorrent test '''
         self.do_store('bittorrent', message)
@@ -50,41 +214,10 @@ class BackendMLab(BackendNull):
         ''' Saves the results of a speedtest test '''
         self.do_store('speedtest', message)
 
-    @staticmethod
-    def do_store(test, message):
+    def do_store(self, test, message):
         ''' Saves the results of the given test '''
+        self.writer.store(test, message)
 
-        # Get time information
-        thetime = time.time()
-        gmt = time.gmtime(thetime)
-        nanosec = int((thetime % 1.0) * 1000000000)
-
-        #
-        # Build path components.
-        # The time format is ISO8601, except that we use nanosecond
-        # and not microsecond precision.
-        #
-        components = [
-                      time.strftime('%Y', gmt),
-                      time.strftime('%m', gmt),
-                      time.strftime('%d', gmt),
-                      '%s.%09dZ_%s.gz' % (
-                        time.strftime('%Y%m%dT%H:%M:%S', gmt),
-                        nanosec, test)
-                     ]
-
-        #
-        # Make sure that the path exists and that ownership
-        # and permissions are OK.
-        #
-        fullpath = FILESYS.datadir_touch(components)
-
-        #
-        # Open the output file for appending, write into
-        # it the message and close.
-        # We open for appending just in case two tests
-        # terminates at the same time (unlikely!).
-        #
-        filep = gzip.open(fullpath, 'ab')
-        json.dump(message, filep)
-        filep.close()
+    def close(self):
+        ''' Write pending results '''
+        self.writer.close()
@@ -21,14 +21,12 @@
 #
 
 #
-# With Python2.5 use simplejson because json is not in
-# the standard library.  The recommended usage is that of
-# importing `json` from this file as follows::
+# The recommended usage is that of importing `json` from
+# this file as follows::
 #
 #   from neubot.compat import json
 #
+# See neubot/json_codec.py for how we pick the implementation.
+#
 
-try:
-    import json
-except ImportError:
-    from neubot import simplejson as json
+from neubot import json_codec as json
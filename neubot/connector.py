@@ -27,28 +27,162 @@
 
 import collections
 import logging
+import socket
 
 from neubot.defer import Deferred
 from neubot.pollable import Pollable
 from neubot.poller import POLLER
+from neubot.resolver import RESOLVER
 
 from neubot import utils_net
 from neubot import utils
 
-class Connector(Pollable):
+# Head start of a connection attempt over the next one (RFC 8305)
+ATTEMPT_DELAY = 0.25
 
-    ''' Pollable socket connector '''
+# Names of the address families
+FAMILIES = {
+    socket.AF_INET: 'AF_INET',
+    socket.AF_INET6: 'AF_INET6',
+}
 
-    def __init__(self, parent, endpoint, prefer_ipv6, sslconfig, extra):
+class _Attempt(Pollable):
+
+    ''' One connection attempt of a race '''
+
+    def __init__(self, race, sock, ainfo):
         Pollable.__init__(self)
+        self.race = race
+        self.sock = sock
+        self.ainfo = ainfo
+        self.timestamp = utils.ticks()
+        self.watchdog = race.watchdog
+
+    def __repr__(self):
+        return 'connect attempt to %s' % utils_net.format_epnt(self.ainfo[4])
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def handle_write(self):
+        self.race.poller.unset_writable(self)
+        self.race.attempt_done(self, utils_net.isconnected(self.ainfo[4],
+                                                           self.sock))
+
+    def handle_close(self):
+        self.race.attempt_done(self, None)
+
+class ConnectRace(object):
+
+    '''
+     Connects to the first address of endpoint that answers.  The
+     addresses alternate the address families, starting with the
+     preferred one, and we start a new attempt when the previous one
+     fails or has not succeeded within ATTEMPT_DELAY seconds, so that
+     a broken IPv6 (or IPv4) path costs a fraction of a second rather
+     than a timeout (RFC 8305, "happy eyeballs").  When an attempt
+     succeeds, we close the other ones.
+    '''
+
+    def __init__(self, poller, endpoint, prefer_ipv6, on_success,
+                 on_failure, watchdog=10):
+        self.poller = poller
+        self.endpoint = endpoint
+        self.prefer_ipv6 = prefer_ipv6
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.watchdog = watchdog
+        self.addrinfo = collections.deque()
+        self.attempts = []
+        self.done = False
+
+    def start(self):
+        ''' Start racing '''
+        logging.debug('connect(): about to connect to: %s',
+                      str(self.endpoint))
+        deferred = Deferred()
+        deferred.add_callback(self._resolved)
+        deferred.add_errback(self._resolve_failed)
+        RESOLVER.getaddrinfo(self.endpoint, deferred)
+
+    def _resolved(self, addrinfo):
+        ''' Invoked when the resolver has the addresses of endpoint '''
+        if self.done:
+            return
+        self.addrinfo.extend(utils_net.sort_addrinfo(addrinfo,
+                                                     self.prefer_ipv6))
+        self._next_attempt()
+
+    def _resolve_failed(self, failure):
+        ''' Invoked when the resolver cannot resolve endpoint '''
+        logging.error('connect(): cannot resolve %s: %s',
+          utils_net.format_epnt(self.endpoint), failure.value)
+        self._next_attempt()
+
+    def _next_attempt(self):
+        ''' Start the next attempt, if any '''
+        while self.addrinfo and not self.done:
+            ainfo = self.addrinfo.popleft()
+            sock = utils_net.connect_ainfo(ainfo)
+            if sock:
+                attempt = _Attempt(self, sock, ainfo)
+                self.attempts.append(attempt)
+                self.poller.set_writable(attempt)
+                if self.addrinfo:
+                    self.poller.sched(ATTEMPT_DELAY, self._attempt_timeout,
+                                      attempt)
+                return
+        if not self.attempts and not self.done:
+            self._finish()
+            logging.error('connect(): cannot connect to %s: %s',
+              utils_net.format_epnt(self.endpoint), 'all attempts failed')
+            self.on_failure()
+
+    def _attempt_timeout(self, attempt):
+        ''' Give the next address a chance, if attempt is slow '''
+        if not self.done and attempt in self.attempts:
+            logging.debug('connector: %s is slow, trying next address',
+                          attempt)
+            self._next_attempt()
+
+    def attempt_done(self, attempt, peername):
+        ''' Invoked when an attempt succeeds or fails '''
+        if self.done or attempt not in self.attempts:
+            return
+        self.attempts.remove(attempt)
+        if not peername:
+            attempt.sock.close()
+            self._next_attempt()
+            return
+        self._finish()
+        logging.debug('connector: connected to %s using %s', peername,
+                      FAMILIES.get(attempt.ainfo[0], attempt.ainfo[0]))
+        self.on_success(attempt.sock, attempt.ainfo,
+                        utils.ticks() - attempt.timestamp)
+
+    def _finish(self):
+        ''' Stop racing and close the pending attempts '''
+        self.done = True
+        for attempt in self.attempts:
+            self.poller.unset_writable(attempt)
+            attempt.sock.close()
+        self.attempts = []
+        self.addrinfo.clear()
+
+class Connector(object):
+
+    ''' Socket connector '''
 
+    def __init__(self, parent, endpoint, prefer_ipv6, sslconfig, extra):
         self.epnts = collections.deque()
         self.parent = parent
         self.prefer_ipv6 = prefer_ipv6
         self.sslconfig = sslconfig
         self.extra = extra
         self.sock = None
-        self.timestamp = 0
+        self.family = None
+        self.connect_time = None
+        self.race = None
         self.watchdog = 10
 
         self.aterror = Deferred()
@@ -75,9 +209,7 @@ class Connector(Pollable):
 
     def _connection_failed(self):
         ''' Failed to connect first available epnt '''
-        if self.sock:
-            POLLER.unset_writable(self)
-            self.sock = None  # MUST be below unset_writable()
+        self.race = None
         if not self.epnts:
             self.aterror.callback_each_np(self)
             return
@@ -85,36 +217,29 @@ class Connector(Pollable):
 
     def _connect(self):
         ''' Connect first available epnt '''
-        sock = utils_net.connect(self.epnts.popleft(), self.prefer_ipv6)
-        if sock:
-            self.sock = sock
-            self.timestamp = utils.ticks()
-            POLLER.set_writable(self)
-        else:
-            self._connection_failed()
-
-    def fileno(self):
-        return self.sock.fileno()
-
-    def handle_write(self):
-        POLLER.unset_writable(self)
-        if not utils_net.isconnected(self.endpoint, self.sock):
-            self._connection_failed()
-            return
+        self.race = ConnectRace(POLLER, self.epnts.popleft(),
+                                self.prefer_ipv6, self._connection_made,
+                                self._connection_failed, self.watchdog)
+        self.race.start()
+
+    def _connection_made(self, sock, ainfo, connect_time):
+        ''' Invoked when the race has a winner '''
+        self.race = None
+        self.sock = sock
+        self.family = FAMILIES.get(ainfo[0], str(ainfo[0]))
+        self.connect_time = connect_time
         deferred = Deferred()
         deferred.add_callback(self._handle_connect)
         deferred.add_errback(self._handle_connect_error)
-        deferred.callback(utils.ticks())
+        deferred.callback(connect_time)
 
-    def _handle_connect(self, ticks):
+    def _handle_connect(self, connect_time):
         ''' Internally handle connect '''
-        self.parent.handle_connect(self, self.sock, (ticks - self.timestamp),
+        self.parent.handle_connect(self, self.sock, connect_time,
           self.sslconfig, self.extra)
 
     def _handle_connect_error(self, error):
         ''' Internally handle connect error '''
         logging.warning('connector: connect() error: %s', str(error))
-        self._connection_failed()
-
-    def handle_close(self):
+        self.sock = None
         self._connection_failed()
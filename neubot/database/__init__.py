@@ -32,6 +32,7 @@ from neubot.database import table_log
 from neubot.database import table_speedtest
 from neubot.database import table_bittorrent
 from neubot.database import table_raw
+from neubot.database import table_rollup
 from neubot.database import migrate
 from neubot.database import migrate2
 
@@ -83,6 +84,15 @@ class DatabaseManager(object):
                 self.readonly = True
                 return self.dbc
 
+            #
+            # Short-lived commands (e.g. `neubot privacy`) open the
+            # database each time, so skip migrations and creation if
+            # the schema did not change since the last full check.
+            #
+            if table_config.is_up_to_date(self.dbc):
+                logging.debug("* Database: schema is up to date")
+                return self.dbc
+
             #
             # Migrate MUST be before table creation.  This
             # is safe because table creation always uses
@@ -102,6 +112,9 @@ class DatabaseManager(object):
             table_bittorrent.create(self.dbc)
             table_log.create(self.dbc)
             table_raw.create(self.dbc)
+            table_rollup.create(self.dbc)
+
+            table_config.save_fingerprint(self.dbc)
 
         return self.dbc
 
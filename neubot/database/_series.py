@@ -0,0 +1,139 @@
+# neubot/database/_series.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Compact binary encoding of the time series collected by tests,
+ e.g. the goodput snapshots of the raw test.  A series that is a
+ list of numbers, a list of equal-length lists of numbers, or a list
+ of dictionaries with the same keys and numeric values is stored
+ column by column, using 64-bit integers or doubles, which preserves
+ the type of each value.  Other series, including the ones with a
+ column that mixes integers and floats, are stored as JSON.  In both
+ cases the result is compressed with zlib.
+'''
+
+import struct
+import zlib
+
+from neubot.compat import json
+
+def _is_number(value):
+    ''' Returns True if value is an int, long or float (not bool) '''
+    return (isinstance(value, (int, long, float)) and
+            not isinstance(value, bool))
+
+def _split(vector):
+    ''' Returns (shape, keys, rows) or None if vector is not tabular '''
+
+    if not vector:
+        return None
+
+    first = vector[0]
+    if _is_number(first):
+        return "scalar", None, [(value,) for value in vector]
+
+    if isinstance(first, (list, tuple)):
+        width = len(first)
+        for row in vector:
+            if not isinstance(row, (list, tuple)) or len(row) != width:
+                return None
+        return "tuple", None, vector
+
+    if isinstance(first, dict):
+        keys = sorted(first.keys())
+        rows = []
+        for row in vector:
+            if not isinstance(row, dict) or sorted(row.keys()) != keys:
+                return None
+            rows.append([row[key] for key in keys])
+        return "dict", keys, rows
+
+    return None
+
+def _column_type(column):
+    ''' Returns the struct type code for column or None '''
+    floats = 0
+    for value in column:
+        if not _is_number(value):
+            return None
+        if isinstance(value, float):
+            floats += 1
+        elif value < -(1 << 63) or value >= (1 << 63):
+            return None
+    if not floats:
+        return "q"
+    if floats == len(column):
+        return "d"
+    # Mixed integers and floats: the column would not round-trip
+    return None
+
+def encode(vector):
+    ''' Encode a series into a compressed string '''
+
+    split = _split(vector)
+    if split:
+        shape, keys, rows = split
+        columns = zip(*rows)
+        types = [_column_type(column) for column in columns]
+        if columns and None not in types:
+            header = {
+                      "shape": shape,
+                      "keys": keys,
+                      "types": "".join(types),
+                      "length": len(rows),
+                     }
+            body = [json.dumps(header), "\n"]
+            for code, column in zip(types, columns):
+                body.append(struct.pack("<%d%s" % (len(column), code),
+                                        *column))
+            return zlib.compress("".join(body))
+
+    header = {"shape": "json"}
+    return zlib.compress("".join([json.dumps(header), "\n",
+                                  json.dumps(vector)]))
+
+def decode(octets):
+    ''' Decode a series encoded by encode() '''
+
+    octets = zlib.decompress(str(octets))
+    index = octets.index("\n")
+    header = json.loads(octets[:index])
+    octets = octets[index + 1:]
+
+    if header["shape"] == "json":
+        return json.loads(octets)
+
+    length, offset, columns = header["length"], 0, []
+    for code in header["types"]:
+        size = struct.calcsize("<%d%s" % (length, code))
+        columns.append(struct.unpack("<%d%s" % (length, code),
+                                     octets[offset:offset + size]))
+        offset += size
+    rows = zip(*columns)
+
+    if header["shape"] == "scalar":
+        return [row[0] for row in rows]
+    if header["shape"] == "tuple":
+        return [list(row) for row in rows]
+    if header["shape"] == "dict":
+        return [dict(zip(header["keys"], row)) for row in rows]
+    raise ValueError("_series: invalid shape")
@@ -28,10 +28,12 @@
  types, i.e. integer, string and float.
 '''
 
+import logging
 import re
 import types
 
 from neubot.simplejson.ordered_dict import OrderedDict
+from neubot.state import STATE
 
 from neubot import utils
 
@@ -136,7 +138,7 @@ def do_insert_into(connection, query, dictobj, template,
      error in sqlite3.  If @override timestamp is True, the
      function will also override @dictobj timestamp.  If
      @commit is True, the function will also commit to
-     @database.
+     @database.  Returns the id of the new row.
     '''
 
     for key in template.keys():
@@ -147,11 +149,44 @@ def do_insert_into(connection, query, dictobj, template,
     if override_timestamp:
         dictobj['timestamp'] = utils.timestamp()
 
-    connection.execute(query, dictobj)
+    rowid = connection.execute(query, dictobj).lastrowid
 
     if commit:
         connection.commit()
 
+    return rowid
+
+def make_create_index(table, column):
+
+    '''
+     Given the table name and a column name, this function returns
+     the query to create an index on that column.  Each table module
+     lists the columns to be indexed in its INDEXES tuple.
+    '''
+
+    table = __check(table)
+    column = __check(column)
+    return "CREATE INDEX IF NOT EXISTS %s_%s_idx ON %s (%s);" % (
+            table, column, table, column)
+
+def make_create_indexes(table, indexes):
+
+    '''
+     Given the table name and a sequence of column names, this
+     function returns the list of queries to create the indexes.
+    '''
+
+    return [make_create_index(table, column) for column in indexes]
+
+#
+# The query built by make_select() depends only on the table, on
+# the template and on the shape of the filter (i.e. whether since
+# and until are set, and whether we sort), so we build it once.
+# Returning always the same string also allows the sqlite3 module
+# to reuse the statement it has compiled the first time.
+#
+SELECT_CACHE = {}
+
 def make_select(table, template, **kwargs):
 
     '''
@@ -160,10 +195,33 @@ def make_select(table, template, **kwargs):
      a query to walk the specified table.
     '''
 
+    since, until = -1, -1
+    if "since" in kwargs:
+        since = int(__check(kwargs["since"]))
+    if "until" in kwargs:
+        until = int(__check(kwargs["until"]))
+    desc = bool(kwargs.get("desc", False))
+    with_id = bool(kwargs.get("with_id", False))
+
+    key = (table, tuple(template.keys()), since >= 0, until >= 0, desc,
+           with_id)
+    query = SELECT_CACHE.get(key)
+    if query is None:
+        query = _make_select(table, template, since >= 0, until >= 0, desc,
+                             with_id)
+        SELECT_CACHE[key] = query
+    return query
+
+def _make_select(table, template, has_since, has_until, desc, with_id):
+
+    ''' Builds the query returned by make_select() '''
+
     if not "timestamp" in template:
         raise ValueError("Template does not contain 'timestamp'")
 
     vector = [ "SELECT " ]
+    if with_id:
+        vector.append("id, ")
 
     for items in template.items():
         vector.append("%s" % __check(items[0]))
@@ -171,45 +229,21 @@ def make_select(table, template, **kwargs):
 
     vector[-1] = " FROM %s" % __check(table)
 
-    since, until = -1, -1
-    if "since" in kwargs:
-        since = int(__check(kwargs["since"]))
-    if "until" in kwargs:
-        until = int(__check(kwargs["until"]))
-
-    if since >= 0 or until >= 0:
+    if has_since or has_until:
         vector.append(" WHERE ")
-        if since >= 0:
+        if has_since:
             vector.append("timestamp >= :since")
-        if since >= 0 and until >= 0:
+        if has_since and has_until:
             vector.append(" AND ")
-        if until >= 0:
+        if has_until:
             vector.append("timestamp < :until")
 
-    if "desc" in kwargs and kwargs["desc"]:
+    if desc:
         vector.append(" ORDER BY timestamp DESC")
     vector.append(";")
     query = "".join(vector)
     return query
 
-def rename_column_query(table1, template1, table2, template2):
-
-    ''' Returns the query that copies from table1, described by
-        template1, to table2, described by template2 '''
-
-    query = ["INSERT INTO %s(" % __check(table2)]
-    for name in template2:
-        query.append(__check(name))
-        query.append(",")
-    query[-1] = ") SELECT "
-    for name in template1:
-        query.append(__check(name))
-        query.append(",")
-    query[-1] = " FROM %s;" % __check(table1)
-
-    query = "".join(query)
-    return query
-
 def rename_column_ntemplate(template, mapping, broken=False):
 
     ''' Creates new template for rename_column(), given the template
@@ -237,10 +271,12 @@ def rename_column_ntemplate(template, mapping, broken=False):
 
     return ntemplate
 
-def rename_column(connection, table, template, mapping, broken=False):
+def rename_column(connection, table, template, mapping, broken=False,
+                  progress=None):
 
     ''' General procedure to rename one or more columns in a table,
-        described by template, according to the specified mapping '''
+        described by template, according to the specified mapping.
+        If interrupted, it resumes from where it stopped. '''
 
     # See http://stackoverflow.com/questions/805363
 
@@ -249,7 +285,147 @@ def rename_column(connection, table, template, mapping, broken=False):
 
     ntemplate = rename_column_ntemplate(template, mapping, broken)
 
-    connection.execute("ALTER TABLE %s RENAME TO %s" % (table, otable))
-    connection.execute(make_create_table(table, ntemplate))
-    connection.execute(rename_column_query(otable, template, table, ntemplate))
+    if not table_exists(connection, otable):
+        # Already renamed during a previous (interrupted) run?
+        for name in mapping.values():
+            if not has_column(connection, table, name):
+                break
+        else:
+            return
+        connection.execute("ALTER TABLE %s RENAME TO %s" % (table, otable))
+        connection.execute(make_create_table(table, ntemplate))
+        connection.commit()
+
+    copy_rows(connection, otable, template, table, ntemplate, progress)
     connection.execute("DROP TABLE %s;" % otable)
+
+#
+# Migrations may process large archived databases, therefore
+# we stream rows in batches (ordered by id), we apply changes
+# using executemany() and we commit after each batch, saving
+# the id of the last processed row, so that an interrupted
+# migration does not need to start over.
+#
+
+# Number of rows processed per transaction
+BATCH_SIZE = 4096
+
+def table_exists(connection, table):
+    ''' Returns True if table exists '''
+    cursor = connection.execute('''SELECT COUNT(*) FROM sqlite_master
+      WHERE type='table' AND name=?;''', (table,))
+    return cursor.fetchone()[0] > 0
+
+def has_column(connection, table, column):
+    ''' Returns True if table has column '''
+    cursor = connection.execute("PRAGMA table_info(%s);" % __check(table))
+    return column in [row[1] for row in cursor]
+
+def report_progress(name):
+    ''' Returns a function that reports, through the log and STATE,
+        the progress of the migration of name '''
+    def report(done, total):
+        ''' Report that done rows out of total have been processed '''
+        logging.info("migrate: %s: %d/%d rows", name, done, total)
+        STATE.update("migrate", {"table": name, "done": done,
+                                 "total": total})
+    return report
+
+def get_checkpoint(connection, name):
+    ''' Returns the id of the last row processed by name or zero '''
+    connection.execute('''CREATE TABLE IF NOT EXISTS checkpoint (
+      name TEXT PRIMARY KEY, value INTEGER);''')
+    cursor = connection.execute('''SELECT value FROM checkpoint
+      WHERE name=?;''', (name,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row[0]
+
+def set_checkpoint(connection, name, value):
+    ''' Save the id of the last row processed by name '''
+    connection.execute('''INSERT OR REPLACE INTO checkpoint (name, value)
+      VALUES (?, ?);''', (name, value))
+
+def clear_checkpoint(connection, name):
+    ''' Forget the checkpoint of name '''
+    connection.execute("DELETE FROM checkpoint WHERE name=?;", (name,))
+
+def stream_rows(connection, table, columns, start=0, batch=BATCH_SIZE):
+
+    ''' Yields lists of at most batch rows of table, ordered by
+        id, starting after the row with id start.  Each row contains
+        the id followed by the specified columns. '''
+
+    query = "SELECT id, %s FROM %s WHERE id > ? ORDER BY id LIMIT ?;" % (
+              ", ".join(__check(name) for name in columns), __check(table))
+
+    while True:
+        rows = connection.execute(query, (start, batch)).fetchall()
+        if not rows:
+            break
+        yield rows
+        start = rows[-1][0]
+
+def count_rows(connection, table, start=0):
+    ''' Returns the number of rows of table after id start '''
+    cursor = connection.execute("SELECT COUNT(*) FROM %s WHERE id > ?;"
+                                % __check(table), (start,))
+    return cursor.fetchone()[0]
+
+def copy_rows(connection, table1, template1, table2, template2,
+              progress=None, batch=BATCH_SIZE):
+
+    ''' Copies the rows of table1, described by template1, into
+        table2, described by template2, keeping the same id.  The
+        columns are copied in order, i.e. the first column of
+        template1 goes into the first column of template2, and so
+        on.  The copy restarts after the last row of table2. '''
+
+    cursor = connection.execute("SELECT MAX(id) FROM %s;" % __check(table2))
+    start = cursor.fetchone()[0] or 0
+
+    query = "INSERT INTO %s (id, %s) VALUES (?%s);" % (__check(table2),
+              ", ".join(__check(name) for name in template2),
+              ", ?" * len(template2))
+
+    done, total = 0, count_rows(connection, table1, start)
+    for rows in stream_rows(connection, table1, template1.keys(), start,
+                            batch):
+        connection.executemany(query, (tuple(row) for row in rows))
+        connection.commit()
+        done += len(rows)
+        if progress:
+            progress(done, total)
+
+def update_rows(connection, table, columns, function, checkpoint,
+                progress=None, batch=BATCH_SIZE):
+
+    ''' Streams the rows of table and calls function for each row,
+        which returns either None or the new values of columns.  The
+        changes are applied with executemany(), and we commit after
+        each batch, saving the id of the last row in the checkpoint
+        table, under the name checkpoint.  Returns the number of rows
+        that have been changed. '''
+
+    query = "UPDATE %s SET %s WHERE id=?;" % (__check(table),
+              ", ".join("%s=?" % __check(name) for name in columns))
+
+    start = get_checkpoint(connection, checkpoint)
+    done, total, changed = 0, count_rows(connection, table, start), 0
+    for rows in stream_rows(connection, table, columns, start, batch):
+        operations = []
+        for row in rows:
+            values = function(row)
+            if values is not None:
+                operations.append(tuple(values) + (row[0],))
+        connection.executemany(query, operations)
+        set_checkpoint(connection, checkpoint, rows[-1][0])
+        connection.commit()
+        changed += len(operations)
+        done += len(rows)
+        if progress:
+            progress(done, total)
+
+    clear_checkpoint(connection, checkpoint)
+    return changed
@@ -25,6 +25,7 @@ import sys
 
 from neubot.database import DATABASE
 from neubot.database import table_config
+from neubot.database import table_rollup
 from neubot.database import table_speedtest
 
 from neubot import compat
@@ -72,12 +73,15 @@ def main(args):
             sys.exit('ERROR: readonly database')
 
         table_speedtest.prune(DATABASE.connection())
+        table_rollup.prune(DATABASE.connection())
 
     elif arguments[0] == "delete_all":
         if DATABASE.readonly:
             sys.exit('ERROR: readonly database')
 
         table_speedtest.prune(DATABASE.connection(), until=utils.timestamp())
+        table_rollup.prune(DATABASE.connection(), until=utils.timestamp(),
+                           keep_daily=False)
         DATABASE.connection().execute("VACUUM;")
 
     elif arguments[0] in ("show", "dump"):
@@ -59,8 +59,6 @@ def migrate_from__v4_1__to__v4_2(connection):
     ver = cursor.fetchone()[0]
     if ver == "4.1":
         logging.info("* Migrating database from version 4.1 to 4.2")
-        cursor.execute("""UPDATE config SET value='4.2'
-                        WHERE name='version';""")
 
         # Config
         cursor.execute("""UPDATE config SET name='privacy.can_publish'
@@ -82,7 +80,8 @@ def migrate_from__v4_1__to__v4_2(connection):
         #
         _table_utils.rename_column(connection, "bittorrent",
                                    template_bt, mapping,
-                                   broken=True)
+                                   broken=True, progress=
+                                   _table_utils.report_progress("bittorrent"))
 
         # Speedtest
         template_st = { "timestamp": 0, "uuid": "", "internal_address": "",
@@ -97,8 +96,17 @@ def migrate_from__v4_1__to__v4_2(connection):
         #
         _table_utils.rename_column(connection, "speedtest",
                                    template_st, mapping,
-                                   broken=True)
+                                   broken=True, progress=
+                                   _table_utils.report_progress("speedtest"))
+
+        #
+        # Bump the version number only now, so that we resume the
+        # renaming of columns if we are interrupted.
+        #
+        cursor.execute("""UPDATE config SET value='4.2'
+                        WHERE name='version';""")
 
+        connection.commit()
         connection.execute('VACUUM;')
         connection.commit()
     cursor.close()
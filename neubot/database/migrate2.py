@@ -34,6 +34,10 @@ if __name__ == '__main__':
     sys.path.insert(0, '.')
 
 from neubot.database import _table_utils
+from neubot.database import table_bittorrent
+from neubot.database import table_raw
+from neubot.database import table_rollup
+from neubot.database import table_speedtest
 
 # ===================
 # Migrate: 4.2 -> 4.3
@@ -333,14 +337,89 @@ class MigrateFrom42To43(object):
     #  \___/| .__/\___|_| \__,_|\__|_\___/_||_/__/
     #       |_|
     #
-    # Build the list of operations (swappings) that we will
-    # them perform later in a batch.
+    # Compute the new values of a row, if it needs to be fixed.
+    # The rows are streamed in batches by _table_utils.update_rows()
+    # which applies the fixes using executemany().
     #
 
-    def build_operations(self, connection, table, operations):
-        ''' Build operations for table '''
-
-        good, fixed, nonfixed = 0, 0, 0
+    def fix_row(self, row, swappings, has_latency, counters):
+        ''' Returns the fixed values of row (in the same order of
+            swappings) or None if row is good or cannot be fixed '''
+
+        # Was reordered?
+        if not self._seems_reordered(row):
+            counters[0] += 1
+            return None
+
+        new_row = {}
+        for left, right in swappings:
+            value = row[left]
+
+            #
+            # Since we are pulling values from rows having the WRONG
+            # type, we must cast them back to the EXPECTED type.
+            # If we are unable to convert the type back to the type
+            # we would have expected, we have made an error and we
+            # should have not reordered the row, so undo.
+            #
+            try:
+                if value is not None:
+                    if right in self.integers:
+                        value = int(value)
+                    elif right in self.floats:
+                        value = float(value)
+                    else:
+                        value = str(value)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                counters[2] += 1
+                return None
+
+            new_row[right] = value
+
+        # The checks below may modify new_row
+        values = [new_row[left] for left, _ in swappings]
+
+        # Does it looks good now?
+        if not self._looks_good(new_row, has_latency):
+
+            #
+            # I've seen this in the wild, in the period between
+            # Neubot 0.4.5 and 0.4.6-rc2:
+            #
+            if new_row['privacy_can_publish'] is None:
+                new_row['privacy_can_publish'] = 0
+
+                if not self._looks_good(new_row, has_latency):
+                    # This time really give up
+                    counters[2] += 1
+                    return None
+
+            #
+            # Very old Neubot versions have either None or ''
+            # unique identifier, try to cope with those as well,
+            # but be careful to keep original values.
+            # NB: the intersection between this new case and
+            # the above one SHOULD be empty.
+            #
+            elif new_row['uuid'] in (None, ''):
+                new_row['uuid'] = '71d22636-a584-441e-99ea-32c11ce073ef'
+
+                if not self._looks_good(new_row, has_latency):
+                    # This time really give up
+                    counters[2] += 1
+                    return None
+
+            else:
+                counters[2] += 1
+                return None
+
+        counters[1] += 1
+        return values
+
+    def fix_table(self, connection, table):
+        ''' Fix the rows of table, returns (good, fixed, nonfixed) '''
 
         if table == 'speedtest':
             has_latency = True
@@ -351,100 +430,13 @@ class MigrateFrom42To43(object):
         else:
             raise RuntimeError('migrate2: %s: invalid table name' % table)
 
-        cursor = connection.cursor()
-        cursor.execute('SELECT * FROM %s;' % table)
-        for row in cursor:
-
-            # Avoid consuming too much memory
-            if len(operations) >= 4096:
-                ncursor = connection.cursor()
-                for operation in operations:
-                    ncursor.execute(operation[0], operation[1])
-                ncursor.close()
-                del ncursor, operations[:]
-
-            # Was reordered?
-            if not self._seems_reordered(row):
-                good = good + 1
-                continue
-
-            new_operations = []
-            new_row = {}
-            for left, right in swappings:
-                value = row[left]
-
-                #
-                # Since we are pulling values from rows having the WRONG
-                # type, we must cast them back to the EXPECTED type.
-                # If we are unable to convert the type back to the type
-                # we would have expected, we have made an error and we
-                # should have not reordered the row, so undo.
-                #
-                try:
-                    if value is not None:
-                        if right in self.integers:
-                            value = int(value)
-                        elif right in self.floats:
-                            value = float(value)
-                        else:
-                            value = str(value)
-                except (KeyboardInterrupt, SystemExit):
-                    raise
-                except:
-                    nonfixed = nonfixed + 1
-                    continue
-
-                new_row[right] = value
-
-                #
-                # Prepare query
-                # We safely print into the query string because `right`
-                # comes from the swappings.
-                #
-                query = 'UPDATE %s SET %s=? WHERE id=?;' % (table, right)
-                new_operations.append(( query, (value, row['id']) ))
-
-            # Does it looks good now?
-            if not self._looks_good(new_row, has_latency):
-
-                #
-                # I've seen this in the wild, in the period between
-                # Neubot 0.4.5 and 0.4.6-rc2:
-                #
-                if new_row['privacy_can_publish'] is None:
-                    new_row['privacy_can_publish'] = 0
-
-                    if not self._looks_good(new_row, has_latency):
-                        # This time really give up
-                        nonfixed = nonfixed + 1
-                        continue
-
-                #
-                # Very old Neubot versions have either None or ''
-                # unique identifier, try to cope with those as well,
-                # but be careful to keep original values.
-                # NB: the intersection between this new case and
-                # the above one SHOULD be empty.
-                #
-                elif new_row['uuid'] in (None, ''):
-                    saved_uuid = new_row['uuid']
-                    new_row['uuid'] = '71d22636-a584-441e-99ea-32c11ce073ef'
-
-                    if not self._looks_good(new_row, has_latency):
-                        # This time really give up
-                        nonfixed = nonfixed + 1
-                        continue
-
-                    new_row['uuid'] = saved_uuid
-
-                else:
-                    nonfixed = nonfixed + 1
-                    continue
-
-            operations.extend(new_operations)
-            fixed = fixed + 1
-
-        return good, fixed, nonfixed
+        # Note: the rows processed before an interruption are not counted
+        counters = [0, 0, 0]
+        _table_utils.update_rows(connection, table,
+          [left for left, _ in swappings],
+          lambda row: self.fix_row(row, swappings, has_latency, counters),
+          'migrate2.%s' % table, _table_utils.report_progress(table))
+        return tuple(counters)
 
     @classmethod
     def migrate(cls, connection):
@@ -454,19 +446,12 @@ class MigrateFrom42To43(object):
             logging.info('migrate2: fix reordering column bug of v4.2')
 
             instance = cls()
-            operations = []
-
             for tbl in ('bittorrent', 'speedtest'):
-                logging.info('migrate2: build operations for %s...', tbl)
-                result = instance.build_operations(connection, tbl, operations)
-                logging.info('migrate2: built operations for %s: %s',
+                logging.info('migrate2: fix rows of %s...', tbl)
+                result = instance.fix_table(connection, tbl)
+                logging.info('migrate2: fixed rows of %s: %s',
                              tbl, str(result))
 
-            cursor = connection.cursor()
-            for operation in operations:
-                cursor.execute(operation[0], operation[1])
-            cursor.close()
-
         except (KeyboardInterrupt, SystemExit):
             raise
         except:
@@ -521,6 +506,66 @@ def migrate_from_4_4_to_4_5(connection):
     logging.info('migrate2: from schema version 4.4 to 4.5... complete')
 
 
+# ===================
+# Migrate: 4.5 -> 4.6
+# ===================
+
+def migrate_from_4_5_to_4_6(connection):
+    ''' Migrate: 4.5 -> 4.6 '''
+    logging.info('migrate2: from schema version 4.5 to 4.6... in progress')
+    for table in ('speedtest', 'bittorrent', 'raw', 'log'):
+        # Old databases may not have the log table yet
+        if _table_utils.table_exists(connection, table):
+            connection.execute(_table_utils.make_create_index(table,
+                                                              'timestamp'))
+    connection.execute('''UPDATE config SET value='4.6'
+                              WHERE name='version';''')
+    connection.commit()
+    logging.info('migrate2: from schema version 4.5 to 4.6... complete')
+
+
+# ===================
+# Migrate: 4.6 -> 4.7
+# ===================
+
+def migrate_from_4_6_to_4_7(connection):
+    ''' Migrate: 4.6 -> 4.7 '''
+    logging.info('migrate2: from schema version 4.6 to 4.7... in progress')
+    table_rollup.create(connection, commit=False)
+    for table, template in (('speedtest', table_speedtest.TEMPLATE),
+                            ('bittorrent', table_bittorrent.TEMPLATE),
+                            ('raw', table_raw.TEMPLATE)):
+        logging.info('migrate2: building rollups for %s...', table)
+        table_rollup.rebuild(connection, table, template, commit=False)
+    connection.execute('''UPDATE config SET value='4.7'
+                              WHERE name='version';''')
+    connection.commit()
+    logging.info('migrate2: from schema version 4.6 to 4.7... complete')
+
+
+# ===================
+# Migrate: 4.7 -> 4.8
+# ===================
+
+def migrate_from_4_7_to_4_8(connection):
+    ''' Migrate: 4.7 -> 4.8 '''
+    logging.info('migrate2: from schema version 4.7 to 4.8... in progress')
+    # The columns may already exist if a previous run was interrupted
+    if not _table_utils.has_column(connection, 'raw', 'al_capacity'):
+        connection.execute("ALTER TABLE raw ADD al_capacity REAL;")
+    if not _table_utils.has_column(connection, 'raw', 'al_mss'):
+        connection.execute("ALTER TABLE raw ADD al_mss INTEGER;")
+    connection.execute(table_raw.CREATE_SERIES)
+    connection.execute(table_raw.CREATE_SERIES_INDEX)
+    table_raw.split_series(connection, _table_utils.report_progress('raw'))
+    connection.execute('''UPDATE config SET value='4.8'
+                              WHERE name='version';''')
+    connection.commit()
+    # Give back to the filesystem the space freed by the series
+    connection.execute('VACUUM;')
+    logging.info('migrate2: from schema version 4.7 to 4.8... complete')
+
+
 # ====
 # Main
 # ====
@@ -529,6 +574,9 @@ MIGRATORS = {
     '4.2': MigrateFrom42To43.migrate,
     '4.3': migrate_from_4_3_to_4_4,
     '4.4': migrate_from_4_4_to_4_5,
+    '4.5': migrate_from_4_5_to_4_6,
+    '4.6': migrate_from_4_6_to_4_7,
+    '4.7': migrate_from_4_7_to_4_8,
 }
 
 def migrate(connection):
@@ -48,11 +48,15 @@
  </on uuid and privacy>
 '''
 
+import hashlib
+import sqlite3
+
 from neubot.utils import get_uuid
 from neubot import compat
+from neubot import utils_version
 
 # The regress test requires this variable
-SCHEMA_VERSION = '4.5'
+SCHEMA_VERSION = '4.8'
 
 def create(connection, commit=True):
     ''' Creates table_config if it does not exist '''
@@ -65,6 +69,41 @@ def create(connection, commit=True):
     if commit:
         connection.commit()
 
+def fingerprint(connection):
+
+    ''' Returns the fingerprint of the database schema, which
+        depends on the SQL of all tables and indexes, on the schema
+        version and on the version of Neubot, so that upgrading
+        Neubot always triggers a complete check. '''
+
+    digest = hashlib.md5()
+    cursor = connection.cursor()
+    cursor.execute('''SELECT type, name, sql FROM sqlite_master
+      ORDER BY type, name;''')
+    for row in cursor:
+        digest.update(repr(tuple(row)))
+    cursor.close()
+    return "%s:%s:%s" % (SCHEMA_VERSION, utils_version.NUMERIC_VERSION,
+                         digest.hexdigest())
+
+def save_fingerprint(connection, commit=True):
+    ''' Saves the fingerprint of the current schema '''
+    update(connection, [("schema_fingerprint", fingerprint(connection))],
+           commit)
+
+def is_up_to_date(connection):
+    ''' Returns True if the schema fingerprint saved after the last
+        complete check still matches the database schema '''
+    try:
+        cursor = connection.cursor()
+        cursor.execute('''SELECT value FROM config
+          WHERE name='schema_fingerprint';''')
+        row = cursor.fetchone()
+        cursor.close()
+    except sqlite3.OperationalError:
+        return False
+    return bool(row) and row[0] == fingerprint(connection)
+
 def update(connection, iterator, commit=True, clear=False):
     ''' Updates table config with iterator '''
     if clear:
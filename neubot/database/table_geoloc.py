@@ -20,6 +20,12 @@
 # along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+#
+# Number of times insert_server() has modified the table, so that
+# who keeps a copy of the table in memory knows when to reload it.
+#
+GENERATION = [0]
+
 def create(connection, commit=True):
     connection.execute("""CREATE TABLE IF NOT EXISTS geoloc(
       id INTEGER PRIMARY KEY, country TEXT, address TEXT);""")
@@ -31,6 +37,7 @@ def insert_server(connection, country, address, commit=True):
       null, ?, ?);""", (country, address))
     if commit:
         connection.commit()
+    GENERATION[0] += 1
 
 def lookup_servers(connection, country):
     cursor = connection.cursor()
@@ -38,3 +45,12 @@ def lookup_servers(connection, country):
     vector = map(lambda result: result[0], cursor)
     cursor.close()
     return vector
+
+def lookup_all(connection):
+    table = {}
+    cursor = connection.cursor()
+    cursor.execute("SELECT country, address FROM geoloc;")
+    for country, address in cursor:
+        table.setdefault(country, []).append(address)
+    cursor.close()
+    return table
@@ -32,8 +32,14 @@ TEMPLATE = {
 CREATE_TABLE = _table_utils.make_create_table("log", TEMPLATE)
 INSERT_INTO = _table_utils.make_insert_into("log", TEMPLATE)
 
+# walk() and prune() select by timestamp
+INDEXES = ("timestamp",)
+CREATE_INDEXES = _table_utils.make_create_indexes("log", INDEXES)
+
 def create(connection, commit=True):
     connection.execute(CREATE_TABLE)
+    for query in CREATE_INDEXES:
+        connection.execute(query)
     if commit:
         connection.commit()
 
@@ -25,14 +25,18 @@
 #
 
 '''
- Algorithms to create and manage the SQL table required
+ Algorithms to create and manage the SQL tables required
  by the RAW test.
 '''
 
 # Adapted from neubot/database/table_bittorrent.py
 
+import sqlite3
+
 from neubot.compat import json
+from neubot.database import _series
 from neubot.database import _table_utils
+from neubot.database import table_rollup
 
 from neubot import utils
 
@@ -56,14 +60,42 @@ TEMPLATE = {
     "connect_time": 0.0,
     "latency": 0.0,
     "download_speed": 0.0,
+    "al_capacity": 0.0,
+    "al_mss": 0,
 
     "neubot_version": "",
     "platform": "",
     "json_data": "",
 }
 
-def __json_to_mapped_row(result):
+#
+# The result contains large time series, e.g. the goodput snapshots and the
+# likely retransmissions, which are not needed to plot the results.  So we keep
+# in json_data only the scalar part of the result and we move each series into
+# the raw_series table, using a compact binary encoding.  The series are decoded
+# only when someone asks for the complete result.
+#
+CREATE_SERIES = """CREATE TABLE IF NOT EXISTS raw_series (id INTEGER PRIMARY KEY,
+  raw_id INTEGER, name TEXT, data BLOB);"""
+CREATE_SERIES_INDEX = _table_utils.make_create_index('raw_series', 'raw_id')
+INSERT_SERIES = """INSERT INTO raw_series (raw_id, name, data)
+  VALUES (?, ?, ?);"""
+
+def _split_result(result):
+    ''' Split result into summary and list of (name, series) '''
+    summary, series = {}, []
+    for side in ('client', 'server'):
+        summary[side] = {}
+        for key, value in result.get(side, {}).items():
+            if isinstance(value, list):
+                series.append(('%s.%s' % (side, key), value))
+            else:
+                summary[side][key] = value
+    return summary, series
+
+def json_to_mapped_row(result):
     ''' Fill mapped row with result dictionary '''
+    summary = _split_result(result)[0]
     return {
             'timestamp': result['server']['goodput']['ticks'],
             'uuid': result['client']['uuid'],
@@ -76,40 +108,107 @@ def __json_to_mapped_row(result):
             'latency': result['client']['alrtt_avg'],
             'download_speed': (result['client']['goodput']['bytesdiff'] /
                                result['client']['goodput']['timediff']),
-            'json_data': json.dumps(result),
+            'al_capacity': result['client'].get('al_capacity'),
+            'al_mss': result['client'].get('al_mss'),
+            'json_data': json.dumps(summary),
            }
 
 CREATE_TABLE = _table_utils.make_create_table('raw', TEMPLATE)
 INSERT_INTO = _table_utils.make_insert_into('raw', TEMPLATE)
 
+INDEXES = ('timestamp',)
+CREATE_INDEXES = _table_utils.make_create_indexes('raw', INDEXES)
+
 def create(connection, commit=True):
-    ''' Create the RAW table '''
+    ''' Create the RAW tables '''
     connection.execute(CREATE_TABLE)
+    for query in CREATE_INDEXES:
+        connection.execute(query)
+    connection.execute(CREATE_SERIES)
+    connection.execute(CREATE_SERIES_INDEX)
     if commit:
         connection.commit()
 
+def encode_result(result):
+    ''' Returns the mapped row and the list of (name, encoded series)
+        of result, i.e. what insert() needs to write into the tables '''
+    series = [(name, _series.encode(vector)) for name, vector
+              in _split_result(result)[1]]
+    return json_to_mapped_row(result), series
+
+def insert_series(connection, raw_id, series):
+    ''' Insert the encoded series of the result with the given id '''
+    connection.executemany(INSERT_SERIES, ((raw_id, name,
+                           sqlite3.Binary(octets))
+                           for name, octets in series))
+
 def insert(connection, dictobj, commit=True, override_timestamp=True):
-    ''' Insert a result into RAW table '''
-    dictobj = __json_to_mapped_row(dictobj)
-    _table_utils.do_insert_into(connection, INSERT_INTO, dictobj, TEMPLATE,
-                                commit, override_timestamp)
+    ''' Insert a result into RAW tables '''
+    dictobj, series = encode_result(dictobj)
+    raw_id = _table_utils.do_insert_into(connection, INSERT_INTO, dictobj,
+                                         TEMPLATE, False, override_timestamp)
+    insert_series(connection, raw_id, series)
+    table_rollup.update(connection, 'raw', dictobj, commit)
+
+def load_series(connection, raw_id, result=None):
+    ''' Decode the series of the result with the given id and add
+        them to result, which is the summary stored in json_data '''
+    if result is None:
+        result = {}
+    cursor = connection.cursor()
+    cursor.execute('SELECT name, data FROM raw_series WHERE raw_id=?;',
+                   (raw_id,))
+    for name, data in cursor:
+        side, key = name.split('.', 1)
+        result.setdefault(side, {})[key] = _series.decode(data)
+    cursor.close()
+    return result
 
-def listify(connection, since=-1, until=-1):
-    ''' Converts to list the content of RAW table '''
+def listify(connection, since=-1, until=-1, series=False):
+    ''' Converts to list the content of RAW table.  If series is
+        True, json_data contains the complete result. '''
     vector = []
     cursor = connection.cursor()
     query = _table_utils.make_select('raw', TEMPLATE,
                                      since=since, until=until,
-                                     desc=True)
+                                     desc=True, with_id=series)
     cursor.execute(query, {"since": since, "until": until})
     for row in cursor:
-        vector.append(dict(row))
+        row = dict(row)
+        if series:
+            result = load_series(connection, row.pop('id'),
+                                 json.loads(row['json_data']))
+            row['json_data'] = json.dumps(result)
+        vector.append(row)
     return vector
 
+def _split_row(connection, row):
+    ''' Move the series of row, i.e. (id, al_capacity, al_mss, json_data),
+        to raw_series and return the new values of the columns '''
+    try:
+        result = json.loads(row[3])
+    except ValueError:
+        return None
+    if not isinstance(result, dict) or 'client' not in result:
+        return None
+    summary, series = _split_result(result)
+    insert_series(connection, row[0], [(name, _series.encode(vector))
+                                       for name, vector in series])
+    return (summary['client'].get('al_capacity'),
+            summary['client'].get('al_mss'), json.dumps(summary))
+
+def split_series(connection, progress=None):
+    ''' Move the series still stored in json_data to raw_series '''
+    _table_utils.update_rows(connection, 'raw', ('al_capacity', 'al_mss',
+      'json_data'), lambda row: _split_row(connection, row), 'table_raw.split',
+      progress)
+
 def prune(connection, until=None, commit=True):
-    ''' Removes old results from RAW table '''
+    ''' Removes old results from RAW tables '''
     if not until:
         until = utils.timestamp() - 365 * 24 * 60 * 60
+    connection.execute('''DELETE FROM raw_series WHERE raw_id IN
+      (SELECT id FROM raw WHERE timestamp < ?);''', (until,))
     connection.execute('DELETE FROM raw WHERE timestamp < ?;', (until,))
     if commit:
         connection.commit()
@@ -0,0 +1,315 @@
+# neubot/database/table_rollup.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Manage the rollup table, which contains per-hour and per-day
+ summaries of the speedtest, bittorrent and raw tables.  Each row
+ summarizes the tests run in a period from a given real address
+ and contains, for each field, the count, sum, min, max and a
+ quantile sketch of the values.  The table is updated each time
+ we insert a result, so it is possible to prune old results and
+ still keep the long-term history.
+'''
+
+import math
+
+from neubot.compat import json
+from neubot.database import _table_utils
+
+from neubot import aggregate
+from neubot import utils
+
+# Hour and day, in seconds
+PERIODS = (3600, 86400)
+
+TEMPLATE = {
+    "test": "",
+    "period": 0,
+    "timestamp": 0,
+    "real_address": "",
+    "count": 0,
+}
+
+# For each field we keep count, sum, min, max and sketch
+for _field in aggregate.FIELDS:
+    TEMPLATE[_field + "_count"] = 0
+    TEMPLATE[_field + "_sum"] = 0.0
+    TEMPLATE[_field + "_min"] = 0.0
+    TEMPLATE[_field + "_max"] = 0.0
+    TEMPLATE[_field + "_sketch"] = ""
+del _field
+
+CREATE_TABLE = _table_utils.make_create_table("rollup", TEMPLATE)
+CREATE_INDEX = """CREATE UNIQUE INDEX IF NOT EXISTS rollup_key_idx
+  ON rollup (test, period, timestamp, real_address);"""
+INSERT_INTO = _table_utils.make_insert_into("rollup", TEMPLATE).replace(
+                "INSERT INTO", "INSERT OR REPLACE INTO", 1)
+
+#
+# The sketch is a sparse histogram with logarithmic bins, i.e. the
+# value V > 0 falls in the bin ceil(log(V) / log(GAMMA)), so that the
+# relative error of quantiles is below (GAMMA - 1) / 2.  Values lower
+# than or equal to zero fall into the special bin "z".  Sketches of
+# different periods can be merged by summing the bins.
+#
+GAMMA = 1.02
+LOG_GAMMA = math.log(GAMMA)
+
+def sketch_add(sketch, value):
+    ''' Add value to sketch '''
+    if value <= 0:
+        key = "z"
+    else:
+        key = str(int(math.ceil(math.log(value) / LOG_GAMMA)))
+    sketch[key] = sketch.get(key, 0) + 1
+
+def sketch_merge(sketch, other):
+    ''' Merge other into sketch '''
+    for key, count in other.items():
+        sketch[key] = sketch.get(key, 0) + count
+
+def _sketch_value(key):
+    ''' Returns the representative value of a bin '''
+    if key == "z":
+        return 0.0
+    return 2 * GAMMA ** int(key) / (GAMMA + 1)
+
+def sketch_quantile(sketch, percent):
+    ''' Returns the approximate quantile of sketch '''
+    total = sum(sketch.values())
+    if not total:
+        return None
+    rank = percent * (total - 1)
+    values = sorted((_sketch_value(key), count)
+                    for key, count in sketch.items())
+    running = 0
+    for value, count in values:
+        running += count
+        if running > rank:
+            return value
+    return values[-1][0]
+
+def _new_record(test, period, timestamp, real_address):
+    ''' Create an empty record '''
+    record = {
+        "test": test,
+        "period": period,
+        "timestamp": timestamp,
+        "real_address": real_address,
+        "count": 0,
+    }
+    for field in aggregate.FIELDS:
+        record[field + "_count"] = 0
+        record[field + "_sum"] = 0.0
+        record[field + "_min"] = None
+        record[field + "_max"] = None
+        record[field + "_sketch"] = {}
+    return record
+
+def _load_record(row):
+    ''' Convert a database row into a record '''
+    record = dict(row)
+    del record["id"]
+    for field in aggregate.FIELDS:
+        sketch = record[field + "_sketch"]
+        if sketch:
+            record[field + "_sketch"] = json.loads(sketch)
+        else:
+            record[field + "_sketch"] = {}
+    return record
+
+def _save_record(record):
+    ''' Convert a record into a dictionary suitable for INSERT_INTO '''
+    dictobj = dict(record)
+    for field in aggregate.FIELDS:
+        dictobj[field + "_sketch"] = json.dumps(record[field + "_sketch"])
+    return dictobj
+
+def _add_result(record, result):
+    ''' Add a result to record '''
+    record["count"] += 1
+    for field in aggregate.FIELDS:
+        # Old rows may contain garbage, see migrate2.MigrateFrom42To43
+        try:
+            value = float(result.get(field))
+        except (TypeError, ValueError):
+            continue
+        record[field + "_count"] += 1
+        record[field + "_sum"] += value
+        if record[field + "_min"] is None or value < record[field + "_min"]:
+            record[field + "_min"] = value
+        if record[field + "_max"] is None or value > record[field + "_max"]:
+            record[field + "_max"] = value
+        sketch_add(record[field + "_sketch"], value)
+
+def _merge_records(record, other):
+    ''' Merge other into record '''
+    record["count"] += other["count"]
+    for field in aggregate.FIELDS:
+        if not other[field + "_count"]:
+            continue
+        record[field + "_count"] += other[field + "_count"]
+        record[field + "_sum"] += other[field + "_sum"]
+        for suffix, function in (("_min", min), ("_max", max)):
+            if record[field + suffix] is None:
+                record[field + suffix] = other[field + suffix]
+            else:
+                record[field + suffix] = function(record[field + suffix],
+                                                  other[field + suffix])
+        sketch_merge(record[field + "_sketch"], other[field + "_sketch"])
+
+def create(connection, commit=True):
+    ''' Create the rollup table '''
+    connection.execute(CREATE_TABLE)
+    connection.execute(CREATE_INDEX)
+    if commit:
+        connection.commit()
+
+def update(connection, test, result, commit=True):
+    ''' Update the rollup table with a result of test '''
+    cursor = connection.cursor()
+    real_address = result.get("real_address") or ""
+    for period in PERIODS:
+        timestamp = result["timestamp"] - result["timestamp"] % period
+        cursor.execute("""SELECT * FROM rollup WHERE test=? AND period=?
+          AND timestamp=? AND real_address=?;""", (test, period,
+          timestamp, real_address))
+        row = cursor.fetchone()
+        if row:
+            record = _load_record(row)
+        else:
+            record = _new_record(test, period, timestamp, real_address)
+        _add_result(record, result)
+        connection.execute(INSERT_INTO, _save_record(record))
+    cursor.close()
+    if commit:
+        connection.commit()
+
+def rebuild(connection, test, template, commit=True):
+    ''' Rebuild the rollups of test from the table named test, which
+        is described by template '''
+    fields = aggregate.select_fields(template)
+    query = "SELECT timestamp, real_address, %s FROM %s;" % (
+              ", ".join(fields), test)
+
+    records = {}
+    cursor = connection.cursor()
+    cursor.execute(query)
+    for row in cursor:
+        result = dict(zip(["timestamp", "real_address"] + fields, row))
+        if result["timestamp"] is None:
+            continue
+        real_address = result["real_address"] or ""
+        for period in PERIODS:
+            timestamp = result["timestamp"] - result["timestamp"] % period
+            key = (period, timestamp, real_address)
+            if key not in records:
+                records[key] = _new_record(test, period, timestamp,
+                                           real_address)
+            _add_result(records[key], result)
+    cursor.close()
+
+    connection.execute("DELETE FROM rollup WHERE test=?;", (test,))
+    connection.executemany(INSERT_INTO, (_save_record(record)
+                           for record in records.values()))
+    if commit:
+        connection.commit()
+
+def _compute(record, stat, field):
+    ''' Compute the stat of field on record '''
+    if not record[field + "_count"]:
+        return None
+    if stat == "mean":
+        return record[field + "_sum"] / record[field + "_count"]
+    if stat == "median":
+        return sketch_quantile(record[field + "_sketch"], 0.5)
+    if stat == "p90":
+        return sketch_quantile(record[field + "_sketch"], 0.9)
+    raise ValueError("table_rollup: invalid stat: %s" % stat)
+
+def listify(connection, test, bucket, stat, fields, group_by=None,
+            since=-1, until=-1):
+
+    '''
+     Like aggregate.aggregate() but uses the rollup table rather
+     than the results, so the running time depends on the number
+     of periods, and not on the number of tests.  Median and p90
+     are approximated using the sketches.
+    '''
+
+    if bucket not in aggregate.BUCKETS:
+        raise ValueError("table_rollup: invalid bucket: %s" % bucket)
+    if stat not in aggregate.STATS:
+        raise ValueError("table_rollup: invalid stat: %s" % stat)
+    if group_by and group_by not in aggregate.GROUP_BY:
+        raise ValueError("table_rollup: cannot group by: %s" % group_by)
+    period = aggregate.BUCKETS[bucket]
+
+    query = ["SELECT * FROM rollup WHERE test=:test AND period=:period"]
+    if since >= 0:
+        since -= since % period
+        query.append(" AND timestamp >= :since")
+    if until >= 0:
+        query.append(" AND timestamp < :until")
+    query.append(";")
+
+    records = {}
+    cursor = connection.cursor()
+    cursor.execute("".join(query), {"test": test, "period": period,
+                   "since": since, "until": until})
+    for row in cursor:
+        record = _load_record(row)
+        if not group_by:
+            record["real_address"] = ""
+        key = (record["timestamp"], record["real_address"])
+        if key in records:
+            _merge_records(records[key], record)
+        else:
+            records[key] = record
+    cursor.close()
+
+    vector = []
+    for record in records.values():
+        output = {
+            "timestamp": record["timestamp"],
+            "real_address": record["real_address"],
+            "count": record["count"],
+        }
+        for field in fields:
+            output[field] = _compute(record, stat, field)
+        vector.append(output)
+
+    vector.sort(key=lambda output: output["timestamp"], reverse=True)
+    return vector
+
+def prune(connection, until=None, keep_daily=True, commit=True):
+    ''' Removes old rollups, keeping daily ones unless told otherwise '''
+    if not until:
+        until = utils.timestamp() - 365 * 24 * 60 * 60
+    if keep_daily:
+        connection.execute("""DELETE FROM rollup WHERE timestamp < ?
+          AND period < 86400;""", (until,))
+    else:
+        connection.execute("DELETE FROM rollup WHERE timestamp < ?;",
+                           (until,))
+    if commit:
+        connection.commit()
@@ -27,6 +27,7 @@
 '''
 
 from neubot.database import _table_utils
+from neubot.database import table_rollup
 from neubot import utils
 
 TEMPLATE = {
@@ -55,16 +56,23 @@ TEMPLATE = {
 CREATE_TABLE = _table_utils.make_create_table("speedtest", TEMPLATE)
 INSERT_INTO = _table_utils.make_insert_into("speedtest", TEMPLATE)
 
+# listify() and prune() select by timestamp
+INDEXES = ("timestamp",)
+CREATE_INDEXES = _table_utils.make_create_indexes("speedtest", INDEXES)
+
 def create(connection, commit=True):
     ''' Create a new speedtest table '''
     connection.execute(CREATE_TABLE)
+    for query in CREATE_INDEXES:
+        connection.execute(query)
     if commit:
         connection.commit()
 
 def insert(connection, dictobj, commit=True, override_timestamp=True):
     ''' Insert a result dictionary into speedtest table '''
     _table_utils.do_insert_into(connection, INSERT_INTO, dictobj, TEMPLATE,
-                                commit, override_timestamp)
+                                False, override_timestamp)
+    table_rollup.update(connection, "speedtest", dictobj, commit)
 
 def listify(connection, since=-1, until=-1):
     ''' Converts the content of speedtest table into a list '''
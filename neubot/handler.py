@@ -25,6 +25,7 @@
 # Adapted from neubot/net/stream.py
 # Python3-ready: yes
 
+from neubot.config import CONFIG
 from neubot.connector import Connector
 from neubot.listener import Listener
 
@@ -38,7 +39,8 @@ class Handler(object):
 
     def listen(self, endpoint, prefer_ipv6, sslconfig, sslcert):
         ''' Listen() at endpoint '''
-        sockets = utils_net.listen(endpoint, prefer_ipv6)
+        sockets = utils_net.listen(endpoint, prefer_ipv6,
+                                   CONFIG['net.listen.backlog'])
         if not sockets:
             self.handle_listen_error(endpoint)
             return
@@ -22,8 +22,6 @@
 
 ''' HTTP server '''
 
-import StringIO
-import mimetypes
 import os.path
 import sys
 import time
@@ -35,7 +33,7 @@ if __name__ == "__main__":
 from neubot.config import CONFIG
 from neubot.http.stream import ERROR
 from neubot.http.message import Message
-from neubot.http.ssi import ssi_replace
+from neubot.http.static import STATIC_CACHE
 from neubot.http.stream import nextstate
 from neubot.http.stream import StreamHTTP
 from neubot.log import LOG
@@ -220,8 +218,10 @@ class ServerHTTP(StreamHandler):
             stream.send_response(request, response)
             return
 
+        mime = self.conf.get("http.server.mime", True)
+        ssi = self.conf.get("http.server.ssi", False)
         try:
-            filep = open(fullpath, "rb")
+            static = STATIC_CACHE.lookup(rootdir, fullpath, mime, ssi)
         except (IOError, OSError):
             logging.error("HTTP: Not Found: %s (WWWDIR: %s)",
                           fullpath, rootdir)
@@ -230,30 +230,7 @@ class ServerHTTP(StreamHandler):
             stream.send_response(request, response)
             return
 
-        if self.conf.get("http.server.mime", True):
-            mimetype, encoding = mimetypes.guess_type(fullpath)
-
-            # Do not attempt SSI if the resource is, say, gzipped
-            if not encoding:
-                if mimetype == "text/html":
-                    ssi = self.conf.get("http.server.ssi", False)
-                    if ssi:
-                        body = ssi_replace(rootdir, filep)
-                        filep = StringIO.StringIO(body)
-
-                #XXX Do we need to enforce the charset?
-                if mimetype in ("text/html", "application/x-javascript"):
-                    mimetype += "; charset=UTF-8"
-            else:
-                response["content-encoding"] = encoding
-
-        else:
-            mimetype = "text/plain"
-
-        response.compose(code="200", reason="Ok", body=filep,
-                         mimetype=mimetype)
-        if request.method == "HEAD":
-            utils.safe_seek(filep, 0, os.SEEK_END)
+        static.compose(request, response)
         stream.send_response(request, response)
 
     def got_request(self, stream, request):
@@ -40,8 +40,8 @@ import re
 MAXDEPTH = 8
 REGEX = '<!--#include virtual="([A-Za-z0-9./_-]+)"-->'
 
-def ssi_open(rootdir, path, mode):
-    ''' Wrapper for open() that makes security checks '''
+def ssi_path(rootdir, path):
+    ''' Map path to the filesystem making security checks '''
     rootdir = asciiify(rootdir)
     path = asciiify(path)
     path = os.sep.join([rootdir, path])
@@ -49,27 +49,35 @@ def ssi_open(rootdir, path, mode):
     path = asciiify(path)
     if not path.startswith(rootdir):
         raise ValueError("ssi: Path name below root directory")
-    return open(path, mode)
+    return path
+
+def ssi_open(rootdir, path, mode):
+    ''' Wrapper for open() that makes security checks '''
+    return open(ssi_path(rootdir, path), mode)
 
-def ssi_split(rootdir, document, page, count):
-    ''' Split the page and perform inclusion '''
+def ssi_split(rootdir, document, page, count, included=None):
+    ''' Split the page and perform inclusion.  If @included is
+        not None, append to it the path of each included file '''
     if count > MAXDEPTH:
         raise ValueError("ssi: Too many nested includes")
     include = False
     for chunk in re.split(REGEX, document):
         if include:
             include = False
-            filep = ssi_open(rootdir, chunk, "rb")
-            ssi_split(rootdir, filep.read(), page, count + 1)
+            path = ssi_path(rootdir, chunk)
+            if included is not None:
+                included.append(path)
+            filep = open(path, "rb")
+            ssi_split(rootdir, filep.read(), page, count + 1, included)
             filep.close()
         else:
             include = True
             page.append(chunk)
 
-def ssi_replace(rootdir, filep):
+def ssi_replace(rootdir, filep, included=None):
     ''' Replace with SSI the content of @filep '''
     page = []
-    ssi_split(rootdir, filep.read(), page, 0)
+    ssi_split(rootdir, filep.read(), page, 0, included)
     return "".join(page)
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+# neubot/http/static.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Cache of the static files served by ServerHTTP.  We keep in
+ memory the content of each file (after SSI expansion) together
+ with its gzipped variant and validators, and we check at each
+ request whether the file or any of the files it includes has
+ been modified, using stat().
+'''
+
+import StringIO
+import email.utils
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from neubot.http.ssi import ssi_replace
+
+from neubot import utils
+
+# Files larger than this are not kept in memory
+MAXSIZE = 1048576
+
+# Mimetypes that it makes sense to compress
+COMPRESSIBLE = (
+    "application/javascript",
+    "application/json",
+    "application/x-javascript",
+    "image/svg+xml",
+    "text/",
+)
+
+def _stamp(path):
+    ''' Returns (mtime, size) of path, or None if it does not exist '''
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return (info.st_mtime, info.st_size)
+
+def guess_mimetype(path, mime=True):
+    ''' Returns the (mimetype, encoding) tuple for path '''
+    if not mime:
+        return "text/plain", None
+    mimetype, encoding = mimetypes.guess_type(path)
+    if not encoding:
+        #XXX Do we need to enforce the charset?
+        if mimetype in ("text/html", "application/x-javascript"):
+            mimetype += "; charset=UTF-8"
+    return mimetype, encoding
+
+def accepts_gzip(value):
+    ''' Returns True if the Accept-Encoding value allows gzip '''
+    for token in value.split(","):
+        params = token.split(";")
+        if params[0].strip().lower() not in ("gzip", "x-gzip"):
+            continue
+        for param in params[1:]:
+            name, _, quality = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    return float(quality) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+def _gzip(octets):
+    ''' Compress octets using gzip '''
+    stringio = StringIO.StringIO()
+    filep = gzip.GzipFile(fileobj=stringio, mode="wb", mtime=0)
+    filep.write(octets)
+    filep.close()
+    return stringio.getvalue()
+
+def _compressible(mimetype, encoding):
+    ''' Returns True if it makes sense to compress the file '''
+    if encoding or not mimetype:
+        return False
+    for prefix in COMPRESSIBLE:
+        if mimetype.startswith(prefix):
+            return True
+    return False
+
+class StaticFile(object):
+
+    ''' A static file ready to be served '''
+
+    def __init__(self, path, deps, mimetype, encoding, body=None):
+        self.path = path
+        self.deps = deps
+        self.mimetype = mimetype
+        self.encoding = encoding
+        self.body = body
+        self.gzipped = None
+
+        mtime = max(stamp[0] for _, stamp in deps)
+        self.mtime = int(mtime)
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True)
+
+        if body is not None:
+            self.etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if _compressible(mimetype, encoding):
+                gzipped = _gzip(body)
+                if len(gzipped) < len(body):
+                    self.gzipped = gzipped
+        else:
+            self.etag = '"%x-%x"' % (self.mtime, deps[0][1][1])
+
+    def is_fresh(self):
+        ''' Returns True if no file we depend on has changed '''
+        for path, stamp in self.deps:
+            if _stamp(path) != stamp:
+                return False
+        return True
+
+    def _not_modified(self, request, etag):
+        ''' Returns True if the client copy is still valid '''
+        if request["if-none-match"]:
+            for value in request["if-none-match"].split(","):
+                value = value.strip()
+                if value.startswith("W/"):
+                    value = value[2:]
+                if value in (etag, "*"):
+                    return True
+            return False
+        if request["if-modified-since"]:
+            since = email.utils.parsedate_tz(request["if-modified-since"])
+            if since:
+                return self.mtime <= email.utils.mktime_tz(since)
+        return False
+
+    def compose(self, request, response):
+        ''' Compose the response to request (possibly a 304) '''
+
+        use_gzip = (self.gzipped is not None and
+                    accepts_gzip(request["accept-encoding"]))
+        etag = self.etag
+        if use_gzip:
+            etag = etag[:-1] + '-gzip"'
+
+        if self.gzipped is not None:
+            response["vary"] = "Accept-Encoding"
+        response["etag"] = etag
+        response["last-modified"] = self.last_modified
+
+        if self._not_modified(request, etag):
+            response.compose(code="304", reason="Not Modified")
+            del response["content-length"]
+            return
+
+        if use_gzip:
+            response["content-encoding"] = "gzip"
+            filep = StringIO.StringIO(self.gzipped)
+        else:
+            if self.encoding:
+                response["content-encoding"] = self.encoding
+            if self.body is not None:
+                filep = StringIO.StringIO(self.body)
+            else:
+                filep = open(self.path, "rb")
+
+        response.compose(code="200", reason="Ok", body=filep,
+                         mimetype=self.mimetype)
+        if request.method == "HEAD":
+            utils.safe_seek(filep, 0, os.SEEK_END)
+
+class StaticCache(object):
+
+    ''' Cache of static files '''
+
+    def __init__(self):
+        self._cache = {}
+
+    def lookup(self, rootdir, path, mime=True, ssi=False):
+        ''' Returns the StaticFile for path.  Raises IOError or OSError
+            if path cannot be opened. '''
+        key = (path, mime, ssi)
+        entry = self._cache.get(key)
+        if entry is not None and entry.is_fresh():
+            return entry
+        entry = self._load(rootdir, path, mime, ssi)
+        self._cache[key] = entry
+        return entry
+
+    @staticmethod
+    def _load(rootdir, path, mime, ssi):
+        ''' Load path from the filesystem '''
+
+        filep = open(path, "rb")
+        stamp = _stamp(path)
+        mimetype, encoding = guess_mimetype(path, mime)
+
+        # Do not attempt SSI if the resource is, say, gzipped
+        if (ssi and not encoding and mimetype and
+                mimetype.startswith("text/html")):
+            included = []
+            body = ssi_replace(rootdir, filep, included)
+            filep.close()
+            deps = [(path, stamp)]
+            for other in included:
+                deps.append((other, _stamp(other)))
+            return StaticFile(path, deps, mimetype, encoding, body)
+
+        if stamp[1] > MAXSIZE:
+            filep.close()
+            return StaticFile(path, [(path, stamp)], mimetype, encoding)
+
+        body = filep.read()
+        filep.close()
+        return StaticFile(path, [(path, stamp)], mimetype, encoding, body)
+
+    def clear(self):
+        ''' Forget all the cached files '''
+        self._cache.clear()
+
+STATIC_CACHE = StaticCache()
@@ -0,0 +1,201 @@
+# neubot/json_codec.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ JSON codec.  At import time we pick the fastest implementation that
+ is available and that passes a sanity check (e.g. it must not lose
+ precision when encoding floats), trying, in order, ujson, simplejson
+ with C speedups, the standard library json and the simplejson copy
+ that we ship.  The fast implementation is used by dumps() and loads()
+ when no options (or only default options) are passed; otherwise we
+ use the reference implementation, i.e. the standard library json or,
+ with Python 2.5, our copy of simplejson.  Import it as::
+
+   from neubot.compat import json
+'''
+
+import os
+import sys
+
+from neubot import six
+
+# Set NEUBOT_JSON to the name of a backend to force it
+BACKEND_VARIABLE = "NEUBOT_JSON"
+
+# Size of the chunks written by iterencode()
+CHUNK_SIZE = 65536
+
+def _import(name):
+    ''' Import a module, return None on failure '''
+    try:
+        __import__(name)
+    except ImportError:
+        return None
+    return sys.modules[name]
+
+def _reference():
+    ''' Returns the reference implementation '''
+    module = _import("json")
+    if module is None:
+        from neubot import simplejson as module
+    return module
+
+REFERENCE = _reference()
+
+def _ujson():
+    ''' ujson backend '''
+    module = _import("ujson")
+    if module is None:
+        return None
+    return module.dumps, module.loads
+
+def _simplejson():
+    ''' simplejson backend, only when the C speedups are available '''
+    module = _import("simplejson")
+    if module is None or _import("simplejson._speedups") is None:
+        return None
+    return module.dumps, module.loads
+
+def _stdlib():
+    ''' Standard library backend '''
+    module = _import("json")
+    if module is None:
+        return None
+    return module.dumps, module.loads
+
+def _vendored():
+    ''' Our copy of simplejson '''
+    from neubot import simplejson
+    return simplejson.dumps, simplejson.loads
+
+# From the fastest to the slowest
+BACKENDS = (
+    ("ujson", _ujson),
+    ("simplejson", _simplejson),
+    ("json", _stdlib),
+    ("neubot.simplejson", _vendored),
+)
+
+# Used to make sure that a backend behaves as we expect
+_SAMPLE = {
+    "float": 0.1 + 0.2,
+    "small": 1.5e-07,
+    "large": 1 << 40,
+    "text": six.u("caf\\u00e9"),
+    "escape": "\"/\\\n",
+    "vector": [None, True, False, {"key": []}, -1],
+}
+
+def _works(dumps, loads):
+    ''' Returns True if the dumps, loads pair round-trips our sample
+        and produces JSON that the reference implementation accepts '''
+    try:
+        return (loads(dumps(_SAMPLE)) == _SAMPLE and
+                REFERENCE.loads(dumps(_SAMPLE)) == _SAMPLE)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except:
+        return False
+
+def available():
+    ''' Returns the list of (name, dumps, loads) of the backends
+        that are available and working, fastest first '''
+    result = []
+    for name, factory in BACKENDS:
+        functions = factory()
+        if functions and _works(*functions):
+            result.append((name, functions[0], functions[1]))
+    return result
+
+def _select():
+    ''' Select the backend '''
+    forced = os.environ.get(BACKEND_VARIABLE)
+    for name, factory in BACKENDS:
+        if forced and name != forced:
+            continue
+        functions = factory()
+        if functions and _works(*functions):
+            return name, functions[0], functions[1]
+    return "reference", REFERENCE.dumps, REFERENCE.loads
+
+BACKEND, _DUMPS, _LOADS = _select()
+
+# Options that the fast backend may safely ignore
+_DEFAULTS = {
+    "indent": None,
+    "sort_keys": False,
+}
+
+def _is_default(kwargs):
+    ''' Returns True if all options have the default value '''
+    for key, value in kwargs.items():
+        if key not in _DEFAULTS or _DEFAULTS[key] != value:
+            return False
+    return True
+
+def dumps(obj, **kwargs):
+    ''' Serialize obj to a JSON string '''
+    if not kwargs or _is_default(kwargs):
+        return _DUMPS(obj)
+    return REFERENCE.dumps(obj, **kwargs)
+
+def loads(string, **kwargs):
+    ''' Deserialize a JSON string '''
+    if not kwargs:
+        return _LOADS(string)
+    return REFERENCE.loads(string, **kwargs)
+
+def iterencode(obj, filep, **kwargs):
+    ''' Serialize obj to filep incrementally, writing chunks of about
+        CHUNK_SIZE bytes rather than building the whole string '''
+    chunks, size = [], 0
+    for chunk in REFERENCE.JSONEncoder(**kwargs).iterencode(obj):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            filep.write("".join(chunks))
+            chunks, size = [], 0
+    if chunks:
+        filep.write("".join(chunks))
+
+def dump(obj, filep, **kwargs):
+    ''' Serialize obj to filep '''
+    iterencode(obj, filep, **kwargs)
+
+def load(filep, **kwargs):
+    ''' Deserialize the content of filep '''
+    return loads(filep.read(), **kwargs)
+
+def dumpb(obj, **kwargs):
+    ''' Serialize obj to UTF-8 encoded bytes '''
+    string = dumps(obj, **kwargs)
+    if isinstance(string, six.text_type):
+        string = string.encode("utf-8")
+    return string
+
+def loadb(octets, **kwargs):
+    ''' Deserialize UTF-8 encoded bytes (or bytearray, buffer, etc.) '''
+    if not isinstance(octets, six.binary_type):
+        octets = six.binary_type(octets)
+    if six.PY3:
+        octets = octets.decode("utf-8")
+    return loads(octets, **kwargs)
@@ -25,9 +25,112 @@
 # Adapted from neubot/net/stream.py
 # Python3-ready: yes
 
+import errno
+import logging
+import socket
+import sys
+
+from neubot.config import CONFIG
 from neubot.pollable import Pollable
 from neubot.poller import POLLER
 
+from neubot import utils
+
+# The accept queue is empty (or we were interrupted)
+SOFT_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+# The client went away before we accepted it
+ABORTED_ERRORS = (errno.ECONNABORTED, errno.EPROTO)
+
+# Weight of the most recent second in the accept rate
+RATE_ALPHA = 0.25
+
+CONFIG.register_defaults({
+    'net.listen.accept_budget': 64,
+    'net.listen.backlog': 128,
+    'net.listen.keepalive': 1,
+    'net.listen.nodelay': 0,
+})
+
+CONFIG.register_descriptions({
+    'net.listen.accept_budget': 'Max connections accepted per wakeup',
+    'net.listen.backlog': 'Length of the accept queue of listeners',
+    'net.listen.keepalive': 'Enable TCP keepalive on accepted sockets',
+    'net.listen.nodelay': 'Set TCP_NODELAY on accepted sockets',
+})
+
+class AcceptStats(object):
+
+    '''
+     Counters of the listeners.  We cannot portably read the length of
+     the accept queue, so we use the number of connections accepted
+     at each wakeup: when it reaches the budget, the queue was at least
+     that long.
+    '''
+
+    def __init__(self):
+        self.accepted = 0
+        self.errors = 0
+        self.wakeups = 0
+        self.exhausted = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.rate = 0.0
+        self.count = 0
+        self.since = utils.ticks()
+
+    def update(self, count, budget):
+        ''' Account for count connections accepted at a wakeup '''
+        self.accepted += count
+        self.wakeups += 1
+        if count >= budget:
+            self.exhausted += 1
+        self.depth = count
+        self.max_depth = max(self.max_depth, count)
+        self.count += count
+        now = utils.ticks()
+        elapsed = now - self.since
+        if elapsed >= 1.0:
+            self.rate = (RATE_ALPHA * self.count / elapsed +
+                         (1 - RATE_ALPHA) * self.rate)
+            self.count = 0
+            self.since = now
+
+    def snap(self, data):
+        ''' Take a snapshot of the counters '''
+        data['listener'] = {
+                            'accepted': self.accepted,
+                            'accept_rate': self.rate,
+                            'errors': self.errors,
+                            'wakeups': self.wakeups,
+                            'queue_depth': self.depth,
+                            'max_queue_depth': self.max_depth,
+                            'budget_exhausted': self.exhausted,
+                           }
+
+ACCEPT_STATS = AcceptStats()
+
+def accept(lsock):
+    ''' Accept a pending connection and set the options of the new
+        socket; returns None when there are no pending connections '''
+    while True:
+        try:
+            sock = lsock.accept()[0]
+        except socket.error:
+            exception = sys.exc_info()[1]
+            if exception.args[0] in SOFT_ERRORS:
+                return None
+            if exception.args[0] in ABORTED_ERRORS:
+                logging.debug('listener: client went away before accept')
+                continue
+            raise
+        sock.setblocking(False)
+        if CONFIG['net.listen.nodelay']:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if CONFIG['net.listen.keepalive']:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        return sock
+
 class Listener(Pollable):
 
     ''' Pollable socket listener '''
@@ -53,15 +156,29 @@ class Listener(Pollable):
         return self.lsock.fileno()
 
     def handle_read(self):
-        # Make sure we route exceptions properly
-        try:
-            sock = self.lsock.accept()[0]
-            sock.setblocking(False)
-            self.parent.handle_accept(self, sock, self.sslconfig, self.sslcert)
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except:
-            self.parent.handle_accept_error(self)
+        #
+        # Drain the accept queue, up to the budget, so that, when
+        # many clients connect at the same time, we don't pay the
+        # cost of a poller loop for each one of them.
+        #
+        budget = max(1, CONFIG['net.listen.accept_budget'])
+        count = 0
+        while count < budget:
+            # Make sure we route exceptions properly
+            try:
+                sock = accept(self.lsock)
+                if not sock:
+                    break
+                count += 1
+                self.parent.handle_accept(self, sock, self.sslconfig,
+                                          self.sslcert)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                ACCEPT_STATS.errors += 1
+                self.parent.handle_accept_error(self)
+                break
+        ACCEPT_STATS.update(count, budget)
 
     def handle_close(self):
         self.parent.handle_listen_close(self)
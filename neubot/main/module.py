@@ -28,6 +28,8 @@ MODULES = {
     "CA"                  : "net.CA",
     "agent"               : "agent",
     "api.client"          : "api.client",
+    "archive_index"       : "archive_index",
+    "archive_ingest"      : "archive_ingest",
     "database"            : "database.main",
     "bittorrent"          : "bittorrent",
     "http.client"         : "http.client",
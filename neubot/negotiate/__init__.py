@@ -33,6 +33,13 @@ CONFIG.register_defaults({
     'negotiate.parallelism': 7,
     'negotiate.min_thresh': 32,
     'negotiate.max_thresh': 64,
+    'negotiate.uplink': 0,
+    'negotiate.speedtest.weight': 1.0,
+    'negotiate.speedtest.cost': 1.0,
+    'negotiate.bittorrent.weight': 1.0,
+    'negotiate.bittorrent.cost': 1.0,
+    'negotiate.raw.weight': 1.0,
+    'negotiate.raw.cost': 2.0,
 })
 
 def run(poller, conf):
@@ -46,7 +53,14 @@ def run(poller, conf):
     HTTP_SERVER.register_child(NEGOTIATE_SERVER, '/collect/')
 
     CONFIG.register_descriptions({
-        'negotiate.parallelism': 'Number of parallel tests',
+        'negotiate.parallelism': 'Number of test slots',
         'negotiate.min_thresh': 'Minimum trehshold for RED',
         'negotiate.max_thresh': 'Maximum trehshold for RED',
+        'negotiate.uplink': 'Uplink capacity in bytes/s (0 means unknown)',
+        'negotiate.speedtest.weight': 'Share of test slots for speedtest',
+        'negotiate.speedtest.cost': 'Test slots used by a speedtest test',
+        'negotiate.bittorrent.weight': 'Share of test slots for bittorrent',
+        'negotiate.bittorrent.cost': 'Test slots used by a bittorrent test',
+        'negotiate.raw.weight': 'Share of test slots for raw',
+        'negotiate.raw.cost': 'Test slots used by a raw test',
     })
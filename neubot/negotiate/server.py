@@ -22,15 +22,22 @@
 
 ''' Negotiate server '''
 
-import collections
 import random
 import logging
 
-from neubot.config import CONFIG
 from neubot.http.message import Message
 from neubot.http.server import ServerHTTP
+from neubot.negotiate.server_load import ServerLoad
+from neubot.negotiate.server_sched import NegotiateScheduler
 from neubot.compat import json
 
+#
+# A stream waiting in queue is told its new position only when it is
+# unchoked or when its position has decreased at least by 1/UPDATE_RATIO,
+# so that a burst of disconnects does not cause a burst of responses.
+#
+UPDATE_RATIO = 4
+
 class NegotiateServerModule(object):
 
     ''' Each test should implement this interface '''
@@ -47,6 +54,13 @@ class NegotiateServerModule(object):
             header when the connecting client is pretty old '''
         return self.collect(stream, request_body)
 
+    # Speedtest and bittorrent report download and upload speed
+    def goodput(self, request_body):
+        ''' Returns the goodput, in bytes per second, measured by the
+            test whose results are in request_body '''
+        return max(float(request_body.get('download_speed', 0)),
+                   float(request_body.get('upload_speed', 0)))
+
     # The minimal unchoke returns the stream unique identifier only
     def unchoke(self, stream, request_body):
         ''' Invoked when a stream is authorized to take the test '''
@@ -59,13 +73,14 @@ class NegotiateServer(ServerHTTP):
     def __init__(self, poller):
         ''' Initialize the negotiator '''
         ServerHTTP.__init__(self, poller)
-        self.queue = collections.deque()
         self.modules = {}
-        self.known = set()
+        self.load = ServerLoad()
+        self.sched = NegotiateScheduler(self.load)
 
     def register_module(self, name, module):
         ''' Register a module '''
         self.modules[name] = module
+        self.sched.add_module(name)
 
     #
     # Protect the server from requests with huge request bodies
@@ -93,13 +108,20 @@ class NegotiateServer(ServerHTTP):
         # be changed.
         #
         if request.uri.startswith('/collect/'):
-            module = request.uri.replace('/collect/', '')
-            module = self.modules[module]
+            name = request.uri.replace('/collect/', '')
+            module = self.modules[name]
             request_body = json.load(request.body)
 
             response_body = module.collect_legacy(stream, request_body, request)
             response_body = json.dumps(response_body)
 
+            try:
+                self.load.add_goodput(name, module.goodput(request_body))
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                logging.warning('negotiate: cannot get goodput of %s', name)
+
             response = Message()
             response.compose(code='200', reason='Ok', body=response_body,
                              keepalive=False, mimetype='application/json')
@@ -108,46 +130,59 @@ class NegotiateServer(ServerHTTP):
         #
         # The first time we see a stream, we decide whether to
         # accept or drop it, depending on the length of the
-        # queue.  The decision whether to accept or not depends
-        # on the current queue length and follows the Random
-        # Early Discard algorithm.  When we accept it, we also
-        # register a function to be called when the stream is
-        # closed so that we can update the queue.  And we
-        # immediately send a response.
+        # queue of its module.  The decision whether to accept or
+        # not follows the Random Early Discard algorithm, with
+        # thresholds that shrink when the server is loaded.  When
+        # we accept it, we also register a function to be called
+        # when the stream is closed so that we can update the
+        # queue, we give the scheduler a chance to unchoke it, and
+        # we immediately send a response.
         # When it's not the first time we see a stream, we just
         # take note that we owe it a response.  But we won't
-        # respond until its queue position changes.
+        # respond until it is unchoked or its queue position
+        # changes enough.
         #
         elif request.uri.startswith('/negotiate/'):
-            if not stream in self.known:
-                position = len(self.queue)
-                min_thresh = CONFIG['negotiate.min_thresh']
-                max_thresh = CONFIG['negotiate.max_thresh']
-                if random.random() < float(position - min_thresh) / (
-                                       max_thresh - min_thresh):
+            name = request.uri.replace('/negotiate/', '')
+            if not stream in self.sched:
+                position = self.sched.length(name)
+                self.load.update()
+                if random.random() < self.load.drop_probability(
+                  name, position):
                     stream.close()
                     return
-                self.queue.append(stream)
-                self.known.add(stream)
+                self.sched.append(name, stream)
                 stream.atclose(self._update_queue)
-                self._do_negotiate((stream, request, position))
+                self._schedule()
+                self._do_negotiate((stream, request, self._position(stream)))
+            elif self.sched.is_running(stream):
+                self._do_negotiate((stream, request, 0))
             else:
                 stream.opaque = request
+                self.sched.wait(stream, self._target(
+                                self.sched.position(stream)))
+                self._wakeup()
 
         # For robustness
         else:
             raise RuntimeError('Unexpected URI')
 
+    def _position(self, stream):
+        ''' Returns the queue position of stream, or zero if
+            stream has been unchoked '''
+        if self.sched.is_running(stream):
+            return 0
+        return self.sched.position(stream)
+
     def _do_negotiate(self, baton):
         ''' Respond to a /negotiate request '''
         stream, request, position = baton
 
-        module = request.uri.replace('/negotiate/', '')
-        module = self.modules[module]
+        name = request.uri.replace('/negotiate/', '')
+        module = self.modules[name]
         request_body = json.load(request.body)
 
-        parallelism = CONFIG['negotiate.parallelism']
-        unchoked = int(position < parallelism)
+        unchoked = int(self.sched.is_running(stream))
         response_body = {
                          'queue_pos': position,
                          'real_address': stream.peername[0],
@@ -169,49 +204,57 @@ class NegotiateServer(ServerHTTP):
                          mimetype='application/json')
         stream.send_response(request, response)
 
-    #
-    # In theory this function should walk the queue and remove the
-    # lost stream.  But, actually, it seems better/faster to create
-    # and fill a new queue.
-    # In the new queue we will add streams before @lost_stream and
-    # streams after @lost_stream that (i) have no pending comet
-    # request or (ii) have a pending comet request and successfully
-    # manage to send it.
-    # Note: in case of error sending the pending comet request,
-    # unregister atclose hook to prevent recursion.
-    # TODO Libero Camillo suggests to use an ordered dictionary to
-    # implement the queue.  I like the idea and I will look into
-    # that after the pending Neubot release.
-    #
+    @staticmethod
+    def _target(position):
+        ''' Returns the position at which we should send an update
+            to a stream that is now at position '''
+        return position - max(1, position // UPDATE_RATIO)
+
     def _update_queue(self, lost_stream, ignored):
         ''' Invoked when a connection is lost '''
-        queue, found = collections.deque(), False
-        position = 0
-        for stream in self.queue:
-            if not found:
-                if lost_stream != stream:
-                    position += 1
-                    queue.append(stream)
-                else:
-                    found = True
-                    self.known.remove(stream)
-            elif not stream.opaque:
-                position += 1
-                queue.append(stream)
-            else:
-                request, stream.opaque = stream.opaque, None
-                try:
-                    self._do_negotiate((stream, request, position))
-                    position += 1
-                    queue.append(stream)
-                except (KeyboardInterrupt, SystemExit):
-                    raise
-                except:
-                    logging.error('Exception', exc_info=1)
-                    stream.unregister_atclose(self._update_queue)
-                    self.known.remove(stream)
-                    stream.close()
-        self.queue = queue
+        if lost_stream in self.sched:
+            self.sched.remove(lost_stream)
+            self._schedule()
+            self._wakeup()
+
+    def _schedule(self):
+        ''' Unchoke waiting streams, if we have spare capacity '''
+        self.load.update()
+        for stream in self.sched.schedule():
+            if stream.opaque:
+                self._respond(stream)
+
+    #
+    # Respond to the pending comet requests of the streams whose
+    # position has changed enough.  Note: in case of error sending
+    # the response, unregister the atclose hook to prevent recursion,
+    # and loop, since removing the stream moves forward the streams
+    # after it.
+    #
+    def _wakeup(self):
+        ''' Send position updates to waiting streams '''
+        while True:
+            streams = self.sched.due()
+            if not streams:
+                break
+            for stream in streams:
+                if stream in self.sched:
+                    self._respond(stream)
+
+    def _respond(self, stream):
+        ''' Respond to the pending request of stream '''
+        request, stream.opaque = stream.opaque, None
+        try:
+            self._do_negotiate((stream, request, self._position(stream)))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            logging.error('Exception', exc_info=1)
+            stream.unregister_atclose(self._update_queue)
+            if stream in self.sched:
+                self.sched.remove(stream)
+                self._schedule()
+            stream.close()
 
 # No poller, so it cannot be used directly
 NEGOTIATE_SERVER = NegotiateServer(None)
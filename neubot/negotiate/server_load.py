@@ -0,0 +1,197 @@
+# neubot/negotiate/server_load.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Load-aware admission control for the negotiate server.
+
+ We sample the CPU utilisation and the bytes per second that cross
+ the interface of the default route (using resmon_linux), at most
+ once per INTERVAL, and we keep a moving average of the goodput that
+ each module reports when the client collects.  The load of the
+ server is the largest of the CPU utilisation and of the fraction of
+ the uplink (negotiate.uplink) in use.  Below LOW_WATER the server is
+ unloaded; between LOW_WATER and HIGH_WATER the headroom decreases
+ linearly to zero.
+
+ The capacity of the server is negotiate.parallelism test slots,
+ scaled by the headroom.  The cost of a test, in slots, is measured
+ (the fraction of HIGH_WATER of the uplink used by the goodput of the
+ module, times negotiate.parallelism) when the uplink is known and is
+ configured (negotiate.<module>.cost) otherwise.  The parallelism of
+ a module is the number of its tests that fit into the capacity (but
+ not more than negotiate.parallelism).  The
+ Random Early Discard thresholds of a module are scaled like its
+ parallelism, so that, when fewer tests run in parallel, we queue
+ fewer clients, who would otherwise wait longer.  When we know nothing
+ about the load (e.g. not on Linux and negotiate.uplink is zero) we
+ behave exactly as before.
+'''
+
+from neubot.config import CONFIG
+
+from neubot import utils
+
+try:
+    from neubot.resmon_linux import SYSINFO
+except ImportError:
+    SYSINFO = None
+
+# Minimum number of seconds between two samples
+INTERVAL = 1.0
+
+# Weight of a new sample in the moving averages
+ALPHA = 0.25
+
+# Load above which we start to reduce parallelism and queueing
+LOW_WATER = 0.7
+
+# Load at which we only admit the minimum
+HIGH_WATER = 0.95
+
+# Minimum cost of a test, in test slots
+MIN_COST = 0.01
+
+class ServerLoad(object):
+
+    ''' Tracks the load of the server '''
+
+    def __init__(self, sysinfo=SYSINFO):
+        self.sysinfo = sysinfo
+        self.cpu = None
+        self.rate = None
+        self.goodput = {}
+        self.last = None
+        self.iface = None
+
+    def _sample_cpu(self):
+        ''' Returns the (busy, total) CPU jiffies or None '''
+        if self.sysinfo:
+            try:
+                return self.sysinfo.get_cpu_times()
+            except (IOError, OSError, ValueError):
+                pass
+        return None
+
+    def _sample_bytes(self):
+        ''' Returns the bytes received and sent by the interface of
+            the default route or None '''
+        if self.sysinfo:
+            try:
+                if not self.iface:
+                    self.iface = self.sysinfo.get_defaultgw()
+                if self.iface:
+                    netload = self.sysinfo.get_netload(self.iface)
+                    return netload['rx_bytes'], netload['tx_bytes']
+            except (IOError, OSError, ValueError):
+                self.iface = None
+        return None
+
+    def update(self, now=None):
+        ''' Sample the telemetry, unless we did it recently '''
+        if now is None:
+            now = utils.ticks()
+        if self.last and now - self.last[0] < INTERVAL:
+            return
+        cpu, nbytes = self._sample_cpu(), self._sample_bytes()
+        if self.last:
+            elapsed = now - self.last[0]
+            if cpu and self.last[1] and cpu[1] > self.last[1][1]:
+                self.cpu = (float(cpu[0] - self.last[1][0]) /
+                            (cpu[1] - self.last[1][1]))
+            if nbytes and self.last[2]:
+                # The link is full duplex: take the busiest direction
+                rate = max(nbytes[0] - self.last[2][0],
+                           nbytes[1] - self.last[2][1]) / elapsed
+                if self.rate is None:
+                    self.rate = rate
+                else:
+                    self.rate += ALPHA * (rate - self.rate)
+        self.last = (now, cpu, nbytes)
+
+    def add_goodput(self, module, goodput):
+        ''' Take into account the goodput reported by a client '''
+        if goodput <= 0:
+            return
+        average = self.goodput.get(module)
+        if average is None:
+            self.goodput[module] = goodput
+        else:
+            self.goodput[module] = average + ALPHA * (goodput - average)
+
+    def load(self):
+        ''' Returns the load of the server, between 0 and 1 '''
+        load = self.cpu or 0.0
+        uplink = CONFIG['negotiate.uplink']
+        if uplink > 0 and self.rate is not None:
+            load = max(load, self.rate / uplink)
+        return min(1.0, load)
+
+    def headroom(self):
+        ''' Returns the fraction of the nominal capacity that we
+            can still use, between 0 and 1 '''
+        load = self.load()
+        if load <= LOW_WATER:
+            return 1.0
+        return max(0.0, (HIGH_WATER - load) / (HIGH_WATER - LOW_WATER))
+
+    def capacity(self):
+        ''' Returns the number of test slots that we can use now '''
+        return CONFIG['negotiate.parallelism'] * self.headroom()
+
+    def cost(self, module):
+        ''' Returns the cost of a test of module, in test slots, i.e.
+            the fraction of the uplink it uses times parallelism '''
+        uplink = CONFIG['negotiate.uplink']
+        goodput = self.goodput.get(module)
+        if uplink > 0 and goodput:
+            cost = (goodput * CONFIG['negotiate.parallelism'] /
+                    (uplink * HIGH_WATER))
+        else:
+            cost = CONFIG.get('negotiate.%s.cost' % module, 1.0)
+        return max(MIN_COST, cost)
+
+    def parallelism(self, module):
+        ''' Returns the number of tests of module that may run
+            in parallel '''
+        return max(1, int(min(CONFIG['negotiate.parallelism'],
+                              self.capacity() / self.cost(module))))
+
+    def drop_probability(self, module, position):
+        ''' Returns the probability of dropping a client of module
+            that would enter the queue at position '''
+        # Fewer tests in parallel means a slower queue: shorten it
+        scale = (float(self.parallelism(module)) /
+                 CONFIG['negotiate.parallelism'])
+        min_thresh = CONFIG['negotiate.min_thresh'] * scale
+        max_thresh = max(CONFIG['negotiate.max_thresh'] * scale,
+                         min_thresh + 1)
+        return float(position - min_thresh) / (max_thresh - min_thresh)
+
+    def snap(self):
+        ''' Returns a dictionary describing the load '''
+        return {
+                'cpu': self.cpu,
+                'rate': self.rate,
+                'goodput': dict(self.goodput),
+                'load': self.load(),
+                'headroom': self.headroom(),
+               }
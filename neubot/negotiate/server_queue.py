@@ -0,0 +1,220 @@
+# neubot/negotiate/server_queue.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ The queue of the negotiate server.
+
+ Each stream entering the queue gets the next free slot of an array,
+ so slots are sorted by arrival time and the position of a stream in
+ the queue is the number of streams in the slots before its own, which
+ we keep in a Fenwick tree.  A stream waiting for a position update
+ says at which position it wants to be woken up; a segment tree keeps,
+ for each slot, the distance from that position.  When a stream leaves
+ the queue, the distance of all the following slots decreases by one,
+ which is a single range update.  So append, remove and wait cost
+ O(log n), and finding the streams to wake up costs O(log n) each,
+ instead of walking the whole queue every time a stream leaves.
+
+ When the array is full we move the streams to a new array with room
+ for as many streams as there are in the queue (amortized O(1)).
+'''
+
+# Initial number of slots (must be a power of two)
+MIN_SLOTS = 16
+
+# Distance of the slots that are not waiting
+INFINITY = float('inf')
+
+class NegotiateQueue(object):
+
+    ''' Queue with O(log n) positions and position updates '''
+
+    def __init__(self):
+        self.slots = {}
+        self.streams = []
+        self.head = 0
+        self.size = 0
+        self.counts = None
+        self.mins = None
+        self.lazy = None
+        self._resize(MIN_SLOTS, [])
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, stream):
+        return stream in self.slots
+
+    def __iter__(self):
+        ''' Iterate over the streams, in order '''
+        for stream in self.streams:
+            if stream is not None:
+                yield stream
+
+    def append(self, stream):
+        ''' Append stream to the queue and return its position '''
+        if stream in self.slots:
+            raise RuntimeError('negotiate: stream already in queue')
+        if len(self.streams) == self.size:
+            self._compact()
+        position = len(self.slots)
+        slot = len(self.streams)
+        self.streams.append(stream)
+        self.slots[stream] = slot
+        self._count(slot, 1)
+        return position
+
+    def first(self):
+        ''' Returns the first stream in the queue or None '''
+        while (self.head < len(self.streams) and
+               self.streams[self.head] is None):
+            self.head += 1
+        if self.head < len(self.streams):
+            return self.streams[self.head]
+        return None
+
+    def position(self, stream):
+        ''' Returns the position of stream in the queue '''
+        slot = self.slots[stream]
+        position = 0
+        while slot > 0:
+            position += self.counts[slot]
+            slot -= slot & -slot
+        return position
+
+    def remove(self, stream):
+        ''' Remove stream from the queue '''
+        slot = self.slots.pop(stream)
+        self.streams[slot] = None
+        self._count(slot, -1)
+        self._assign(1, 0, self.size, slot, INFINITY)
+        self._add(1, 0, self.size, slot + 1, self.size, -1)
+
+    def wait(self, stream, target):
+        ''' Wake up stream when its position is target or less '''
+        self._assign(1, 0, self.size, self.slots[stream],
+                     self.position(stream) - target)
+
+    def due(self):
+        ''' Returns, in order, the streams to wake up and forgets
+            that they are waiting '''
+        result = []
+        while self.mins[1] <= 0:
+            slot = self._find(1, 0, self.size)
+            self._assign(1, 0, self.size, slot, INFINITY)
+            result.append(self.streams[slot])
+        return result
+
+    #
+    # Fenwick tree of the slots in use.  Note that counts[slot + 1]
+    # refers to slot, which allows position() to sum the slots that
+    # precede the stream's own.
+    #
+
+    def _count(self, slot, delta):
+        ''' Add delta to the count of slot '''
+        slot += 1
+        while slot <= self.size:
+            self.counts[slot] += delta
+            slot += slot & -slot
+
+    #
+    # Segment tree with lazy propagation of the distances, in which
+    # the node i has children 2i and 2i+1 and covers [low, high).
+    #
+
+    def _push(self, node):
+        ''' Propagate the pending update of node to its children '''
+        delta = self.lazy[node]
+        if delta:
+            for child in (2 * node, 2 * node + 1):
+                self.mins[child] += delta
+                self.lazy[child] += delta
+            self.lazy[node] = 0
+
+    def _add(self, node, low, high, begin, end, delta):
+        ''' Add delta to the distance of the slots in [begin, end) '''
+        if end <= low or high <= begin:
+            return
+        if begin <= low and high <= end:
+            self.mins[node] += delta
+            self.lazy[node] += delta
+            return
+        self._push(node)
+        middle = (low + high) // 2
+        self._add(2 * node, low, middle, begin, end, delta)
+        self._add(2 * node + 1, middle, high, begin, end, delta)
+        self.mins[node] = min(self.mins[2 * node], self.mins[2 * node + 1])
+
+    def _assign(self, node, low, high, slot, value):
+        ''' Set the distance of slot '''
+        if high - low == 1:
+            self.mins[node] = value
+            return
+        self._push(node)
+        middle = (low + high) // 2
+        if slot < middle:
+            self._assign(2 * node, low, middle, slot, value)
+        else:
+            self._assign(2 * node + 1, middle, high, slot, value)
+        self.mins[node] = min(self.mins[2 * node], self.mins[2 * node + 1])
+
+    def _find(self, node, low, high):
+        ''' Returns the first slot whose distance is not positive '''
+        while high - low > 1:
+            self._push(node)
+            middle = (low + high) // 2
+            if self.mins[2 * node] <= 0:
+                node, high = 2 * node, middle
+            else:
+                node, low = 2 * node + 1, middle
+        return low
+
+    def _compact(self):
+        ''' Move the streams to a new array '''
+        for node in range(1, self.size):
+            self._push(node)
+        waiting = [(stream, self.mins[self.size + slot])
+                   for slot, stream in enumerate(self.streams)
+                   if stream is not None]
+        size = MIN_SLOTS
+        while size < 2 * len(waiting):
+            size *= 2
+        self._resize(size, waiting)
+
+    def _resize(self, size, waiting):
+        ''' Rebuild the trees with size slots from the list of
+            (stream, distance) of the streams in the queue '''
+        self.size = size
+        self.slots = {}
+        self.streams = []
+        self.head = 0
+        self.counts = [0] * (size + 1)
+        self.mins = [INFINITY] * (2 * size)
+        self.lazy = [0] * (2 * size)
+        for slot, (stream, distance) in enumerate(waiting):
+            self.slots[stream] = slot
+            self.streams.append(stream)
+            self.mins[size + slot] = distance
+            self._count(slot, 1)
+        for node in range(size - 1, 0, -1):
+            self.mins[node] = min(self.mins[2 * node], self.mins[2 * node + 1])
@@ -77,6 +77,11 @@ class NegotiateServerRaw(NegotiateServerModule):
             BACKEND.store_raw(complete_result)
             return result
 
+    def goodput(self, request_body):
+        ''' Returns the goodput measured by the client '''
+        goodput = request_body['goodput']
+        return float(goodput['bytesdiff']) / goodput['timediff']
+
     def _update_peers(self, stream, ignored):
         ''' Invoked when a session has been closed '''
         # Note: if collect is successful self.peers[sha512] doesn't exist
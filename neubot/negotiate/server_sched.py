@@ -0,0 +1,181 @@
+# neubot/negotiate/server_sched.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Weighted fair scheduling of the tests of the negotiate server.
+
+ Each module has its own queue of waiting streams.  The streams that
+ have been unchoked, i.e. whose test is running, use part of the
+ capacity of the server, according to the cost of the test of their
+ module (see server_load.py).  When there is spare capacity, we unchoke
+ the streams at the head of the queues using Deficit Round Robin: at
+ each round a module with waiting streams earns QUANTUM times its weight
+ (negotiate.<module>.weight) and spends the cost of each test that it
+ starts.  So, in the long run, the capacity used by each module is
+ proportional to its weight, no matter how expensive its tests are,
+ and a module with many waiting clients does not starve the others.
+'''
+
+from neubot.config import CONFIG
+from neubot.negotiate.server_queue import NegotiateQueue
+
+# Credit earned by a module with weight 1 at each round, in test slots
+QUANTUM = 1.0
+
+# Minimum weight, to make sure that each round makes progress
+MIN_WEIGHT = 0.01
+
+class NegotiateScheduler(object):
+
+    ''' Per-module queues and deficit round robin scheduler '''
+
+    def __init__(self, load):
+        self.load = load
+        self.queues = {}
+        self.order = []
+        self.deficit = {}
+        self.turn = 0
+        self.credited = False
+        self.waiting = {}
+        self.running = {}
+        self.in_use = 0.0
+
+    def add_module(self, name):
+        ''' Create the queue of module name '''
+        if name not in self.queues:
+            self.queues[name] = NegotiateQueue()
+            self.order.append(name)
+            self.deficit[name] = 0.0
+
+    def weight(self, name):
+        ''' Returns the weight of module name '''
+        return max(MIN_WEIGHT, CONFIG.get('negotiate.%s.weight' % name, 1.0))
+
+    def __contains__(self, stream):
+        return stream in self.waiting or stream in self.running
+
+    def __len__(self):
+        return len(self.waiting) + len(self.running)
+
+    def length(self, name):
+        ''' Returns the number of streams waiting for module name '''
+        return len(self.queues[name])
+
+    def is_running(self, stream):
+        ''' Returns True if stream has been unchoked '''
+        return stream in self.running
+
+    def append(self, name, stream):
+        ''' Append stream to the queue of module name and return
+            its position '''
+        position = self.queues[name].append(stream)
+        self.waiting[stream] = name
+        return position
+
+    def position(self, stream):
+        ''' Returns the position of stream in the queue of its module '''
+        return self.queues[self.waiting[stream]].position(stream)
+
+    def wait(self, stream, target):
+        ''' Wake up stream when its position is target or less '''
+        self.queues[self.waiting[stream]].wait(stream, target)
+
+    def due(self):
+        ''' Returns the waiting streams to wake up '''
+        result = []
+        for name in self.order:
+            result.extend(self.queues[name].due())
+        return result
+
+    def remove(self, stream):
+        ''' Remove a waiting or running stream '''
+        if stream in self.running:
+            self.in_use -= self.running.pop(stream)[1]
+            if not self.running:
+                self.in_use = 0.0
+        else:
+            self.queues[self.waiting.pop(stream)].remove(stream)
+
+    def _unchoke(self, name, cost):
+        ''' Move the first stream of module name to running '''
+        stream = self.queues[name].first()
+        self.remove(stream)
+        self.running[stream] = (name, cost)
+        self.in_use += cost
+        return stream
+
+    def _next_turn(self):
+        ''' Pass the turn to the next module '''
+        self.turn = (self.turn + 1) % len(self.order)
+        self.credited = False
+
+    def schedule(self):
+
+        ''' Unchoke as many waiting streams as the capacity allows and
+            return them, in the order in which we unchoked them '''
+
+        unchoked = []
+        capacity = self.load.capacity()
+        idle = 0
+
+        while self.order and idle < len(self.order):
+            name = self.order[self.turn]
+            queue = self.queues[name]
+            if not queue:
+                self.deficit[name] = 0.0
+                self._next_turn()
+                idle += 1
+                continue
+            idle = 0
+
+            if not self.credited:
+                self.deficit[name] += QUANTUM * self.weight(name)
+                self.credited = True
+
+            cost = self.load.cost(name)
+            while queue and cost <= self.deficit[name]:
+                # Note: we always allow one test, even if it does not fit
+                if self.running and self.in_use + cost > capacity:
+                    return unchoked
+                unchoked.append(self._unchoke(name, cost))
+                self.deficit[name] -= cost
+
+            if not queue:
+                self.deficit[name] = 0.0
+            self._next_turn()
+
+        return unchoked
+
+    def snap(self):
+        ''' Returns a dictionary describing the scheduler state '''
+        result = {}
+        for name in self.order:
+            result[name] = {
+                            'waiting': len(self.queues[name]),
+                            'running': len([1 for value in
+                                            self.running.values()
+                                            if value[0] == name]),
+                            'deficit': self.deficit[name],
+                            'weight': self.weight(name),
+                            'cost': self.load.cost(name),
+                           }
+        return result
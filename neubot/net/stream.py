@@ -45,11 +45,14 @@ if __name__ == "__main__":
     sys.path.insert(0, ".")
 
 from neubot.config import CONFIG
+from neubot.connector import ConnectRace
+from neubot.connector import FAMILIES
+from neubot.listener import ACCEPT_STATS
+from neubot.listener import accept
 from neubot.log import oops
 from neubot.net.poller import POLLER
 from neubot.net.poller import Pollable
 
-from neubot import utils
 from neubot import utils_net
 
 from neubot.main import common
@@ -64,12 +67,16 @@ MAXBUF = 1 << 18
 SOFT_ERRORS = [ errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR ]
 
 if ssl:
+    from neubot import sslstream
+
     class SSLWrapper(object):
-        def __init__(self, sock):
+        def __init__(self, sock, peer=None):
             self.sock = sock
+            self.peer = peer
 
         def soclose(self):
             try:
+                sslstream.save_session(self.sock, self.peer)
                 self.sock.close()
             except ssl.SSLError:
                 logging.error('Exception', exc_info=1)
@@ -188,13 +195,16 @@ class Stream(Pollable):
             server_side = conf["net.stream.server_side"]
             certfile = conf["net.stream.certfile"]
 
-            # wrap_socket distinguishes between None and ''
-            if not certfile:
-                certfile = None
+            if server_side:
+                if not certfile:
+                    raise RuntimeError("SSL server needs a certfile")
+                peer = None
+            else:
+                certfile = ""
+                peer = self.peername
 
-            ssl_sock = ssl.wrap_socket(sock, do_handshake_on_connect=False,
-              certfile=certfile, server_side=server_side)
-            self.sock = SSLWrapper(ssl_sock)
+            ssl_sock = sslstream.wrap_socket(sock, certfile, peer)
+            self.sock = SSLWrapper(ssl_sock, peer)
 
             self.recv_ssl_needs_kickoff = not server_side
 
@@ -437,28 +447,25 @@ class Stream(Pollable):
     def send_complete(self):
         pass
 
-class Connector(Pollable):
+class Connector(object):
     def __init__(self, poller, parent):
-        Pollable.__init__(self)
         self.poller = poller
         self.parent = parent
         self.sock = None
-        self.timestamp = 0
+        self.family = None
         self.endpoint = None
         self.epnts = collections.deque()
+        self.prefer_ipv6 = CONFIG["prefer_ipv6"]
         self.watchdog = 10
 
     def __repr__(self):
         return "connector to %s" % str(self.endpoint)
 
     def _connection_failed(self):
-        if self.sock:
-            self.poller.unset_writable(self)
-            self.sock = None
         if not self.epnts:
             self.parent._connection_failed(self, None)
             return
-        self.connect(self.epnts.popleft(), None)
+        self._connect(self.epnts.popleft())
 
     def connect(self, endpoint, conf):
 
@@ -470,34 +477,22 @@ class Connector(Pollable):
                 self.epnts.append(epnt)
             endpoint = self.epnts.popleft()
 
-        self.endpoint = endpoint
+        self.prefer_ipv6 = conf.get("prefer_ipv6", CONFIG["prefer_ipv6"])
+        self._connect(endpoint)
 
-        prefer_ipv6 = conf.get("prefer_ipv6", CONFIG["prefer_ipv6"])
-        sock = utils_net.connect(endpoint, prefer_ipv6)
-        if not sock:
-            self._connection_failed()
-            return
+    # Race the addresses of endpoint, like neubot/connector.py
+    def _connect(self, endpoint):
+        self.endpoint = endpoint
+        race = ConnectRace(self.poller, endpoint, self.prefer_ipv6,
+                           self._connection_made, self._connection_failed,
+                           self.watchdog)
+        race.start()
 
+    def _connection_made(self, sock, ainfo, rtt):
         self.sock = sock
-        self.timestamp = utils.ticks()
-        self.poller.set_writable(self)
-
-    def fileno(self):
-        return self.sock.fileno()
-
-    def handle_write(self):
-        self.poller.unset_writable(self)
-
-        if not utils_net.isconnected(self.endpoint, self.sock):
-            self._connection_failed()
-            return
-
-        rtt = utils.ticks() - self.timestamp
+        self.family = FAMILIES.get(ainfo[0], str(ainfo[0]))
         self.parent._connection_made(self.sock, self.endpoint, rtt)
 
-    def handle_close(self):
-        self._connection_failed()
-
 class Listener(Pollable):
     def __init__(self, poller, parent, sock, endpoint):
         Pollable.__init__(self)
@@ -525,15 +520,22 @@ class Listener(Pollable):
     # listening for new connections.
     #
     def handle_read(self):
-        try:
-            sock = self.lsock.accept()[0]
-            sock.setblocking(False)
-            self.parent.connection_made(sock, self.endpoint, 0)
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except Exception, exception:
-            self.parent.accept_failed(self, exception)
-            return
+        budget = max(1, CONFIG['net.listen.accept_budget'])
+        count = 0
+        while count < budget:
+            try:
+                sock = accept(self.lsock)
+                if not sock:
+                    break
+                count += 1
+                self.parent.connection_made(sock, self.endpoint, 0)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception, exception:
+                ACCEPT_STATS.errors += 1
+                self.parent.accept_failed(self, exception)
+                break
+        ACCEPT_STATS.update(count, budget)
 
     def handle_close(self):
         self.parent.bind_failed(self.endpoint)  # XXX
@@ -551,7 +553,8 @@ class StreamHandler(object):
         self.conf = conf
 
     def listen(self, endpoint):
-        sockets = utils_net.listen(endpoint, CONFIG['prefer_ipv6'])
+        sockets = utils_net.listen(endpoint, CONFIG['prefer_ipv6'],
+                                   CONFIG['net.listen.backlog'])
         if not sockets:
             self.bind_failed(endpoint)
             return
@@ -41,6 +41,82 @@ from neubot.utils import timestamp
 #
 CHECK_TIMEOUT = 10
 
+#
+# Upper bounds, in seconds, of the buckets of the latency histograms
+# (there is an extra bucket for the longer latencies).
+#
+BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+
+def callback_site(func):
+    ''' Returns the name of the callback site of the task func '''
+    owner = getattr(func, '__self__', None)
+    if owner is not None:
+        return '%s.%s' % (owner.__class__.__name__,
+                          getattr(func, '__name__', '?'))
+    return '%s.%s' % (getattr(func, '__module__', '?'),
+                      getattr(func, '__name__', '?'))
+
+class PollerStats(object):
+
+    '''
+     Latency of the callbacks dispatched by the poller, by callback
+     site (e.g. "StreamHTTP.handle_read"), and loop lag, i.e. how late
+     the scheduled tasks run.  Callbacks slower than slow seconds are
+     logged, because they are hogging the loop.
+    '''
+
+    def __init__(self, slow):
+        self.slow = slow
+        self.sites = {}
+        self.lag = self._histogram()
+        self.slow_count = 0
+
+    @staticmethod
+    def _histogram():
+        ''' Returns an empty histogram '''
+        return {
+                'count': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'buckets': [0] * (len(BUCKETS) + 1),
+               }
+
+    @staticmethod
+    def _account(histogram, value):
+        ''' Account for value in histogram '''
+        histogram['count'] += 1
+        histogram['total'] += value
+        histogram['max'] = max(histogram['max'], value)
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index]:
+            index += 1
+        histogram['buckets'][index] += 1
+
+    def record(self, site, elapsed):
+        ''' Account for a callback of site that took elapsed seconds '''
+        histogram = self.sites.get(site)
+        if histogram is None:
+            histogram = self.sites[site] = self._histogram()
+        self._account(histogram, elapsed)
+        if elapsed > self.slow:
+            self.slow_count += 1
+            logging.warning('poller: slow callback: %s took %.3f s',
+                            site, elapsed)
+
+    def record_lag(self, lag):
+        ''' Account for a task that ran lag seconds late '''
+        self._account(self.lag, max(0.0, lag))
+
+    def snap(self):
+        ''' Returns a dictionary describing the statistics '''
+        return {
+                'bucket_bounds': list(BUCKETS),
+                'lag': self.lag,
+                'sites': self.sites,
+                'slow': self.slow,
+                'slow_count': self.slow_count,
+               }
+
 class Poller(sched.scheduler):
 
     ''' Dispatch read, write, periodic and other events '''
@@ -60,18 +136,26 @@ class Poller(sched.scheduler):
         self.again = True
         self.readset = {}
         self.writeset = {}
+        self.stats = None
         self.check_timeout()
 
+    def instrument(self, slow=0.1):
+        ''' Start timing the dispatched callbacks '''
+        self.stats = PollerStats(slow)
+
     def sched(self, delta, func, *args):
         ''' Schedule task '''
         #logging.debug('poller: sched: %s, %s, %s', delta, func, args)
-        self.enter(delta, 0, self._run_task, (func, args))
+        self.enter(delta, 0, self._run_task, (func, args, ticks() + delta))
         return timestamp() + delta
 
-    @staticmethod
-    def _run_task(func, args):
+    def _run_task(self, func, args, deadline):
         ''' Safely run task '''
         #logging.debug('poller: run_task: %s, %s', func, args)
+        stats = self.stats
+        if stats:
+            begin = ticks()
+            stats.record_lag(begin - deadline)
         try:
             if args:
                 func(args)
@@ -81,6 +165,8 @@ class Poller(sched.scheduler):
             raise
         except:
             logging.error('poller: run_task() failed', exc_info=1)
+        if stats:
+            stats.record(callback_site(func), ticks() - begin)
 
     def set_readable(self, stream):
         ''' Monitor for readability '''
@@ -129,6 +215,9 @@ class Poller(sched.scheduler):
         ''' Safely dispatch read event '''
         if fileno in self.readset:
             stream = self.readset[fileno]
+            stats = self.stats
+            if stats:
+                begin = ticks()
             try:
                 stream.handle_read()
             except (KeyboardInterrupt, SystemExit):
@@ -136,11 +225,17 @@ class Poller(sched.scheduler):
             except:
                 logging.error('poller: handle_read() failed', exc_info=1)
                 self.close(stream)
+            if stats:
+                stats.record('%s.handle_read' % stream.__class__.__name__,
+                             ticks() - begin)
 
     def _call_handle_write(self, fileno):
         ''' Safely dispatch write event '''
         if fileno in self.writeset:
             stream = self.writeset[fileno]
+            stats = self.stats
+            if stats:
+                begin = ticks()
             try:
                 stream.handle_write()
             except (KeyboardInterrupt, SystemExit):
@@ -148,6 +243,9 @@ class Poller(sched.scheduler):
             except:
                 logging.error('poller: handle_write() failed', exc_info=1)
                 self.close(stream)
+            if stats:
+                stats.record('%s.handle_write' % stream.__class__.__name__,
+                             ticks() - begin)
 
     def break_loop(self):
         ''' Break out of poller loop '''
@@ -221,5 +319,7 @@ class Poller(sched.scheduler):
         data['poller'] = { "readset": self.readset, "writeset": self.writeset }
         if hasattr(self, 'queue'):
             data['poller']['queue'] = self.queue
+        if self.stats:
+            data['poller']['stats'] = self.stats.snap()
 
 POLLER = Poller(1)
@@ -78,8 +78,10 @@ class RawClient(Handler):
 
     def handle_connect(self, connector, sock, rtt, sslconfig, state):
         logging.info('raw_clnt: connection established with %s', connector)
-        logging.info('raw_clnt: connect_time: %s', utils.time_formatter(rtt))
+        logging.info('raw_clnt: connect_time: %s (%s)',
+                     utils.time_formatter(rtt), connector.family)
         state['connect_time'] = rtt
+        state['family'] = connector.family
         Stream(sock, self._connection_ready, self._connection_lost,
           sslconfig, '', ClientContext(state))
         STATE.update('test', 'raw')
@@ -113,7 +113,7 @@ class RawNegotiate(HttpClient):
         context = stream.opaque
         extra = context.extra
         request = {}  # No options for now
-        body = six.b(json.dumps(request))
+        body = json.dumpb(request)
         host_header = utils_net.format_epnt((extra['address'], extra['port']))
         self.append_request(stream, 'GET', '/negotiate/raw', 'HTTP/1.1')
         self.append_header(stream, 'Host', host_header)
@@ -144,7 +144,7 @@ class RawNegotiate(HttpClient):
             logging.error('raw_negotiate: bad response')
             stream.close()
             return
-        response = json.loads(six.u(context.body.getvalue()))
+        response = json.loadb(context.body.getvalue())
         http_utils.prettyprint_json(response, '<')
         if STATE.current == 'negotiate':
             self._process_negotiate_response(stream, response)
@@ -234,7 +234,7 @@ class RawNegotiate(HttpClient):
         context = stream.opaque
         extra = context.extra
         extra['local_result'] = result
-        body = six.b(json.dumps(result))
+        body = json.dumpb(result)
         host_header = utils_net.format_epnt((extra['address'], extra['port']))
         self.append_request(stream, 'POST', '/collect/raw', 'HTTP/1.1')
         self.append_header(stream, 'Host', host_header)
@@ -28,6 +28,8 @@
 
 import xml.dom.minidom
 
+from neubot.compat import json
+
 class RendezvousRequest(object):
     def __init__(self):
         self.accept = []
@@ -36,6 +38,21 @@ class RendezvousRequest(object):
         self.privacy_can_collect = 0
         self.privacy_can_share = 0
 
+#
+# Fast path for JSON requests: equivalent to unmarshal_object() but
+# it decodes the body once and does not inspect the types of all the
+# attributes of the request.
+#
+def request_from_json(data):
+    request = RendezvousRequest()
+    dictionary = json.loads(data)
+    for name, value in dictionary.items():
+        if name in request.__dict__:
+            if name != "accept" and isinstance(value, list):
+                value = value[0]
+            setattr(request, name, value)
+    return request
+
 class RendezvousResponse(object):
     def __init__(self):
         self.update = {}
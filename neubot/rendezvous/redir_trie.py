@@ -0,0 +1,243 @@
+# neubot/rendezvous/redir_trie.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Compiled redirection table.
+
+ M-Lab/redir_table.py maps each country to its servers, and the GeoIP
+ country databases map ranges of addresses to countries.  Here we
+ merge the two into a binary trie of IPv4 and IPv6 prefixes that the
+ rendezvous server maps in memory, so that finding the servers of an
+ address walks at most 32 (or 128) nodes, without calling GeoIP and
+ without querying the database.
+
+ The file is little endian and contains:
+
+   header: magic, version, IPv4 root, IPv6 root, nodes, values
+   nodes:  left child, right child, value (zero means none)
+   values: offset of each value in the strings, plus the end
+   strings: each value is the country followed by its servers,
+            separated by newlines
+
+ Node zero is a placeholder, so that a zero child means no child.
+'''
+
+import csv
+import mmap
+import os
+import socket
+import struct
+
+MAGIC = 'NBRT'
+VERSION = 1
+
+HEADER = struct.Struct('<4sIIIII')
+NODE = struct.Struct('<III')
+OFFSET = struct.Struct('<I')
+
+IPV4MAPPED = '\0' * 10 + '\xff\xff'
+
+def address_to_key(address):
+    ''' Returns (bits, number) for address; IPv4-mapped IPv6
+        addresses are converted to IPv4 '''
+    if ':' in address:
+        packed = socket.inet_pton(socket.AF_INET6, address)
+        if not packed.startswith(IPV4MAPPED):
+            high, low = struct.unpack('!QQ', packed)
+            return 128, (high << 64) | low
+        packed = packed[12:]
+    else:
+        packed = socket.inet_aton(address)
+    return 32, struct.unpack('!I', packed)[0]
+
+def range_to_prefixes(bits, first, last):
+    ''' Split the range [first, last] into the smallest list of
+        (number, prefix length) that covers it '''
+    prefixes = []
+    while first <= last:
+        size = bits
+        while (size > 0 and first & ((1 << (bits - size + 1)) - 1) == 0
+               and first + (1 << (bits - size + 1)) - 1 <= last):
+            size -= 1
+        prefixes.append((first, size))
+        first += 1 << (bits - size)
+    return prefixes
+
+class RedirTrieBuilder(object):
+
+    ''' Builds a compiled redirection table '''
+
+    def __init__(self, redir_table):
+        self.left = [0, 0, 0]
+        self.right = [0, 0, 0]
+        self.value = [0, 0, 0]
+        self.values = []
+        self.indexes = {}
+        self.redir_table = redir_table
+
+    def _value_of(self, country):
+        ''' Returns the value of country, one-based '''
+        if country not in self.indexes:
+            servers = sorted(self.redir_table.get(country, ()))
+            self.values.append('\n'.join([country] + servers))
+            self.indexes[country] = len(self.values)
+        return self.indexes[country]
+
+    def insert(self, bits, number, length, country):
+        ''' Map the prefix number/length to country '''
+        node = 1 if bits == 32 else 2
+        for depth in range(length):
+            children = (self.right if (number >> (bits - 1 - depth)) & 1
+                        else self.left)
+            if not children[node]:
+                children[node] = len(self.value)
+                self.left.append(0)
+                self.right.append(0)
+                self.value.append(0)
+            node = children[node]
+        self.value[node] = self._value_of(country)
+
+    def insert_range(self, first, last, country):
+        ''' Map the range of addresses [first, last] to country '''
+        bits, low = address_to_key(first)
+        bits_last, high = address_to_key(last)
+        if bits != bits_last:
+            raise ValueError('redir_trie: mixed address families')
+        for number, length in range_to_prefixes(bits, low, high):
+            self.insert(bits, number, length, country)
+
+    def insert_geoip_csv(self, filep):
+        ''' Insert the ranges of a GeoIP country CSV file '''
+        for row in csv.reader(filep, skipinitialspace=True):
+            if len(row) >= 5 and not row[0].startswith('#'):
+                self.insert_range(row[0], row[1], row[4])
+
+    def serialize(self):
+        ''' Returns the compiled table '''
+        chunks = [HEADER.pack(MAGIC, VERSION, 1, 2, len(self.value),
+                              len(self.values))]
+        for node in range(len(self.value)):
+            chunks.append(NODE.pack(self.left[node], self.right[node],
+                                    self.value[node]))
+        offset = 0
+        for value in self.values:
+            chunks.append(OFFSET.pack(offset))
+            offset += len(value)
+        chunks.append(OFFSET.pack(offset))
+        chunks.extend(self.values)
+        return ''.join(chunks)
+
+    def write(self, path):
+        ''' Atomically replace path with the compiled table '''
+        temp = path + '.new'
+        filep = open(temp, 'wb')
+        filep.write(self.serialize())
+        filep.close()
+        os.rename(temp, path)
+
+class RedirTrie(object):
+
+    ''' A compiled redirection table mapped in memory '''
+
+    def __init__(self):
+        self.path = None
+        self.stat = None
+        self.map = None
+        self.roots = None
+        self.nodes = 0
+        self.offsets = 0
+        self.strings = 0
+        self.cache = {}
+
+    def open(self, path):
+        ''' Map the compiled table at path in memory '''
+        filep = open(path, 'rb')
+        try:
+            stat = os.fstat(filep.fileno())
+            mapping = mmap.mmap(filep.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            filep.close()
+        magic, version, root4, root6, nnodes, nvalues = HEADER.unpack_from(
+                                                            mapping, 0)
+        if magic != MAGIC or version != VERSION:
+            mapping.close()
+            raise ValueError('redir_trie: invalid file: %s' % path)
+        if self.map:
+            self.map.close()
+        self.path, self.map = path, mapping
+        self.stat = (stat.st_ino, stat.st_size, stat.st_mtime)
+        self.roots = {32: root4, 128: root6}
+        self.nodes = HEADER.size
+        self.offsets = self.nodes + nnodes * NODE.size
+        self.strings = self.offsets + (nvalues + 1) * OFFSET.size
+        self.cache = {}
+
+    def reload(self):
+        ''' Map again the table if the file has changed and
+            return True if so '''
+        if not self.path:
+            return False
+        stat = os.stat(self.path)
+        if (stat.st_ino, stat.st_size, stat.st_mtime) == self.stat:
+            return False
+        self.open(self.path)
+        return True
+
+    def _value(self, index):
+        ''' Returns (country, servers) for the one-based value index '''
+        if index not in self.cache:
+            first, last = struct.unpack_from('<II', self.map,
+                           self.offsets + (index - 1) * OFFSET.size)
+            vector = self.map[self.strings + first:self.strings + last].split(
+                                                                    '\n')
+            self.cache[index] = (vector[0], vector[1:])
+        return self.cache[index]
+
+    def lookup(self, address):
+        ''' Returns (country, servers) for address, or None '''
+        if not self.map:
+            return None
+        try:
+            bits, number = address_to_key(address)
+        except (socket.error, ValueError):
+            return None
+        node, depth, found = self.roots[bits], 0, 0
+        while True:
+            left, right, value = NODE.unpack_from(self.map,
+                                   self.nodes + node * NODE.size)
+            if value:
+                found = value
+            if depth == bits:
+                break
+            node = right if (number >> (bits - 1 - depth)) & 1 else left
+            if not node:
+                break
+            depth += 1
+        if not found:
+            return None
+        return self._value(found)
+
+    def close(self):
+        ''' Unmap the table '''
+        if self.map:
+            self.map.close()
+        self.__init__()
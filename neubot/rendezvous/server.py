@@ -37,6 +37,8 @@ from neubot.http.server import HTTP_SERVER
 from neubot.http.server import ServerHTTP
 from neubot.net.poller import POLLER
 from neubot.rendezvous.geoip_wrapper import Geolocator
+from neubot.rendezvous.redir_trie import RedirTrie
+from neubot.rendezvous.server_cache import RendezvousCache
 from neubot.rendezvous import compat
 
 from neubot.main import common
@@ -46,11 +48,20 @@ from neubot import privacy
 from neubot import utils_version
 
 GEOLOCATOR = Geolocator()
+CACHE = RendezvousCache(GEOLOCATOR)
+REDIR_TABLE = RedirTrie()
+
+# Interval between checks for a new redirection table
+RELOAD_INTERVAL = 30
 
 class ServerRendezvous(ServerHTTP):
 
     ''' Rendezvous server '''
 
+    def __init__(self, poller):
+        ServerHTTP.__init__(self, poller)
+        self.responses = {}
+
     def configure(self, conf):
         ''' Configure rendezvous server '''
 
@@ -63,40 +74,24 @@ class ServerRendezvous(ServerHTTP):
         conf["http.server.rootdir"] = ""
 
         ServerHTTP.configure(self, conf)
+        self.responses.clear()
 
     def process_request(self, stream, request):
         ''' Process rendezvous request '''
 
         if request['content-type'] == 'application/json':
-            ibody = marshal.unmarshal_object(request.body.read(),
-              'application/json', compat.RendezvousRequest)
+            ibody = compat.request_from_json(request.body.read())
         else:
             ibody = marshal.unmarshal_object(request.body.read(),
               "application/xml", compat.RendezvousRequest)
 
-        obody = compat.RendezvousResponse()
-
-        #
-        # If we don't say anything the rendezvous server is not
-        # going to prompt for updates.  We need to specify the
-        # updated version number explicitly when we start it up.
-        # This should guarantee that we do not advertise -rc
-        # releases and other weird things.
-        #
-        version = self.conf["rendezvous.server.update_version"]
-        if version and ibody.version:
-            diff = utils_version.compare(version, ibody.version)
-            logging.debug('rendezvous: version=%s ibody.version=%s diff=%f', 
-                      version, ibody.version, diff)
-            if diff > 0:
-                obody.update["uri"] = 'http://neubot.org/'
-                obody.update["version"] = version
-
         #
         # Select test server address.
         # The default test server is the master server itself.
-        # If we know the country, lookup the list of servers for
-        # that country in the database.
+        # If the compiled redirection table knows the servers for
+        # the address of the client, use them.  Otherwise, if we
+        # know the country, lookup the list of servers for that
+        # country in the in-memory copy of the database.
         # We only redirect to other servers clients that have
         # agreed to give us the permission to publish, in order
         # to be compliant with M-Lab policy.
@@ -122,15 +117,19 @@ class ServerRendezvous(ServerHTTP):
         # Redirect IFF have ALL privacy permissions
         if privacy.count_valid(request_body, 'privacy_') == 3:
             agent_address = stream.peername[0]
-            country = GEOLOCATOR.lookup_country(agent_address)
-            if country:
-                servers = table_geoloc.lookup_servers(DATABASE.connection(),
-                                                      country)
-                if not servers:
-                    logging.info("* learning new country: %s", country)
-                    table_geoloc.insert_server(DATABASE.connection(),
-                                               country, server)
-                    servers = [server]
+            country, servers = (REDIR_TABLE.lookup(agent_address)
+                                or ('', []))
+            if not servers:
+                country = CACHE.lookup_country(agent_address)
+                if country:
+                    servers = CACHE.lookup_servers(DATABASE.connection(),
+                                                   country)
+                    if not servers:
+                        logging.info("* learning new country: %s", country)
+                        table_geoloc.insert_server(DATABASE.connection(),
+                                                   country, server)
+                        servers = [server]
+            if servers:
                 server = random.choice(servers)
                 logging.info("rendezvous_server: %s[%s] -> %s", agent_address,
                          country, server)
@@ -139,21 +138,66 @@ class ServerRendezvous(ServerHTTP):
             logging.warning('rendezvous_server: cannot redirect to M-Lab: %s',
                         request_body)
 
+        #
+        # The response only depends on the version of the client,
+        # on the tests it accepts, on whether it allows us to
+        # collect and on the selected server.  So we keep the
+        # serialized responses around, and we clear them when
+        # there are too many of them (which should not happen,
+        # since there are not so many versions and servers).
+        #
+        key = (ibody.version, "speedtest" in ibody.accept,
+               "bittorrent" in ibody.accept,
+               privacy.collect_allowed(request_body), server)
+        if key not in self.responses:
+            if len(self.responses) >= CONFIG.get(
+              "rendezvous.server.cache_size", 4096):
+                self.responses.clear()
+            self.responses[key] = self._compose(*key)
+        body, mimetype = self.responses[key]
+
+        response = Message()
+        response.compose(code="200", reason="Ok",
+          mimetype=mimetype, body=body)
+        stream.send_response(request, response)
+
+    def _compose(self, client_version, speedtest, bittorrent,
+                 collect_allowed, server):
+        ''' Returns the body and the mimetype of the response '''
+
+        obody = compat.RendezvousResponse()
+
+        #
+        # If we don't say anything the rendezvous server is not
+        # going to prompt for updates.  We need to specify the
+        # updated version number explicitly when we start it up.
+        # This should guarantee that we do not advertise -rc
+        # releases and other weird things.
+        #
+        version = self.conf["rendezvous.server.update_version"]
+        if version and client_version:
+            diff = utils_version.compare(version, client_version)
+            logging.debug('rendezvous: version=%s ibody.version=%s diff=%f',
+                      version, client_version, diff)
+            if diff > 0:
+                obody.update["uri"] = 'http://neubot.org/'
+                obody.update["version"] = version
+
         #
         # We require at least informed and can_collect since 0.4.4
         # (released 25 October 2011), so stop clients with empty
         # privacy settings, who were still using master.
         #
-        if privacy.collect_allowed(request_body):
+        if collect_allowed:
             #
             # Note: Here we will have problems if we store unquoted
             # IPv6 addresses into the database.  Because the resulting
             # URI won't be valid.
             #
-            if "speedtest" in ibody.accept:
+            if speedtest:
                 obody.available["speedtest"] = [
                     "http://%s/speedtest" % server ]
-            if "bittorrent" in ibody.accept:
+            if bittorrent:
                 obody.available["bittorrent"] = [
                     "http://%s/" % server ]
 
@@ -162,17 +206,11 @@ class ServerRendezvous(ServerHTTP):
         # newer Neubots want a JSON.  I hope old clients will upgrade
         # pretty soon.
         #
-        if ibody.version and utils_version.compare(ibody.version, "0.3.7") >= 0:
-            body = marshal.marshal_object(obody, "application/json")
-            mimetype = "application/json"
-        else:
-            body = compat.adhoc_marshaller(obody)
-            mimetype = "text/xml"
-
-        response = Message()
-        response.compose(code="200", reason="Ok",
-          mimetype=mimetype, body=body)
-        stream.send_response(request, response)
+        if client_version and utils_version.compare(client_version,
+                                                    "0.3.7") >= 0:
+            return (marshal.marshal_object(obody, "application/json"),
+                    "application/json")
+        return compat.adhoc_marshaller(obody), "text/xml"
 
 CONFIG.register_defaults({
     "rendezvous.server.address": "",
@@ -181,14 +219,34 @@ CONFIG.register_defaults({
     "rendezvous.geoip_wrapper.country_database":                        \
         "/usr/local/share/GeoIP/GeoIP.dat",
     "rendezvous.server.default": "master.neubot.org",
+    "rendezvous.server.cache_size": 4096,
+    "rendezvous.server.redir_table": "",
 })
 
+def _reload_redir_table():
+    ''' Periodically check whether the redirection table changed '''
+    POLLER.sched(RELOAD_INTERVAL, _reload_redir_table)
+    try:
+        if REDIR_TABLE.reload():
+            logging.info("rendezvous_server: reloaded %s", REDIR_TABLE.path)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except:
+        logging.warning("rendezvous_server: cannot reload %s",
+                        REDIR_TABLE.path, exc_info=1)
+
 def run():
     """ Load MaxMind database and register our child server """
 
     GEOLOCATOR.open_or_die()
     logging.info("This product includes GeoLite data created by MaxMind, "
                  "available from <http://www.maxmind.com/>.")
+    CACHE.load(DATABASE.connection())
+
+    path = CONFIG["rendezvous.server.redir_table"]
+    if path:
+        REDIR_TABLE.open(path)
+        POLLER.sched(RELOAD_INTERVAL, _reload_redir_table)
 
     server = ServerRendezvous(None)
     server.configure(CONFIG)
@@ -204,6 +262,8 @@ def main(args):
         "rendezvous.geoip_wrapper.country_database":                    \
           "Path of the GeoIP country database",
         "rendezvous.server.default": "Default test server to use",
+        "rendezvous.server.cache_size": "Max number of cached addresses",
+        "rendezvous.server.redir_table": "Compiled redirection table to use",
     })
 
     common.main("rendezvous.server", "Rendezvous server", args)
@@ -0,0 +1,87 @@
+# neubot/rendezvous/server_cache.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ In-memory caches of the rendezvous server.
+
+ The country of an address is cached per address, because GeoIP
+ ranges do not line up with network prefixes, in a dictionary bounded
+ to rendezvous.server.cache_size entries, from which we evict the least
+ recently used address.  Addresses that GeoIP does not know are cached
+ as well, with the empty string as country.  The
+ geoloc table is kept in memory as a dictionary that maps each country
+ to its servers, and is reloaded from the database when insert_server()
+ modifies it.  So, in the common case, a rendezvous does not need to
+ call GeoIP or to query the database.
+'''
+
+from neubot.config import CONFIG
+from neubot.database import table_geoloc
+from neubot.simplejson import OrderedDict
+
+class RendezvousCache(object):
+
+    ''' Caches the country of addresses and the servers of countries '''
+
+    def __init__(self, geolocator):
+        self.geolocator = geolocator
+        self.countries = OrderedDict()
+        self.servers = None
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def lookup_country(self, address):
+        ''' Returns the country of address, or the empty string '''
+        country = self.countries.pop(address, None)
+        if country is None:
+            self.misses += 1
+            # Remember misses as well, as the empty string
+            country = self.geolocator.lookup_country(address) or ''
+        else:
+            self.hits += 1
+        self.countries[address] = country
+        while len(self.countries) > CONFIG.get(
+          'rendezvous.server.cache_size', 4096):
+            self.countries.popitem(last=False)
+        return country
+
+    def load(self, connection):
+        ''' Load the geoloc table in memory '''
+        self.generation = table_geoloc.GENERATION[0]
+        self.servers = table_geoloc.lookup_all(connection)
+
+    def lookup_servers(self, connection, country):
+        ''' Returns the list of the servers of country '''
+        if (self.servers is None or
+            self.generation != table_geoloc.GENERATION[0]):
+            self.load(connection)
+        return self.servers.get(country, [])
+
+    def snap(self):
+        ''' Returns a dictionary describing the caches '''
+        return {
+                'addresses': len(self.countries),
+                'countries': len(self.servers or ()),
+                'hits': self.hits,
+                'misses': self.misses,
+               }
@@ -21,7 +21,7 @@
 # along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-# Monitor resources with Linux (this file is currently unused)
+# Monitor resources with Linux (used by neubot/negotiate/server_load.py)
 
 import os.path
 
@@ -40,6 +40,21 @@ class _SysInfo(object):
 
         return vector
 
+    def get_cpu_times(self):
+
+        """Get the number of busy and total jiffies since boot."""
+
+        # Note: the first line of /proc/stat is the sum over all
+        # CPUs and the fourth and fifth values are idle and iowait.
+
+        fp = open("/proc/stat", "rb")
+        vector = [long(value) for value in fp.readline().split()[1:]]
+        fp.close()
+        total = sum(vector)
+        busy = total - sum(vector[3:5])
+
+        return busy, total
+
     def get_meminfo(self):
 
         """Get the amount of free and total memory."""
@@ -142,11 +157,13 @@ class _SysInfo(object):
 
         return None
 
+SYSINFO = _SysInfo()
 
 if __name__ == "__main__":
-    sysinfo = _SysInfo()
+    sysinfo = SYSINFO
 
     print "System load avg :", sysinfo.get_load_avg()
+    print "CPU busy/total  :", sysinfo.get_cpu_times()
     print "Free/total mem  :", sysinfo.get_meminfo()
     print "Net Interfaces  :", sysinfo.get_netlist()
     print "Net Default GW  :", sysinfo.get_defaultgw()
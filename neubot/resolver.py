@@ -0,0 +1,219 @@
+# neubot/resolver.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+ Non-blocking name resolver.
+
+ socket.getaddrinfo() blocks, and, when called from the poller thread,
+ a slow DNS server stalls every other connection, including the ones
+ of running tests.  So, we resolve names using a small pool of worker
+ threads, which we start lazily, so that we don't start them before
+ going into the background.  The workers post the results to the
+ poller thread by writing to a socket pair, and the poller thread
+ runs the deferreds of the waiting callers.
+
+ getaddrinfo() does not tell us the TTL of the records, so we cache
+ successes for TTL seconds and failures for NEGATIVE_TTL seconds, and
+ lookups of the same name in progress are coalesced.  Numeric hosts
+ are resolved in place, since that does not need the network.
+'''
+
+import Queue
+import collections
+import logging
+import socket
+import threading
+
+from neubot.defer import Failure
+from neubot.pollable import Pollable
+from neubot.poller import POLLER
+
+from neubot import utils_net
+from neubot import utils
+
+# Seconds during which we reuse a successful lookup
+TTL = 300
+
+# Seconds during which we reuse a failed lookup
+NEGATIVE_TTL = 30
+
+# Maximum number of cached names
+CACHE_SIZE = 1024
+
+# Number of worker threads
+WORKERS = 2
+
+class _Wakeup(Pollable):
+
+    ''' Readable end of the socket pair used by the workers '''
+
+    def __init__(self, resolver, sock):
+        Pollable.__init__(self)
+        self.resolver = resolver
+        self.sock = sock
+        self.watchdog = -1
+
+    def __repr__(self):
+        return 'resolver wakeup'
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def handle_read(self):
+        try:
+            self.sock.recv(512)
+        except socket.error:
+            pass
+        self.resolver.dispatch()
+
+class Resolver(object):
+
+    ''' Resolves names using worker threads '''
+
+    def __init__(self, poller=POLLER):
+        self.poller = poller
+        self.cache = {}
+        self.waiting = {}
+        self.requests = Queue.Queue()
+        self.results = collections.deque()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.wakeup = None
+        self.writer = None
+        self.hits = 0
+        self.misses = 0
+
+    def getaddrinfo(self, epnt, deferred):
+        ''' Resolve epnt and pass to deferred the list of addrinfo,
+            or a Failure if we cannot resolve it '''
+
+        key = (epnt[0], epnt[1])
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry[0] > utils.ticks():
+                self.hits += 1
+                self._fire(deferred, entry[1])
+                return
+            del self.cache[key]
+
+        try:
+            addrinfo = socket.getaddrinfo(key[0], key[1], socket.AF_UNSPEC,
+                          socket.SOCK_STREAM, 0, socket.AI_NUMERICHOST)
+        except socket.error:
+            pass
+        else:
+            deferred.callback(addrinfo)
+            return
+
+        self.misses += 1
+        if key in self.waiting:
+            self.waiting[key].append(deferred)
+            return
+        self.waiting[key] = [deferred]
+
+        self._start()
+        self.poller.set_readable(self.wakeup)
+        logging.debug('resolver: resolving %s', utils_net.format_epnt(epnt))
+        self.requests.put(key)
+
+    @staticmethod
+    def _fire(deferred, result):
+        ''' Pass the result of a lookup to deferred '''
+        if isinstance(result, Failure):
+            deferred.errback(result)
+        else:
+            deferred.callback(list(result))
+
+    def _start(self):
+        ''' Lazily create the socket pair and start the workers '''
+        if self.wakeup is None:
+            reader, self.writer = utils_net.socketpair()
+            reader.setblocking(False)
+            self.writer.setblocking(False)
+            self.wakeup = _Wakeup(self, reader)
+        with self.lock:
+            self.threads = [thread for thread in self.threads
+                            if thread.is_alive()]
+            while len(self.threads) < WORKERS:
+                thread = threading.Thread(target=self._run, name='resolver')
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    @staticmethod
+    def lookup(key):
+        ''' Blocking lookup (runs in a worker thread) '''
+        return socket.getaddrinfo(key[0], key[1], socket.AF_UNSPEC,
+                                  socket.SOCK_STREAM)
+
+    def _run(self):
+        ''' Worker thread main loop '''
+        while True:
+            key = self.requests.get()
+            try:
+                result = self.lookup(key)
+            except:
+                result = Failure()
+            self.results.append((key, result))
+            try:
+                self.writer.send('*')
+            except socket.error:
+                pass  # The buffer is full, so a wakeup is pending
+
+    def dispatch(self):
+        ''' Run the deferreds of the completed lookups '''
+        now = utils.ticks()
+        while self.results:
+            key, result = self.results.popleft()
+            if isinstance(result, Failure):
+                logging.warning('resolver: cannot resolve %s: %s',
+                  utils_net.format_epnt(key), result.value)
+                self.cache[key] = (now + NEGATIVE_TTL, result)
+            else:
+                self.cache[key] = (now + TTL, result)
+            for deferred in self.waiting.pop(key, ()):
+                self._fire(deferred, result)
+        if not self.waiting:
+            self.poller.unset_readable(self.wakeup)
+        if len(self.cache) > CACHE_SIZE:
+            self._prune(now)
+
+    def _prune(self, now):
+        ''' Remove expired entries and, if needed, all entries '''
+        for key, entry in list(self.cache.items()):
+            if entry[0] <= now:
+                del self.cache[key]
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.clear()
+
+    def snap(self):
+        ''' Returns a dictionary describing the resolver '''
+        return {
+                'cached': len(self.cache),
+                'waiting': len(self.waiting),
+                'hits': self.hits,
+                'misses': self.misses,
+               }
+
+RESOLVER = Resolver()
@@ -48,13 +48,22 @@ from neubot.raw_negotiate import RawNegotiate
 from neubot.runner_dload import RunnerDload
 from neubot.runner_hosts import RUNNER_HOSTS
 from neubot.runner_mlabns import RunnerMlabns
+from neubot.runner_policy import RUNNER_POLICY
 from neubot.runner_tests import RUNNER_TESTS
 
 from neubot import bittorrent
 from neubot import privacy
+from neubot import runner_mlabns
 from neubot import runner_rendezvous
 from neubot import system
 
+#
+# The mlab-ns policy for the server of each test.  Raw always uses
+# mlab-ns; the other tests use the closest host only when rendezvous
+# did not tell us their server (see runner_tests).
+#
+MLABNS_POLICY = {'bittorrent': '', 'raw': 'random', 'speedtest': ''}
+
 class RunnerCore(object):
 
     ''' Implements component that runs the selected test '''
@@ -76,8 +85,11 @@ class RunnerCore(object):
             deferred2 = Deferred()
             deferred2.add_callback(lambda param: None)
             if test == 'raw':
-                # Raw uses mlab-ns and wants a random server
-                self.queue.append(('mlab-ns', deferred2, {'policy': 'random'}))
+                # Raw uses mlab-ns and wants a random server, which,
+                # if possible, we have prefetched during the last test
+                if not RUNNER_HOSTS.has_host('raw', 'random'):
+                    self.queue.append(('mlab-ns', deferred2,
+                                       {'test': 'raw', 'policy': 'random'}))
             else:
                 self.queue.append(('rendezvous', deferred2, None))
         self.queue.append((test, deferred, ctx))
@@ -147,7 +159,7 @@ class RunnerCore(object):
             RunnerDload(first_elem[2])
 
         elif first_elem[0] == 'raw':
-            address = RUNNER_HOSTS.get_random_host()
+            address = RUNNER_HOSTS.get_random_host('raw')
             handler = RawNegotiate()
             handler.connect((address, 8080), CONFIG['prefer_ipv6'], 0, {})
 
@@ -163,6 +175,17 @@ class RunnerCore(object):
         else:
             raise RuntimeError('runner_core: asked to run an unknown test')
 
+        #
+        # While a test runs, prefetch the server of the next scheduled
+        # test, so that it does not need to wait for mlab-ns.  Skip the
+        # internal steps, which are quick and precede a real test.
+        #
+        if first_elem[0] not in ('mlab-ns', 'rendezvous'):
+            test = RUNNER_POLICY.peek_next_test()
+            if test in MLABNS_POLICY:
+                runner_mlabns.prefetch(test, MLABNS_POLICY[test],
+                                       CONFIG['prefer_ipv6'])
+
     def test_done(self, *baton):
         ''' Invoked when the test is done '''
 
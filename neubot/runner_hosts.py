@@ -26,6 +26,8 @@
 import logging
 import random
 
+from neubot import utils
+
 STATIC_TABLE_TIME = 'Tue Mar 12 11:26:08 2013'
 
 STATIC_TABLE = [
@@ -142,55 +144,114 @@ STATIC_TABLE = [
     'neubot.mlab.mlab3.wlg01.measurement-lab.org',
 ]
 
+#
+# Discovery cache
+# ---------------
+#
+# We remember the last host that mlab-ns returned for each test and
+# policy, so that a test does not need to wait for a discovery round
+# trip.  A host is fresh for TTL[policy] seconds; after that, and until
+# it is MAX_STALE[policy] seconds old, it is stale: we still use it, but
+# needs_refresh() tells the runner to refresh it in background (stale-
+# while-revalidate).  Older hosts are forgotten, and we fall back to the
+# static table.  The runner prefetches the host of the next scheduled
+# test while the current test runs, and the scheduling interval of
+# background_rendezvous is between 1380 and 1620 seconds, so a host
+# must be fresh for longer than that.
+#
+# Why we don't reuse the random host
+# ----------------------------------
+#
+# For the random host, it is wrong to reuse it: if next mlab-ns query fails,
+# next test is going to reuse the cached host.  This is clearly not random.
+# So, use the random host returned by mlab-ns just once.
+#   For the closest host, reusing it for a while is good, since it does not
+# change often.  However, the static table should be the exception, not the
+# norm.  Therefore, we forget the closest host after MAX_STALE, so that, if
+# mlab-ns keeps failing, the behavior changes (e.g. warnings in the logs, big
+# changes in RTT) and the problem (perhaps just a local routing problem) is
+# more likely to be spotted.  Moreover the cached closest host may be down,
+# and insisting with it in this case is worst than choosing one host at random.
+#
+
+TTL = {'': 3600, 'random': 1800}
+MAX_STALE = {'': 10800, 'random': 3600}
+
 class RunnerHosts(object):
     ''' Keeps track of known M-Lab hosts '''
 
     def __init__(self):
-        self.closest = None
-        self.random = None
-
-    def set_closest_host(self, host):
-        ''' Sets the closest M-Lab host '''
-        logging.debug('runner_hosts: closest host: %s', host['fqdn'])
-        self.closest = host['fqdn']
-
-    def set_random_host(self, host):
-        ''' Sets one random M-Lab host '''
-        logging.debug('runner_hosts: random host: %s', host['fqdn'])
-        self.random = host['fqdn']
-
-    #
-    # Why we don't cache latest random/closest host
-    # ---------------------------------------------
-    #
-    # For the random host, it is wrong to cache it: if next mlab-ns query fails,
-    # next test is going to reuse the cached host.  This is clearly not random.
-    # So, use the random host returned by mlab-ns just once.
-    #   For the closest host, it may be good to cache it: if next mlab-ns query
-    # fails, next test is going to reuse it.  However, the static table should
-    # be the exception, not the norm.  Therefore, behave same-as the random host
-    # and avoid caching, such that, if there is a failure, the behavior changes
-    # (e.g. warnings in the logs, big changes in RTT) and the problem (perhaps
-    # just a local routing problem) is more likely to be spotted.  Moreover the
-    # cached closest host may be down, and insisting with it in this case is
-    # worst than choosing one host at random.
-    #
-
-    def get_closest_host(self):
-        ''' Return the closest host '''
-        if self.closest:
-            result = self.closest
-            self.closest = None
-            return result
-        return self.get_random_static_host()
-
-    def get_random_host(self):
-        ''' Return one random host '''
-        if self.random:
-            result = self.random
-            self.random = None
-            return result
-        return self.get_random_static_host()
+        self.hosts = {}
+        self.refreshing = set()
+
+    def set_host(self, test, policy, host, now=None):
+        ''' Sets the host of test discovered using policy '''
+        if now is None:
+            now = utils.ticks()
+        logging.debug('runner_hosts: %s host for %s: %s',
+                      policy or 'closest', test, host['fqdn'])
+        self.hosts[(test, policy)] = (host['fqdn'], now)
+
+    def set_closest_host(self, test, host):
+        ''' Sets the closest M-Lab host for test '''
+        self.set_host(test, '', host)
+
+    def set_random_host(self, test, host):
+        ''' Sets one random M-Lab host for test '''
+        self.set_host(test, 'random', host)
+
+    def _age(self, test, policy, now):
+        ''' Returns the age of the host of test and policy, or None '''
+        key = (test, policy)
+        if key not in self.hosts:
+            return None
+        if now is None:
+            now = utils.ticks()
+        age = now - self.hosts[key][1]
+        if age > MAX_STALE[policy]:
+            del self.hosts[key]
+            return None
+        return age
+
+    def has_host(self, test, policy, now=None):
+        ''' Returns True if we have a usable host for test and policy '''
+        return self._age(test, policy, now) is not None
+
+    def needs_refresh(self, test, policy, now=None):
+        ''' Returns True if the host of test and policy is missing or
+            stale, and nobody is refreshing it '''
+        if (test, policy) in self.refreshing:
+            return False
+        age = self._age(test, policy, now)
+        return age is None or age > TTL[policy]
+
+    def begin_refresh(self, test, policy):
+        ''' Take note that we're refreshing test and policy and return
+            False if someone else is already doing that '''
+        if (test, policy) in self.refreshing:
+            return False
+        self.refreshing.add((test, policy))
+        return True
+
+    def end_refresh(self, test, policy):
+        ''' Take note that we're done refreshing test and policy '''
+        self.refreshing.discard((test, policy))
+
+    def get_host(self, test, policy, now=None):
+        ''' Return the host of test and policy or None '''
+        if self._age(test, policy, now) is None:
+            return None
+        if policy == 'random':
+            return self.hosts.pop((test, policy))[0]
+        return self.hosts[(test, policy)][0]
+
+    def get_closest_host(self, test):
+        ''' Return the closest host for test '''
+        return self.get_host(test, '') or self.get_random_static_host()
+
+    def get_random_host(self, test):
+        ''' Return one random host for test '''
+        return self.get_host(test, 'random') or self.get_random_static_host()
 
     @staticmethod
     def get_random_static_host():
@@ -23,7 +23,10 @@
 
 '''
   Runner for mlab-ns service (which allows to discover the closest M-Lab
-  node, or a random node).
+  node, or a random node).  The discovered host is saved for the test in
+  extra['test'], if any.  When extra['background'] is set, the runner
+  refreshes the discovery cache without telling the runner that a test
+  is done (see prefetch()).
 '''
 
 # Python3-ready: yes
@@ -58,13 +61,14 @@ class RunnerMlabns(HttpClient):
         extra['address'] = endpoint[0]
         extra['port'] = endpoint[1]
         extra['requests'] = 0
+        extra.setdefault('test', '')
         if extra['policy'] not in ('random', ''):
             raise RuntimeError('runner_mlabns: unknown policy')
         return HttpClient.connect(self, endpoint, prefer_ipv6, sslconfig, extra)
 
     def handle_connect_error(self, connector):
         logging.info('runner_mlabns: server discovery... connect() failed')
-        NOTIFIER.publish('testdone')  # Tell the runner we're done
+        _discovery_done(connector.extra)
 
     def handle_connect(self, connector, sock, rtt, sslconfig, extra):
         self.create_stream(sock, self.handle_connection_made,
@@ -74,7 +78,7 @@ class RunnerMlabns(HttpClient):
     def handle_connection_lost(stream):
         ''' Invoked when the connection is lost '''
         logging.info('runner_mlabns: server discovery... complete')
-        NOTIFIER.publish('testdone')  # Tell the runner we're done
+        _discovery_done(stream.opaque.extra)
 
     def handle_connection_made(self, stream):
         ''' Invoked when the connection is established '''
@@ -112,11 +116,30 @@ class RunnerMlabns(HttpClient):
         response = json.loads(content)
         http_utils.prettyprint_json(response, '<')
         if extra['policy'] == 'random':
-            RUNNER_HOSTS.set_random_host(response)
+            RUNNER_HOSTS.set_random_host(extra['test'], response)
         else:
-            RUNNER_HOSTS.set_closest_host(response)
+            RUNNER_HOSTS.set_closest_host(extra['test'], response)
         stream.close()
 
+def _discovery_done(extra):
+    ''' Invoked when the discovery is complete '''
+    if extra.get('background'):
+        RUNNER_HOSTS.end_refresh(extra['test'], extra['policy'])
+    else:
+        NOTIFIER.publish('testdone')  # Tell the runner we're done
+
+def prefetch(test, policy, prefer_ipv6):
+    ''' Refresh in background the host of test and policy, if needed '''
+    if not RUNNER_HOSTS.needs_refresh(test, policy):
+        return
+    if not RUNNER_HOSTS.begin_refresh(test, policy):
+        return
+    logging.debug('runner_mlabns: prefetch host for %s, policy "%s"',
+                  test, policy)
+    handler = RunnerMlabns()
+    handler.connect(('mlab-ns.appspot.com', 80), prefer_ipv6, 0,
+                    {'test': test, 'policy': policy, 'background': True})
+
 USAGE = 'usage: neubot runner_mlabns [-6Sv] [-A address] [-P policy] [-p port]'
 
 def main(args):
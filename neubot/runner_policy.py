@@ -48,6 +48,10 @@ class RunnerPolicy(object):
         self.sequence.rotate()
         return selected
 
+    def peek_next_test(self):
+        ''' Returns the test that get_next_test() will return next '''
+        return self.sequence[0]
+
     def get_random_test(self):
         ''' Returns one test at random '''
         selected = random.choice(self.sequence)
@@ -59,7 +59,7 @@ class RunnerTests(object):
             self.avail.clear()
             return result
         else:
-            fqdn = RUNNER_HOSTS.get_random_static_host()
+            fqdn = RUNNER_HOSTS.get_closest_host(test)
             endpoint = (fqdn, 8080)
             uri = 'http://%s/' % utils_net.format_epnt(endpoint)
             return uri
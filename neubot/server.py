@@ -28,6 +28,7 @@ the negotiate server and the test server.
 
 import gc
 import getopt
+import signal
 import sys
 import logging
 
@@ -85,8 +86,7 @@ class DebugAPI(ServerHTTP):
                     'gc_count2': counts[2],
 
                     # Add the length of the most relevant globals
-                    'NEGOTIATE_SERVER.queue': len(NEGOTIATE_SERVER.queue),
-                    'NEGOTIATE_SERVER.known': len(NEGOTIATE_SERVER.known),
+                    'NEGOTIATE_SERVER.sched': len(NEGOTIATE_SERVER.sched),
                     'NEGOTIATE_SERVER_BITTORRENT.peers': \
                         len(NEGOTIATE_SERVER_BITTORRENT.peers),
                     'NEGOTIATE_SERVER_SPEEDTEST.clients': \
@@ -98,7 +98,19 @@ class DebugAPI(ServerHTTP):
                     'NOTIFIER._timestamps': len(NOTIFIER._timestamps),
                     'NOTIFIER._subscribers': len(NOTIFIER._subscribers),
                     'NOTIFIER._tofire': len(NOTIFIER._tofire),
-                    'STATE._events': len(STATE._events),
+                    'STATE.events': len(STATE.events),
+                   }
+
+        elif request.uri == '/debug/rendezvous':
+            body = neubot.rendezvous.server.CACHE.snap()
+
+        elif request.uri == '/debug/poller':
+            debuginfo = {}
+            POLLER.snap(debuginfo)
+            body = {
+                    'readset': len(POLLER.readset),
+                    'writeset': len(POLLER.writeset),
+                    'stats': debuginfo['poller'].get('stats'),
                    }
 
         elif request.uri == '/debugmem/garbage':
@@ -150,7 +162,7 @@ class ServerSideAPI(ServerHTTP):
             response.compose(code="200", reason="Ok", body=body,
                              mimetype="application/json")
         elif request.uri == "/sapi/state":
-            body = '{"queue_len_cur": %d}' % len(NEGOTIATE_SERVER.queue)
+            body = '{"queue_len_cur": %d}' % len(NEGOTIATE_SERVER.sched)
             response.compose(code="200", reason="Ok", body=body,
                              mimetype="application/json")
         else:
@@ -162,6 +174,7 @@ SETTINGS = {
     "server.bittorrent": True,
     "server.daemonize": True,
     'server.debug': False,
+    'server.instrument': False,
     "server.negotiate": True,
     "server.raw": True,
     "server.rendezvous": False,         # Not needed on the random server
@@ -181,6 +194,7 @@ valid defines:
   server.bittorrent Set to nonzero to enable BitTorrent server (default: 1)
   server.daemonize  Set to nonzero to run in the background (default: 1)
   server.debug      Set to nonzero to enable debug API (default: 0)
+  server.instrument Set to nonzero to time the poller callbacks (default: 0)
   server.negotiate  Set to nonzero to enable negotiate server (default: 1)
   server.raw        Set to nonzero to enable RAW server (default: 1)
   server.rendezvous Set to nonzero to enable rendezvous server (default: 0)
@@ -188,8 +202,8 @@ valid defines:
   server.speedtest  Set to nonzero to enable speedtest server (default: 1)'''
 
 VALID_MACROS = ('server.bittorrent', 'server.daemonize', 'server.debug',
-                'server.negotiate', 'server.raw', 'server.rendezvous',
-                'server.sapi', 'server.speedtest')
+                'server.instrument', 'server.negotiate', 'server.raw',
+                'server.rendezvous', 'server.sapi', 'server.speedtest')
 
 def main(args):
     """ Starts the server module """
@@ -299,6 +313,14 @@ def main(args):
         server.configure(conf)
         HTTP_SERVER.register_child(server, "/sapi")
 
+    #
+    # Time the callbacks dispatched by the poller, log the slow
+    # ones, and make the statistics available via /debug/poller.
+    #
+    if CONFIG['server.instrument']:
+        logging.info('server: timing the poller callbacks')
+        POLLER.instrument()
+
     #
     # Create localhost-only debug server
     #
@@ -317,7 +339,12 @@ def main(args):
         system.go_background()
 
     system.drop_privileges()
+
+    # Break out of the loop on SIGTERM, so that we flush results
+    signal.signal(signal.SIGTERM, lambda signo, frame: POLLER.break_loop())
+
     POLLER.loop()
+    BACKEND.close()
 
 if __name__ == "__main__":
     main(sys.argv)
@@ -25,6 +25,7 @@
 # Python3-ready: yes
 
 import logging
+import os
 import ssl
 import sys
 
@@ -37,6 +38,83 @@ from neubot.pollable import WANT_READ
 from neubot.pollable import WANT_WRITE
 from neubot.poller import POLLER
 
+from neubot import six
+
+#
+# We share one SSLContext per certificate (and one for the client
+# side), because OpenSSL keeps the server-side session cache and the
+# session ticket keys in the context: with a new context for each
+# connection, clients could never resume their sessions.  On the
+# client side, we remember the last session with each server and we
+# offer it at the next connection, so that the server can skip the
+# full handshake.  This needs ssl.SSLSession (i.e. Python >= 3.6);
+# with older versions, we only share the context.  Versions without
+# SSLContext (i.e. Python < 2.7.9) still use SSLSocket directly.
+#
+
+# Maximum number of servers whose session we remember
+MAX_SESSIONS = 256
+
+CONTEXTS = {}
+SESSIONS = six.OrderedDict()
+
+def get_context(sslcert):
+    ''' Returns the shared context for sslcert (the empty string
+        means client side), or None if there is no SSLContext '''
+    if not hasattr(ssl, 'SSLContext'):
+        return None
+    mtime = os.stat(sslcert).st_mtime if sslcert else None
+    entry = CONTEXTS.get(sslcert)
+    if entry is None or entry[0] != mtime:
+        # Note: PROTOCOL_SSLv23 is the default of wrap_socket()
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        if sslcert:
+            context.load_cert_chain(sslcert)
+        entry = CONTEXTS[sslcert] = (mtime, context)
+    return entry[1]
+
+def wrap_socket(sock, sslcert, peer):
+    ''' Wrap sock, acting as server if sslcert is not empty; on the
+        client side, try to resume the last session with peer '''
+    context = get_context(sslcert)
+    if context is None:
+        # Note: SSLSocket() wants None, and not '', for no certfile
+        return ssl.SSLSocket(sock, do_handshake_on_connect=False,
+                             certfile=sslcert or None,
+                             server_side=bool(sslcert))
+    if sslcert:
+        return context.wrap_socket(sock, server_side=True,
+                                   do_handshake_on_connect=False)
+    session = SESSIONS.get(peer)
+    if session is not None:
+        return context.wrap_socket(sock, do_handshake_on_connect=False,
+                                   session=session)
+    return context.wrap_socket(sock, do_handshake_on_connect=False)
+
+def save_session(sock, peer):
+    ''' Remember the session of the client socket sock with peer '''
+    #
+    # We do that when closing the connection, because with TLS 1.3
+    # the server sends the session tickets after the handshake.
+    #
+    session = getattr(sock, 'session', None)
+    if not peer or session is None:
+        return
+    SESSIONS.pop(peer, None)
+    SESSIONS[peer] = session
+    while len(SESSIONS) > MAX_SESSIONS:
+        SESSIONS.popitem(last=False)
+
+def snap(data):
+    ''' Take a snapshot of the contexts and of the sessions '''
+    data['sslstream'] = {
+                         'contexts': dict((sslcert or 'client',
+                                           entry[1].session_stats())
+                                          for sslcert, entry in
+                                          CONTEXTS.items()),
+                         'sessions': len(SESSIONS),
+                        }
+
 class SSLWrapper(object):
     ''' Wrapper for an SSL socket '''
 
@@ -47,12 +125,14 @@ class SSLWrapper(object):
     # with the same (simple) socket interface.
     #
 
-    def __init__(self, sock):
+    def __init__(self, sock, peer=None):
         self.sock = sock
+        self.peer = peer
 
     def close(self):
         ''' Wrapper for SSL_close() '''
         try:
+            save_session(self.sock, self.peer)
             self.sock.close()
         except (KeyboardInterrupt, SystemExit):
             raise
@@ -136,19 +216,11 @@ def initialise(stream, sock, sslcert):
 
     logging.debug('stream_ssl: initialise()')
 
-    #
-    # Do not use '' to indicate no certfile, because wrap_socket() only
-    # recognizes None for that purpose.  Instead, the empty string is
-    # taken as the path for the certificate and the call raises an error.
-    #
+    peer = None
     if not sslcert:
-        server_side = False
-        sslcert = None
-    else:
-        server_side = True
+        peer = stream.peername
 
-    stream.sock = SSLWrapper(ssl.SSLSocket(sock, do_handshake_on_connect=False,
-                                   certfile=sslcert, server_side=server_side))
+    stream.sock = SSLWrapper(wrap_socket(sock, sslcert, peer), peer)
 
     handshaker = Handshaker(stream)
     handshaker.handshake()
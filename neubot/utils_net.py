@@ -92,7 +92,7 @@ def addrinfo_key(ainfo):
     ''' Map addrinfo to protocol family '''
     return COMPARE_AF[ainfo[0]]
 
-def listen(epnt, prefer_ipv6):
+def listen(epnt, prefer_ipv6, backlog=128):
     ''' Listen to all sockets represented by epnt '''
 
     logging.debug('listen(): about to listen to: %s', str(epnt))
@@ -106,7 +106,8 @@ def listen(epnt, prefer_ipv6):
     # Allow to listen on a list of addresses
     if epnt[0] and ' ' in epnt[0]:
         for address in epnt[0].split():
-            result = listen((address.strip(), epnt[1]), prefer_ipv6)
+            result = listen((address.strip(), epnt[1]), prefer_ipv6,
+                            backlog)
             sockets.extend(result)
         return sockets
 
@@ -135,8 +136,7 @@ def listen(epnt, prefer_ipv6):
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             sock.setblocking(False)
             sock.bind(ainfo[4])
-            # Probably the backlog here is too big
-            sock.listen(128)
+            sock.listen(backlog)
 
             logging.debug('listen(): listening at: %s', format_epnt(ainfo[4]))
             sockets.append(sock)
@@ -154,18 +154,9 @@ def listen(epnt, prefer_ipv6):
 
     return sockets
 
-def connect(epnt, prefer_ipv6):
-    ''' Connect to epnt '''
-
-    logging.debug('connect(): about to connect to: %s', str(epnt))
-
-    try:
-        addrinfo = socket.getaddrinfo(epnt[0], epnt[1], socket.AF_UNSPEC,
-                                      socket.SOCK_STREAM)
-    except socket.error:
-        logging.error('connect(): cannot connect to %s',
-                      format_epnt(epnt), exc_info=1)
-        return None
+def sort_addrinfo(addrinfo, prefer_ipv6):
+    ''' Returns the usable addrinfo, interleaving address families
+        and starting with the preferred one '''
 
     message = ['connect(): getaddrinfo() returned: [']
     for ainfo in addrinfo:
@@ -174,33 +165,62 @@ def connect(epnt, prefer_ipv6):
     message[-1] = ']'
     logging.debug(''.join(message))
 
-    addrinfo.sort(key=addrinfo_key, reverse=prefer_ipv6)
-
-    for ainfo in addrinfo:
-        try:
-            logging.debug('connect(): trying with: %s', format_ainfo(ainfo))
+    addrinfo = [ainfo for ainfo in addrinfo if ainfo[0] in COMPARE_AF]
+    if not addrinfo:
+        return addrinfo
 
-            sock = socket.socket(ainfo[0], socket.SOCK_STREAM)
-            sock.setblocking(False)
-            result = sock.connect_ex(ainfo[4])
-            if result not in INPROGRESS:
-                raise socket.error(result, os.strerror(result))
+    # Alternate address families (RFC 8305, Sect. 4)
+    addrinfo.sort(key=addrinfo_key, reverse=prefer_ipv6)
+    first = [ainfo for ainfo in addrinfo if ainfo[0] == addrinfo[0][0]]
+    second = [ainfo for ainfo in addrinfo if ainfo[0] != addrinfo[0][0]]
+    result = []
+    while first or second:
+        if first:
+            result.append(first.pop(0))
+        if second:
+            result.append(second.pop(0))
+    return result
+
+def connect_ainfo(ainfo):
+    ''' Start a non-blocking connect() to ainfo and return the
+        socket, or None on failure '''
+    try:
+        logging.debug('connect(): trying with: %s', format_ainfo(ainfo))
 
-            logging.debug('connect(): connection to %s in progress...',
-                          format_epnt(ainfo[4]))
-            return sock
+        sock = socket.socket(ainfo[0], socket.SOCK_STREAM)
+        sock.setblocking(False)
+        result = sock.connect_ex(ainfo[4])
+        if result not in INPROGRESS:
+            raise socket.error(result, os.strerror(result))
 
-        except socket.error:
-            logging.warning('connect(): cannot connect to %s',
-              format_epnt(ainfo[4]), exc_info=1)
-        except:
-            logging.warning('connect(): cannot connect to %s',
-              format_epnt(ainfo[4]), exc_info=1)
+        logging.debug('connect(): connection to %s in progress...',
+                      format_epnt(ainfo[4]))
+        return sock
 
-    logging.error('connect(): cannot connect to %s: %s',
-      format_epnt(epnt), 'all attempts failed')
+    except socket.error:
+        logging.warning('connect(): cannot connect to %s',
+          format_epnt(ainfo[4]), exc_info=1)
+    except:
+        logging.warning('connect(): cannot connect to %s',
+          format_epnt(ainfo[4]), exc_info=1)
     return None
 
+def socketpair():
+    ''' Returns a pair of connected sockets, using the loopback on
+        systems without socket.socketpair(), i.e. Windows '''
+    if hasattr(socket, 'socketpair'):
+        return socket.socketpair()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        first = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        first.connect(getsockname(listener))
+        second = listener.accept()[0]
+    finally:
+        listener.close()
+    return first, second
+
 def isconnected(endpoint, sock):
     ''' Check whether connect() succeeded '''
 
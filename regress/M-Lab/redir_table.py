@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for M-Lab/redir_table.py '''
+
+import imp
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+# M-Lab is not a package, so we cannot import it
+REDIR_TABLE = imp.load_source('redir_table', 'M-Lab/redir_table.py')
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+TORINO = (45.07, 7.69)
+SLIVERS = {
+           '1.1.1.1': (45.63, 8.72),        # Milano (MXP)
+           '2.2.2.2': (49.0, 2.55),         # Paris (CDG)
+           '3.3.3.3': (-33.95, 151.18),     # Sydney (SYD)
+          }
+
+class TestDistance(unittest.TestCase):
+    ''' Regression test for distance() '''
+
+    def test_known(self):
+        ''' Make sure distance() works for known pairs '''
+        distance = REDIR_TABLE.distance
+        self.assertAlmostEqual(distance((0, 0), (0, 90)), 10007.543, 3)
+        self.assertAlmostEqual(distance((90, 0), (-90, 0)), 20015.087, 3)
+        self.assertAlmostEqual(distance((51.5074, -0.1278),
+                                        (48.8566, 2.3522)), 343.556, 3)
+        self.assertEqual(distance(TORINO, TORINO), 0.0)
+        self.assertEqual(distance(TORINO, SLIVERS['1.1.1.1']),
+                         distance(SLIVERS['1.1.1.1'], TORINO))
+
+class TestAirports(unittest.TestCase):
+    ''' Regression test for the airport code lookup '''
+
+    def test_airport_code(self):
+        ''' Make sure we extract the airport code of a node '''
+        self.assertEqual(REDIR_TABLE.airport_code(
+                         'mlab1.trn01.measurement-lab.org'), 'trn')
+        self.assertEqual(REDIR_TABLE.airport_code(
+                         'mlab3.lga02.measurement-lab.org'), 'lga')
+
+    def test_coords(self):
+        ''' Make sure every node has the coordinates of its airport '''
+        airports = REDIR_TABLE.load_coords('M-Lab/airports_coords.dat')
+        self.assertEqual(airports['trn'], (45.201, 7.650))
+        filep = open('M-Lab/servers.dat', 'rb')
+        for line in filep:
+            fqdn = line.split()[0]
+            self.assertTrue(REDIR_TABLE.airport_code(fqdn) in airports)
+        filep.close()
+
+class TestNearestSlivers(unittest.TestCase):
+    ''' Regression test for nearest_slivers() '''
+
+    def test_nearest(self):
+        ''' Make sure we pick the nearest slivers, the nearest more
+            times than the others '''
+        self.assertEqual(REDIR_TABLE.nearest_slivers(TORINO, SLIVERS, 2),
+                         ['1.1.1.1'] * 4 + ['2.2.2.2'] * 2)
+
+    def test_far(self):
+        ''' Make sure far slivers are listed at least once '''
+        self.assertEqual(REDIR_TABLE.nearest_slivers(TORINO, SLIVERS, 3),
+                         ['1.1.1.1'] * 4 + ['2.2.2.2'] * 2 + ['3.3.3.3'])
+
+    def test_count(self):
+        ''' Make sure we don't return more slivers than we have '''
+        self.assertEqual(set(REDIR_TABLE.nearest_slivers(TORINO, SLIVERS,
+                         10)), set(SLIVERS))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/aggregate.py '''
+
+import unittest
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.database import table_raw
+from neubot.database import table_speedtest
+from neubot import aggregate
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+def _make_rows(count, step=60, addresses=("1.2.3.4",)):
+    ''' Make a list of fake speedtest rows '''
+    rows = []
+    for index in range(count):
+        rows.append({
+                     "timestamp": 1356998400 + index * step,
+                     "real_address": addresses[index % len(addresses)],
+                     "download_speed": float(index),
+                     "upload_speed": None,
+                    })
+    return rows
+
+class TestSelectFields(unittest.TestCase):
+    ''' Regression tests for aggregate.select_fields() '''
+
+    def test_default(self):
+        ''' Make sure we select only the fields in the template '''
+        self.assertEqual(aggregate.select_fields(table_speedtest.TEMPLATE),
+          ["download_speed", "upload_speed", "latency", "connect_time"])
+        self.assertEqual(aggregate.select_fields(table_raw.TEMPLATE),
+          ["download_speed", "latency", "connect_time"])
+
+    def test_invalid(self):
+        ''' Make sure we reject fields not in the template '''
+        self.assertRaises(ValueError, aggregate.select_fields,
+                          table_raw.TEMPLATE, ["upload_speed"])
+        self.assertRaises(ValueError, aggregate.select_fields,
+                          table_raw.TEMPLATE, ["json_data"])
+
+class TestDownsample(unittest.TestCase):
+    ''' Regression tests for aggregate.downsample() '''
+
+    def test_small(self):
+        ''' Make sure we don't touch short series '''
+        rows = _make_rows(10)
+        self.assertEqual(len(aggregate.downsample(rows, 20,
+                         "download_speed")), 10)
+        self.assertEqual(len(aggregate.downsample(rows, 0,
+                         "download_speed")), 10)
+
+    def test_threshold(self):
+        ''' Make sure we return exactly threshold points '''
+        result = aggregate.downsample(_make_rows(1000), 50, "download_speed")
+        self.assertEqual(len(result), 50)
+        self.assertEqual(result[0]["download_speed"], 999.0)
+        self.assertEqual(result[-1]["download_speed"], 0.0)
+        for index in range(1, len(result)):
+            self.assertTrue(result[index - 1]["timestamp"] >
+                            result[index]["timestamp"])
+
+    def test_peak(self):
+        ''' Make sure LTTB keeps a spike '''
+        rows = _make_rows(1000)
+        for row in rows:
+            row["download_speed"] = 1.0
+        rows[500]["download_speed"] = 100.0
+        result = aggregate.downsample(rows, 10, "download_speed")
+        self.assertTrue(rows[500] in result)
+
+    def test_group_by(self):
+        ''' Make sure we downsample each group separately '''
+        rows = _make_rows(1000, addresses=("1.2.3.4", "5.6.7.8"))
+        result = aggregate.downsample(rows, 10, "download_speed",
+                                      "real_address")
+        self.assertEqual(len(result), 20)
+
+if __name__ == '__main__':
+    unittest.main()
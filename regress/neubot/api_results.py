@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/api_results.py '''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.compat import json
+from neubot.utils_api import NotImplementedTest
+
+from neubot import api_results
+
+#
+# We're accessing private members of `api_results` for testing and we
+# don't maintain unittest, so we don't care about the number of methods.
+#
+# pylint: disable=W0212,R0904
+#
+
+class FakeStream(object):
+    ''' Fake stream that records the response '''
+
+    def __init__(self):
+        self.response = None
+
+    def send_response(self, request, response):
+        ''' Record the response '''
+        self.response = response
+
+# Fake mtime, incremented at each _touch(), to avoid sleeping
+MTIME = [1356998400]
+
+def _touch(path):
+    ''' Make sure that the mtime of path changes '''
+    MTIME[0] += 1
+    os.utime(path, (MTIME[0], MTIME[0]))
+
+def _write(path, content):
+    ''' Write content into path '''
+    filep = open(path, 'wb')
+    filep.write(content)
+    filep.close()
+    _touch(path)
+
+def _call(query):
+    ''' Call api_results() and return the decoded body '''
+    stream = FakeStream()
+    api_results.api_results(stream, None, query)
+    return json.loads(stream.response.body)
+
+class TestCache(unittest.TestCase):
+    ''' Make sure the cache is invalidated when files change '''
+
+    def setUp(self):
+        self.saved_testdir = api_results.TESTDIR
+        api_results.TESTDIR = tempfile.mkdtemp()
+        api_results._FILES.clear()
+        api_results._RESPONSES.clear()
+        self.path = os.path.join(api_results.TESTDIR, 'foo.json')
+        _write(self.path, '{"title": "Foo"}')
+
+    def tearDown(self):
+        shutil.rmtree(api_results.TESTDIR)
+        api_results.TESTDIR = self.saved_testdir
+
+    def test_cached(self):
+        ''' Make sure that we don't read twice the same file '''
+        self.assertEqual(_call('test=foo')['title'], 'Foo')
+        saved_read_json = api_results._read_json
+        api_results._read_json = None
+        try:
+            self.assertEqual(_call('test=foo')['title'], 'Foo')
+            self.assertEqual(_call('test=foo&debug=1')['title'], 'Foo')
+        finally:
+            api_results._read_json = saved_read_json
+        self.assertEqual(len(api_results._RESPONSES), 2)
+
+    def test_modified(self):
+        ''' Make sure that we notice modified files '''
+        self.assertEqual(_call('test=foo')['title'], 'Foo')
+        _write(self.path, '{"title": "Bar"}')
+        self.assertEqual(_call('test=foo')['title'], 'Bar')
+
+    def test_local(self):
+        ''' Make sure that we notice .local and .html files '''
+        self.assertFalse('description' in _call('test=foo'))
+        _write(self.path + '.local', '{"title": "Local"}')
+        _write(self.path.replace('.json', '.html'), '<p>Foo</p>')
+        body = _call('test=foo')
+        self.assertEqual(body['title'], 'Local')
+        self.assertEqual(body['description'], '<p>Foo</p>')
+        os.unlink(self.path + '.local')
+        self.assertEqual(_call('test=foo')['title'], 'Foo')
+
+    def test_new_test(self):
+        ''' Make sure that we notice new tests '''
+        self.assertRaises(NotImplementedTest, _call, 'test=bar')
+        _write(os.path.join(api_results.TESTDIR, 'bar.json'), '{}')
+        _touch(api_results.TESTDIR)
+        self.assertEqual(sorted(_call('test=bar')['available_tests']),
+                         ['bar', 'foo'])
+
+if __name__ == '__main__':
+    unittest.main()
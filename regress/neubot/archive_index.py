@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/archive_index.py '''
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.compat import json
+from neubot import archive
+from neubot import archive_index
+from neubot import backend_mlab
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+# 2013-04-05 14:00:00 UTC
+THETIME = 1365170400
+
+class FakeFilesys(object):
+    ''' Fake filesystem that creates files below datadir '''
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+
+    def datadir_touch(self, components):
+        ''' Create the directories and the file '''
+        fullpath = os.path.join(self.datadir, *components)
+        dirname = os.path.dirname(fullpath)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        open(fullpath, 'ab').close()
+        return fullpath
+
+def _speedtest(timestamp, address):
+    ''' Make a fake result of the speedtest test '''
+    return {
+            'timestamp': timestamp,
+            'uuid': '7528d674-25f0-4ac4-aff6-46f446034d81',
+            'internal_address': '10.0.0.1',
+            'real_address': address,
+            'remote_address': '130.192.91.211',
+            'privacy_informed': 1,
+            'privacy_can_collect': 1,
+            'privacy_can_publish': 1,
+            'connect_time': 0.02,
+            'latency': 0.03,
+            'download_speed': 1000000.0,
+            'upload_speed': 500000.0,
+            'platform': 'linux2',
+            'neubot_version': '0.004015007',
+           }
+
+class TestArchiveIndex(unittest.TestCase):
+    ''' Regression test for archive_index '''
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.writer = backend_mlab.ArchiveWriter(FakeFilesys(self.datadir))
+        self.connection = archive_index.connect(':memory:')
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.datadir)
+
+    def _store(self, count, offset=0):
+        ''' Store count results and wait for them to be written '''
+        for index in range(offset, offset + count):
+            self.writer.store('speedtest', _speedtest(THETIME + index,
+                              '130.192.91.%d' % (index % 2)), THETIME + index)
+        self.writer.flush()
+
+    def test_query(self):
+        ''' Make sure we can query by time, test and address '''
+        self._store(10)
+        self.assertEqual(archive_index.update(self.connection,
+                                              self.datadir), 10)
+        rows = archive_index.query(self.connection, since=THETIME + 2,
+                                   until=THETIME + 6, test='speedtest',
+                                   address='130.192.91.0')
+        self.assertEqual([row['timestamp'] for row in rows],
+                         [THETIME + 2, THETIME + 4])
+        self.assertEqual(archive_index.query(self.connection, test='raw'), [])
+        document = archive_index.fetch(self.datadir, rows[1])
+        self.assertEqual(document, _speedtest(THETIME + 4, '130.192.91.0'))
+
+    def test_incremental(self):
+        ''' Make sure we only read the members appended later '''
+        self._store(3)
+        archive_index.update(self.connection, self.datadir)
+        self.assertEqual(archive_index.update(self.connection,
+                                              self.datadir), 0)
+        self._store(2, 3)
+        self.assertEqual(archive_index.update(self.connection,
+                                              self.datadir), 2)
+        rows = archive_index.query(self.connection)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(len(set(row['member'] for row in rows)), 2)
+
+    def test_truncated(self):
+        ''' Make sure we skip a member that is being written '''
+        self._store(2)
+        path = os.path.join(self.datadir, *backend_mlab.archive_components(
+                            'speedtest', THETIME))
+        complete = os.path.getsize(path)
+        filep = open(path, 'ab')
+        filep.write('\x1f\x8b\x08\x00')
+        filep.close()
+        self.assertEqual(archive_index.update(self.connection,
+                                              self.datadir), 2)
+        row = self.connection.execute('SELECT offset FROM files;').fetchone()
+        self.assertEqual(row[0], complete)
+
+    def test_old_archives(self):
+        ''' Make sure we can read archives with a single document '''
+        os.makedirs(os.path.join(self.datadir, '2013', '04', '05'))
+        path = os.path.join(self.datadir, '2013', '04', '05',
+                            '20130405T14:00:01.123456789Z_speedtest.gz')
+        filep = gzip.open(path, 'wb')
+        json.dump(_speedtest(THETIME + 1, '130.192.91.1'), filep)
+        filep.close()
+        self.assertEqual(archive_index.update(self.connection,
+                                              self.datadir), 1)
+        self.assertEqual(archive.test_of(path), 'speedtest')
+
+    def test_removed(self):
+        ''' Make sure we forget the archives that were removed '''
+        self._store(2)
+        archive_index.update(self.connection, self.datadir)
+        self.writer.close()
+        shutil.rmtree(os.path.join(self.datadir, '2013'))
+        archive_index.update(self.connection, self.datadir)
+        self.assertEqual(archive_index.query(self.connection), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/archive_ingest.py '''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.compat import json
+from neubot.database import table_raw
+from neubot.database import table_speedtest
+from neubot import archive_ingest
+from neubot import backend_mlab
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+# 2013-04-05 14:00:00 UTC
+THETIME = 1365170400
+
+class FakeFilesys(object):
+    ''' Fake filesystem that creates files below datadir '''
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+
+    def datadir_touch(self, components):
+        ''' Create the directories and the file '''
+        fullpath = os.path.join(self.datadir, *components)
+        dirname = os.path.dirname(fullpath)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        open(fullpath, 'ab').close()
+        return fullpath
+
+def _speedtest(timestamp):
+    ''' Make a fake result of the speedtest test '''
+    return {
+            'timestamp': timestamp,
+            'uuid': '7528d674-25f0-4ac4-aff6-46f446034d81',
+            'real_address': '130.192.91.231',
+            'download_speed': 1000000.0,
+            'upload_speed': 500000.0,
+            'extra': 'ignored',
+           }
+
+def _raw(thetime):
+    ''' Make a fake result of the raw test '''
+    # Note: ticks come from a monotonic clock, not from the wall clock
+    ticks = 4242.5 + thetime - THETIME
+    return {
+        'client': {
+            'alrtt_avg': 0.03,
+            'connect_time': 0.02,
+            'goodput': {'bytesdiff': 1000000, 'timediff': 2.0,
+                        'ticks': ticks},
+            'goodput_snap': [{'ticks': ticks + index * 0.25,
+                              'bytesdiff': 65536 * index,
+                              'timediff': 0.25} for index in range(8)],
+            'myname': '10.0.0.1',
+            'platform': 'linux2',
+            'uuid': '7528d674-25f0-4ac4-aff6-46f446034d81',
+            'version': '0.004015007',
+        },
+        'server': {
+            'goodput': {'bytesdiff': 1000000, 'timediff': 2.0,
+                        'ticks': ticks},
+            'myname': '130.192.91.211',
+            'peername': '130.192.91.231',
+            'timestamp': thetime,
+        },
+    }
+
+class TestArchiveIngest(unittest.TestCase):
+    ''' Regression test for archive_ingest '''
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.writer = backend_mlab.ArchiveWriter(FakeFilesys(self.datadir))
+        self.connection = archive_ingest.connect(':memory:')
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.datadir)
+
+    def _store(self, test, factory, hours, offset=0):
+        ''' Store one result per hour and wait for them '''
+        for hour in range(offset, offset + hours):
+            thetime = THETIME + hour * 3600
+            self.writer.store(test, factory(thetime), thetime)
+        self.writer.flush()
+
+    def test_ingest(self):
+        ''' Make sure we load and normalize the results '''
+        self._store('speedtest', _speedtest, 3)
+        self._store('raw', _raw, 2)
+        self.assertEqual(archive_ingest.ingest(self.connection,
+                                               self.datadir, 2), 5)
+        rows = table_speedtest.listify(self.connection)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['timestamp'], THETIME + 2 * 3600)
+        self.assertEqual(rows[0]['download_speed'], 1000000.0)
+        self.assertEqual(rows[0]['privacy_informed'], None)
+        rows = table_raw.listify(self.connection, series=True)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(sorted(row['timestamp'] for row in rows),
+                         [THETIME, THETIME + 3600])
+        self.assertEqual(json.loads(rows[1]['json_data']),
+                         json.loads(json.dumps(_raw(THETIME))))
+
+    def test_checkpoints(self):
+        ''' Make sure that we only load new results '''
+        self._store('speedtest', _speedtest, 2)
+        self.assertEqual(archive_ingest.ingest(self.connection,
+                                               self.datadir), 2)
+        self.assertEqual(archive_ingest.ingest(self.connection,
+                                               self.datadir), 0)
+        self._store('speedtest', _speedtest, 2, 1)
+        self.assertEqual(archive_ingest.ingest(self.connection,
+                                               self.datadir), 2)
+        self.assertEqual(len(table_speedtest.listify(self.connection)), 4)
+
+    def test_invalid(self):
+        ''' Make sure invalid results do not stop the others '''
+        self._store('raw', lambda thetime: {'server': {}}, 1)
+        self._store('raw', _raw, 1)
+        self.assertEqual(archive_ingest.ingest(self.connection,
+                                               self.datadir), 1)
+
+if __name__ == '__main__':
+    unittest.main()
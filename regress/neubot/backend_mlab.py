@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/backend_mlab.py '''
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.compat import json
+from neubot import backend_mlab
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+class FakeFilesys(object):
+    ''' Fake filesystem that counts datadir_touch() calls '''
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+        self.touched = []
+
+    def datadir_touch(self, components):
+        ''' Create the directories and the file '''
+        self.touched.append(components)
+        fullpath = os.path.join(self.datadir, *components)
+        dirname = os.path.dirname(fullpath)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        open(fullpath, 'ab').close()
+        return fullpath
+
+def _read(path):
+    ''' Read the documents saved into an archive '''
+    filep = gzip.open(path, 'rb')
+    lines = filep.read().splitlines()
+    filep.close()
+    return [json.loads(line) for line in lines]
+
+class TestArchiveWriter(unittest.TestCase):
+    ''' Regression test for ArchiveWriter '''
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.filesys = FakeFilesys(self.datadir)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def _path(self, test, thetime):
+        ''' Path of the archive '''
+        return os.path.join(self.datadir, *backend_mlab.archive_components(
+                                                     test, thetime))
+
+    def test_components(self):
+        ''' Make sure the archive is rotated every hour '''
+        self.assertEqual(backend_mlab.archive_components('raw', 1365170000),
+                         ['2013', '04', '05',
+                          '20130405T13:00:00.000000000Z_raw.gz'])
+
+    def test_append(self):
+        ''' Make sure results are appended to hourly archives '''
+        writer = backend_mlab.ArchiveWriter(self.filesys, batch=3)
+        for index in range(10):
+            writer.store('speedtest', {'index': index}, 1365170000 + index)
+        writer.store('raw', {'index': 10}, 1365170000)
+        writer.store('speedtest', {'index': 11}, 1365170000 + 3600)
+        writer.flush()
+        self.assertEqual(_read(self._path('speedtest', 1365170000)),
+                         [{'index': index} for index in range(10)])
+        self.assertEqual(_read(self._path('raw', 1365170000)),
+                         [{'index': 10}])
+        self.assertEqual(_read(self._path('speedtest', 1365173600)),
+                         [{'index': 11}])
+        # Directories and files are created once
+        self.assertEqual(len(self.filesys.touched), 3)
+        writer.close()
+
+    def test_removed(self):
+        ''' Make sure we recreate an archive that has been removed '''
+        writer = backend_mlab.ArchiveWriter(self.filesys)
+        writer.store('raw', {'index': 0}, 1365170000)
+        writer.flush()
+        shutil.rmtree(os.path.join(self.datadir, '2013'))
+        writer.store('raw', {'index': 1}, 1365170000)
+        writer.flush()
+        os.unlink(self._path('raw', 1365170000))
+        writer.store('raw', {'index': 2}, 1365170000)
+        writer.close()
+        self.assertEqual(_read(self._path('raw', 1365170000)),
+                         [{'index': 2}])
+        self.assertEqual(len(self.filesys.touched), 3)
+
+    def test_close(self):
+        ''' Make sure close() writes pending results '''
+        writer = backend_mlab.ArchiveWriter(self.filesys, delay=3600)
+        writer.store('bittorrent', {'index': 0}, 1365170000)
+        writer.close()
+        self.assertEqual(writer.thread, None)
+        self.assertEqual(_read(self._path('bittorrent', 1365170000)),
+                         [{'index': 0}])
+        writer.store('bittorrent', {'index': 1}, 1365170000)
+        writer.close()
+        self.assertEqual(_read(self._path('bittorrent', 1365170000)),
+                         [{'index': 0}, {'index': 1}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/connector.py '''
+
+import socket
+import sys
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.defer import Failure
+from neubot import connector
+from neubot import utils_net
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+IPV6 = (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('::1', 80, 0, 0))
+IPV4 = (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 80))
+
+class FakeSocket(object):
+    ''' Fake socket '''
+
+    def __init__(self, ainfo, fileno):
+        self.ainfo = ainfo
+        self.number = fileno
+        self.closed = False
+
+    def fileno(self):
+        ''' Returns the file descriptor '''
+        return self.number
+
+    def close(self):
+        ''' Close the socket '''
+        self.closed = True
+
+class FakeResolver(object):
+    ''' Resolver that always returns the same addresses '''
+
+    @staticmethod
+    def getaddrinfo(epnt, deferred):
+        ''' Resolve epnt '''
+        deferred.callback([IPV4, IPV6])
+
+class FakePoller(object):
+    ''' Poller that keeps track of what we ask '''
+
+    def __init__(self):
+        self.writeset = {}
+        self.tasks = []
+
+    def set_writable(self, stream):
+        ''' Monitor for writability '''
+        self.writeset[stream.fileno()] = stream
+
+    def unset_writable(self, stream):
+        ''' Stop monitoring for writability '''
+        self.writeset.pop(stream.fileno(), None)
+
+    def sched(self, delta, func, *args):
+        ''' Schedule task '''
+        self.tasks.append((delta, func, args))
+
+    def run_tasks(self):
+        ''' Run the scheduled tasks '''
+        tasks, self.tasks = self.tasks, []
+        for _, func, args in tasks:
+            func(*args)
+
+class TestSortAddrinfo(unittest.TestCase):
+    ''' Regression test for utils_net.sort_addrinfo '''
+
+    def test_interleave(self):
+        ''' Make sure we alternate families '''
+        addrinfo = [IPV4, IPV4, IPV6, IPV6, IPV6]
+        self.assertEqual(utils_net.sort_addrinfo(addrinfo, True),
+                         [IPV6, IPV4, IPV6, IPV4, IPV6])
+        self.assertEqual(utils_net.sort_addrinfo(addrinfo, False),
+                         [IPV4, IPV6, IPV4, IPV6, IPV6])
+
+class TestConnectRace(unittest.TestCase):
+    ''' Regression test for ConnectRace '''
+
+    def setUp(self):
+        self.saved = (connector.RESOLVER, utils_net.connect_ainfo,
+                      utils_net.isconnected)
+        self.sockets = []
+        self.refuse = set()
+        self.poller = FakePoller()
+        self.results = []
+        connector.RESOLVER = FakeResolver()
+        utils_net.connect_ainfo = self._connect_ainfo
+        utils_net.isconnected = lambda endpoint, sock: (
+          None if sock.ainfo in self.refuse else sock.ainfo[4])
+
+    def tearDown(self):
+        (connector.RESOLVER, utils_net.connect_ainfo,
+         utils_net.isconnected) = self.saved
+
+    def _connect_ainfo(self, ainfo):
+        ''' Pretend to start connecting '''
+        sock = FakeSocket(ainfo, len(self.sockets) + 3)
+        self.sockets.append(sock)
+        return sock
+
+    def _race(self):
+        ''' Create and start a race '''
+        race = connector.ConnectRace(self.poller, ('localhost', 80), 1,
+          lambda sock, ainfo, rtt: self.results.append(ainfo),
+          lambda: self.results.append(None))
+        race.start()
+        return race
+
+    def test_slow_ipv6(self):
+        ''' Make sure IPv4 wins when IPv6 is slow '''
+        self._race()
+        self.assertEqual(self.poller.writeset.keys(), [3])
+        self.poller.run_tasks()
+        self.assertEqual(sorted(self.poller.writeset.keys()), [3, 4])
+        self.poller.writeset[4].handle_write()
+        self.assertEqual(self.results, [IPV4])
+        self.assertEqual(self.poller.writeset, {})
+        self.assertTrue(self.sockets[0].closed)
+        self.assertFalse(self.sockets[1].closed)
+
+    def test_ipv6_first(self):
+        ''' Make sure IPv6 wins when it is fast '''
+        self._race()
+        self.poller.writeset[3].handle_write()
+        self.assertEqual(self.results, [IPV6])
+        self.poller.run_tasks()
+        self.assertEqual(len(self.sockets), 1)
+
+    def test_refused(self):
+        ''' Make sure we try the next address at once on failure '''
+        self.refuse.add(IPV6)
+        self._race()
+        self.poller.writeset[3].handle_write()
+        self.assertEqual(self.poller.writeset.keys(), [4])
+        self.poller.writeset[4].handle_write()
+        self.assertEqual(self.results, [IPV4])
+
+    def test_all_failed(self):
+        ''' Make sure we fail once when all addresses fail '''
+        self.refuse.update([IPV4, IPV6])
+        self._race()
+        self.poller.run_tasks()
+        self.poller.writeset[4].handle_close()
+        self.assertEqual(self.results, [])
+        self.poller.writeset[3].handle_write()
+        self.assertEqual(self.results, [None])
+
+    def test_unresolved(self):
+        ''' Make sure we fail when we cannot resolve the endpoint '''
+        connector.RESOLVER = self
+        self._race()
+        self.assertEqual(self.results, [None])
+        self.assertEqual(self.sockets, [])
+
+    @staticmethod
+    def getaddrinfo(epnt, deferred):
+        ''' Pretend that we cannot resolve epnt '''
+        try:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name not known')
+        except socket.gaierror:
+            deferred.errback(Failure())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -59,5 +59,145 @@ class TestRenameColumn(unittest.TestCase):
         self.assertEqual(query, 'CREATE TABLE Person (id INTEGER PRIMARY '
                                 'KEY, age INTEGER, surname TEXT, name TEXT)')
 
+class TestMakeSelect(unittest.TestCase):
+
+    ''' Regression test for make_select() '''
+
+    template = {
+                'timestamp': 0,
+                'name': '',
+               }
+
+    def test_cached(self):
+        ''' Make sure the query is cached by filter shape '''
+        query1 = _table_utils.make_select('Person', self.template,
+                                          since=10, desc=True)
+        query2 = _table_utils.make_select('Person', self.template,
+                                          since=20, desc=True)
+        query3 = _table_utils.make_select('Person', self.template,
+                                          since=20, until=30)
+        self.assertTrue(query1 is query2)
+        self.assertTrue(query1.endswith('WHERE timestamp >= :since '
+                                        'ORDER BY timestamp DESC;'))
+        self.assertTrue(query3.endswith('WHERE timestamp >= :since '
+                                        'AND timestamp < :until;'))
+
+    def test_invalid(self):
+        ''' Make sure we still validate since and until '''
+        self.assertRaises(ValueError, _table_utils.make_select, 'Person',
+                          self.template, since='1 OR 1')
+
+class TestMakeCreateIndex(unittest.TestCase):
+
+    ''' Regression test for make_create_index() '''
+
+    def test_success(self):
+        ''' Make sure the index is created and used '''
+        connection = sqlite3.connect(':memory:')
+        connection.execute(_table_utils.make_create_table(
+                           'Person', TestMakeSelect.template))
+        for query in _table_utils.make_create_indexes('Person',
+                                                      ('timestamp',)):
+            connection.execute(query)
+            connection.execute(query)
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + _table_utils.make_select(
+                       'Person', TestMakeSelect.template, since=0, desc=True),
+                       {'since': 0})
+        self.assertTrue('Person_timestamp_idx' in str(cursor.fetchall()))
+
+    def test_invalid(self):
+        ''' Make sure we reject invalid column names '''
+        self.assertRaises(ValueError, _table_utils.make_create_index,
+                          'Person', 'timestamp; DROP TABLE Person')
+
+class TestUpdateRows(unittest.TestCase):
+
+    ''' Regression test for update_rows() '''
+
+    @staticmethod
+    def _connect():
+        ''' Create a table with some rows '''
+        connection = sqlite3.connect(':memory:')
+        connection.execute(_table_utils.make_create_table(
+                           'Person', TestMakeSelect.template))
+        connection.executemany('INSERT INTO Person (timestamp, name) '
+                               'VALUES (?, ?);', ((index, 'x')
+                               for index in range(100)))
+        connection.commit()
+        return connection
+
+    def test_success(self):
+        ''' Make sure all rows are processed in batches '''
+        connection = self._connect()
+        progress = []
+        changed = _table_utils.update_rows(connection, 'Person', ('name',),
+          lambda row: ('y',) if row[0] % 2 else None, 'test',
+          lambda done, total: progress.append((done, total)), batch=30)
+        self.assertEqual(changed, 50)
+        self.assertEqual(progress, [(30, 100), (60, 100), (90, 100),
+                                    (100, 100)])
+        cursor = connection.execute('SELECT COUNT(*) FROM Person '
+                                    'WHERE name="y";')
+        self.assertEqual(cursor.fetchone()[0], 50)
+        self.assertEqual(_table_utils.get_checkpoint(connection, 'test'), 0)
+
+    def test_resume(self):
+        ''' Make sure an interrupted update resumes '''
+        connection = self._connect()
+        seen = []
+
+        def function(row):
+            ''' Interrupt when we reach row 50 '''
+            if row[0] == 50 and not seen:
+                seen.append(row[0])
+                raise KeyboardInterrupt
+            return ('y',)
+
+        self.assertRaises(KeyboardInterrupt, _table_utils.update_rows,
+                          connection, 'Person', ('name',), function, 'test',
+                          batch=20)
+        connection.rollback()
+        self.assertEqual(_table_utils.get_checkpoint(connection, 'test'), 40)
+        changed = _table_utils.update_rows(connection, 'Person', ('name',),
+                                           function, 'test', batch=20)
+        self.assertEqual(changed, 60)
+        cursor = connection.execute('SELECT COUNT(*) FROM Person '
+                                    'WHERE name="y";')
+        self.assertEqual(cursor.fetchone()[0], 100)
+
+class TestRenameColumnResume(unittest.TestCase):
+
+    ''' Make sure rename_column() resumes after an interruption '''
+
+    def test_resume(self):
+        ''' Resume after the first batch has been copied '''
+        template = TestRenameColumn.template
+        connection = sqlite3.connect(':memory:')
+        connection.execute(_table_utils.make_create_table(
+                           'Person', template))
+        connection.executemany(_table_utils.make_insert_into(
+                               'Person', template), (template
+                               for _ in range(10)))
+        ntemplate = _table_utils.rename_column_ntemplate(
+                      template, TestRenameColumn.mapping)
+
+        # Simulate an interruption after the first batch
+        connection.execute('ALTER TABLE Person RENAME TO old_Person;')
+        connection.execute(_table_utils.make_create_table(
+                           'Person', ntemplate))
+        connection.execute('INSERT INTO Person (id, name) VALUES (1, "x");')
+        connection.commit()
+
+        for _ in range(2):
+            _table_utils.rename_column(connection, 'Person', template,
+                                       TestRenameColumn.mapping)
+        self.assertFalse(_table_utils.table_exists(connection, 'old_Person'))
+        cursor = connection.execute('SELECT id, name FROM Person;')
+        rows = cursor.fetchall()
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0], (1, 'x'))
+        self.assertEqual(rows[1], (2, 'Simone'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Benchmark table_speedtest.listify() over a synthetic database, with
+ and without the timestamp index.  This file is not executable, so
+ `make regress` does not run it; run it by hand with:
+
+     python regress/neubot/database/listify_bench.py [rows]
+'''
+
+import random
+import sqlite3
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.database import table_speedtest
+from neubot import utils
+
+DAY = 24 * 60 * 60
+
+def _populate(connection, rows, now):
+    ''' Fill the speedtest table with rows spanning a year '''
+    def generate():
+        ''' Generate the rows '''
+        for _ in xrange(rows):
+            yield {
+                   'timestamp': now - random.randint(0, 365 * DAY),
+                   'uuid': '71d22636-a584-441e-99ea-32c11ce073ef',
+                   'internal_address': '10.0.0.1',
+                   'real_address': '130.192.91.1',
+                   'remote_address': '130.192.91.211',
+                   'privacy_informed': 1,
+                   'privacy_can_collect': 1,
+                   'privacy_can_publish': 1,
+                   'connect_time': random.random(),
+                   'download_speed': random.random() * 100000,
+                   'upload_speed': random.random() * 40000,
+                   'latency': random.random(),
+                   'platform': 'linux2',
+                   'neubot_version': '0.004016000',
+                   'test_version': 1,
+                  }
+    connection.executemany(table_speedtest.INSERT_INTO, generate())
+    connection.commit()
+
+def _measure(connection, now, count=10):
+    ''' Time listify() for the last day and for the last week '''
+    result = []
+    for days in (1, 7):
+        begin = utils.ticks()
+        for _ in range(count):
+            table_speedtest.listify(connection, since=now - days * DAY)
+        result.append((utils.ticks() - begin) / count)
+    return result
+
+def main(args):
+    ''' Main function '''
+
+    rows = 1000000
+    if len(args) > 1:
+        rows = int(args[1])
+
+    now = utils.timestamp()
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    connection.execute(table_speedtest.CREATE_TABLE)
+
+    sys.stdout.write('populating with %d rows...\n' % rows)
+    _populate(connection, rows, now)
+
+    plain = _measure(connection, now)
+    for query in table_speedtest.CREATE_INDEXES:
+        connection.execute(query)
+    indexed = _measure(connection, now)
+
+    for label, before, after in zip(('last day', 'last week'),
+                                    plain, indexed):
+        sys.stdout.write('%s: %s without index, %s with index (%.1fx)\n' % (
+          label, utils.time_formatter(before), utils.time_formatter(after),
+          before / after))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,118 @@
+# regress/neubot/database/startup_bench.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Benchmark the time needed to open the database and to run common
+ subcommands, with and without the schema fingerprint, on a temporary
+ database.  This file is not executable, so `make regress` does not
+ run it; run it by hand (with enough privileges) with:
+
+     python regress/neubot/database/startup_bench.py [count]
+'''
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.database import DatabaseManager
+from neubot import utils
+
+SUBCOMMANDS = (
+    ('database',),
+    ('database', 'show'),
+    ('privacy',),
+    ('privacy', '-t'),
+)
+
+def _forget_fingerprint(path):
+    ''' Remove the fingerprint, to force a complete check '''
+    manager = DatabaseManager()
+    manager.set_path(path)
+    connection = manager.connection()
+    connection.execute("DELETE FROM config WHERE name='schema_fingerprint';")
+    connection.commit()
+    manager.close()
+
+def _open(path, cold, count):
+    ''' Time DatabaseManager.connection() '''
+    elapsed = 0.0
+    for _ in range(count):
+        if cold:
+            _forget_fingerprint(path)
+        manager = DatabaseManager()
+        manager.set_path(path)
+        begin = utils.ticks()
+        manager.connection()
+        elapsed += utils.ticks() - begin
+        manager.close()
+    return elapsed / count
+
+def _run(path, subcommand, cold, count):
+    ''' Time a neubot subcommand '''
+    argv = [sys.executable, 'bin/neubot', subcommand[0], '-f', path]
+    argv.extend(subcommand[1:])
+    environ = dict(os.environ)
+    environ['NEUBOT_HOME'] = '.'
+    elapsed = 0.0
+    devnull = open(os.devnull, 'w')
+    for _ in range(count):
+        if cold:
+            _forget_fingerprint(path)
+        begin = utils.ticks()
+        subprocess.call(argv, stdout=devnull, stderr=devnull, env=environ)
+        elapsed += utils.ticks() - begin
+    devnull.close()
+    return elapsed / count
+
+def _report(label, cold, warm):
+    ''' Print a line of the report '''
+    sys.stdout.write('%-24s %10s full check, %10s fingerprint (%.1fx)\n' % (
+      label, utils.time_formatter(cold), utils.time_formatter(warm),
+      cold / warm))
+
+def main(args):
+    ''' Main function '''
+
+    count = 20
+    if len(args) > 1:
+        count = int(args[1])
+
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'database.sqlite3')
+    try:
+        _open(path, False, 1)
+        _report('connection()', _open(path, True, count),
+                _open(path, False, count))
+        for subcommand in SUBCOMMANDS:
+            _report('neubot %s' % ' '.join(subcommand),
+                    _run(path, subcommand, True, count),
+                    _run(path, subcommand, False, count))
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -60,5 +60,25 @@ class TestConfig(unittest.TestCase):
         table_config.create(connection)
         print(table_config.jsonize(connection))
 
+class TestFingerprint(unittest.TestCase):
+
+    def runTest(self):
+
+        connection = sqlite3.connect(":memory:")
+        connection.row_factory = sqlite3.Row
+        self.assertFalse(table_config.is_up_to_date(connection))
+
+        table_config.create(connection)
+        self.assertFalse(table_config.is_up_to_date(connection))
+
+        table_config.save_fingerprint(connection)
+        self.assertTrue(table_config.is_up_to_date(connection))
+
+        connection.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY);")
+        self.assertFalse(table_config.is_up_to_date(connection))
+
+        table_config.save_fingerprint(connection)
+        self.assertTrue(table_config.is_up_to_date(connection))
+
 if __name__ == '__main__':
     unittest.main()
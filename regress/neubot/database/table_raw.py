@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/database/table_raw.py '''
+
+import sqlite3
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.compat import json
+from neubot.database import _series
+from neubot.database import table_raw
+from neubot.database import table_rollup
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+def _make_result(ticks):
+    ''' Make a fake result of the raw test '''
+    return {
+        'client': {
+            'al_capacity': 1223409.27,
+            'al_mss': 1448,
+            'al_rexmits': [[0.5, 1448, 0.25], [0.75, 2896, 0.125]],
+            'alrtt_avg': 0.03,
+            'alrtt_list': [0.03, 0.02, 0.04],
+            'connect_time': 0.02,
+            'goodput': {'bytesdiff': 1000000, 'timediff': 2.0,
+                        'ticks': ticks},
+            'goodput_snap': [{'ticks': ticks + index * 0.25,
+                              'bytesdiff': 65536 * index,
+                              'timediff': 0.25} for index in range(40)],
+            'myname': '10.0.0.1',
+            'peername': '130.192.91.211',
+            'platform': 'linux2',
+            'uuid': '7528d674-25f0-4ac4-aff6-46f446034d81',
+            'version': '0.004015007',
+        },
+        'server': {
+            'goodput': {'bytesdiff': 1000000, 'timediff': 2.0,
+                        'ticks': ticks},
+            'goodput_snap': [],
+            'myname': '130.192.91.211',
+            'peername': '130.192.91.231',
+            'platform': 'linux2',
+            'timestamp': ticks,
+            'version': '0.004015007',
+            'web100_snap': [],
+        },
+    }
+
+def _connect():
+    ''' Create an in-memory database with the RAW tables '''
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    table_raw.create(connection)
+    table_rollup.create(connection)
+    return connection
+
+class TestSeries(unittest.TestCase):
+    ''' Make sure the series codec round-trips '''
+
+    def test_roundtrip(self):
+        ''' Make sure encode() and decode() round-trip '''
+        for vector in ([], [1, 2, 3], [0.5, 1.5], [[1, 2.5], [3, 4.5]],
+                       [{'a': 1, 'b': 0.5}, {'a': 2, 'b': 1.5}],
+                       [1, 'x'], [[1, 2], [3]], [{'a': 1}, {'b': 2}],
+                       [1 << 70]):
+            self.assertEqual(_series.decode(_series.encode(vector)), vector)
+
+    def test_types(self):
+        ''' Make sure decode() preserves integers and floats '''
+        vector = _series.decode(_series.encode([{'a': 1, 'b': 0.5}]))
+        self.assertTrue(isinstance(vector[0]['a'], (int, long)))
+        self.assertTrue(isinstance(vector[0]['b'], float))
+
+    def test_mixed(self):
+        ''' Make sure a column mixing integers and floats round-trips '''
+        vector = _series.decode(_series.encode([[1, 2.5], [3, 4]]))
+        self.assertEqual(vector, [[1, 2.5], [3, 4]])
+        self.assertTrue(isinstance(vector[1][1], (int, long)))
+
+class TestTableRaw(unittest.TestCase):
+    ''' Regression test for table_raw '''
+
+    def test_summary(self):
+        ''' Make sure json_data does not contain the series '''
+        connection = _connect()
+        table_raw.insert(connection, _make_result(1000),
+                         override_timestamp=False)
+        row = table_raw.listify(connection)[0]
+        self.assertEqual(row['al_mss'], 1448)
+        summary = json.loads(row['json_data'])
+        self.assertFalse('goodput_snap' in summary['client'])
+        self.assertFalse('web100_snap' in summary['server'])
+        self.assertEqual(summary['client']['al_mss'], 1448)
+
+    def test_series(self):
+        ''' Make sure listify() can return the complete result '''
+        connection = _connect()
+        result = _make_result(1000)
+        table_raw.insert(connection, result, override_timestamp=False)
+        row = table_raw.listify(connection, series=True)[0]
+        self.assertFalse('id' in row)
+        self.assertEqual(json.loads(row['json_data']),
+                         json.loads(json.dumps(result)))
+
+    def test_prune(self):
+        ''' Make sure prune() also removes the series '''
+        connection = _connect()
+        table_raw.insert(connection, _make_result(1000),
+                         override_timestamp=False)
+        table_raw.insert(connection, _make_result(3000),
+                         override_timestamp=False)
+        table_raw.prune(connection, until=2000)
+        self.assertEqual(len(table_raw.listify(connection)), 1)
+        cursor = connection.execute('''SELECT COUNT(*) FROM raw_series
+          WHERE raw_id NOT IN (SELECT id FROM raw);''')
+        self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_split_series(self):
+        ''' Make sure split_series() converts old rows '''
+        connection = _connect()
+        result = _make_result(1000)
+        row = {
+               'timestamp': 1000,
+               'uuid': '',
+               'internal_address': '',
+               'real_address': '',
+               'remote_address': '',
+               'connect_time': 0.0,
+               'latency': 0.0,
+               'download_speed': 0.0,
+               'al_capacity': None,
+               'al_mss': None,
+               'neubot_version': '',
+               'platform': '',
+               'json_data': json.dumps(result),
+              }
+        connection.execute(table_raw.INSERT_INTO, row)
+        table_raw.split_series(connection)
+        row = table_raw.listify(connection)[0]
+        self.assertEqual(row['al_mss'], 1448)
+        self.assertFalse('goodput_snap' in json.loads(row['json_data'])
+                         ['client'])
+        row = table_raw.listify(connection, series=True)[0]
+        self.assertEqual(json.loads(row['json_data']),
+                         json.loads(json.dumps(result)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/database/table_rollup.py '''
+
+import sqlite3
+import sys
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.database import table_rollup
+from neubot.database import table_speedtest
+
+from neubot import aggregate
+from neubot import utils
+
+from regress.neubot.database.table_speedtest_gen import ResultIterator
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+def _connect():
+    ''' Create an in-memory database with speedtest results '''
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    table_speedtest.create(connection)
+    table_rollup.create(connection)
+    for result in ResultIterator():
+        table_speedtest.insert(connection, result, override_timestamp=False)
+    return connection
+
+def _aggregate_mean(rows, bucket, fields, group_by):
+    ''' Compute the mean of fields over each bucket of rows '''
+    width = aggregate.BUCKETS[bucket]
+    groups = {}
+    for row in rows:
+        start = row['timestamp'] - row['timestamp'] % width
+        key = (start, row[group_by] if group_by else '')
+        groups.setdefault(key, []).append(row)
+    result = []
+    for (start, address), members in groups.items():
+        output = {'timestamp': start, 'real_address': address,
+                  'count': len(members)}
+        for field in fields:
+            values = [float(row[field]) for row in members]
+            output[field] = sum(values) / len(values)
+        result.append(output)
+    return result
+
+def _assert_close(test, left, right, error):
+    ''' Make sure two lists of aggregated rows are close enough '''
+    test.assertEqual(len(left), len(right))
+    for row1, row2 in zip(left, right):
+        test.assertEqual(row1['timestamp'], row2['timestamp'])
+        test.assertEqual(row1['real_address'], row2['real_address'])
+        test.assertEqual(row1['count'], row2['count'])
+        for field in ('download_speed', 'latency'):
+            test.assertTrue(abs(row1[field] - row2[field]) <=
+                            error * abs(row2[field]) + 1e-09)
+
+class TestSketch(unittest.TestCase):
+    ''' Make sure the sketch approximates quantiles '''
+
+    def test_quantile(self):
+        ''' Make sure quantiles are within the relative error '''
+        sketch = {}
+        vector = [float(value) for value in range(1, 1001)]
+        for value in vector:
+            table_rollup.sketch_add(sketch, value)
+        for percent in (0.1, 0.5, 0.9):
+            approx = table_rollup.sketch_quantile(sketch, percent)
+            exact = vector[int(percent * (len(vector) - 1))]
+            self.assertTrue(abs(approx - exact) <= 0.01 * exact)
+
+    def test_zero_and_empty(self):
+        ''' Make sure zero and empty sketches are handled '''
+        self.assertEqual(table_rollup.sketch_quantile({}, 0.5), None)
+        sketch = {}
+        table_rollup.sketch_add(sketch, 0.0)
+        self.assertEqual(table_rollup.sketch_quantile(sketch, 0.5), 0.0)
+
+class TestRollup(unittest.TestCase):
+    ''' Make sure rollups are consistent with results '''
+
+    def test_consistent(self):
+        ''' Make sure rollups match aggregation over results '''
+        connection = _connect()
+        results = table_speedtest.listify(connection)
+        fields = aggregate.select_fields(table_speedtest.TEMPLATE)
+        for bucket in ('hour', 'day'):
+            for group_by in (None, 'real_address'):
+                expected = _aggregate_mean(results, bucket, fields,
+                                           group_by)
+                rollups = table_rollup.listify(connection, 'speedtest',
+                                               bucket, 'mean', fields,
+                                               group_by)
+                expected.sort(key=lambda row: (row['timestamp'],
+                                               row['real_address']))
+                rollups.sort(key=lambda row: (row['timestamp'],
+                                              row['real_address']))
+                _assert_close(self, rollups, expected, 1e-09)
+
+    def test_rebuild(self):
+        ''' Make sure rebuild() yields the same rollups as insert() '''
+        connection = _connect()
+        before = table_rollup.listify(connection, 'speedtest', 'day', 'p90',
+                                      ['download_speed', 'latency'],
+                                      'real_address')
+        table_rollup.rebuild(connection, 'speedtest',
+                             table_speedtest.TEMPLATE)
+        after = table_rollup.listify(connection, 'speedtest', 'day', 'p90',
+                                     ['download_speed', 'latency'],
+                                     'real_address')
+        self.assertEqual(before, after)
+
+    def test_garbage(self):
+        ''' Make sure rebuild() skips non-numeric legacy values '''
+        connection = _connect()
+        before = table_rollup.listify(connection, 'speedtest', 'day', 'mean',
+                                      ['download_speed'])
+        connection.execute("""UPDATE speedtest SET latency='garbage'
+          WHERE id=(SELECT MIN(id) FROM speedtest);""")
+        table_rollup.rebuild(connection, 'speedtest',
+                             table_speedtest.TEMPLATE)
+        after = table_rollup.listify(connection, 'speedtest', 'day', 'mean',
+                                     ['download_speed'])
+        self.assertEqual(before, after)
+
+    def test_prune(self):
+        ''' Make sure pruning keeps the daily history '''
+        connection = _connect()
+        now = utils.timestamp()
+        days = table_rollup.listify(connection, 'speedtest', 'day', 'mean',
+                                    ['download_speed'])
+        table_speedtest.prune(connection, until=now)
+        table_rollup.prune(connection, until=now)
+        self.assertEqual(table_speedtest.listify(connection), [])
+        self.assertEqual(table_rollup.listify(connection, 'speedtest', 'hour',
+                         'mean', ['download_speed']), [])
+        self.assertEqual(table_rollup.listify(connection, 'speedtest', 'day',
+                         'mean', ['download_speed']), days)
+        table_rollup.prune(connection, until=now, keep_daily=False)
+        self.assertEqual(table_rollup.listify(connection, 'speedtest', 'day',
+                         'mean', ['download_speed']), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,6 +30,7 @@ import unittest
 if __name__ == "__main__":
     sys.path.insert(0, ".")
 
+from neubot.database import table_rollup
 from neubot.database import table_speedtest
 from neubot import utils
 
@@ -44,6 +45,7 @@ class TestDatabase(unittest.TestCase):
         connection.row_factory = sqlite3.Row
         table_speedtest.create(connection)
         table_speedtest.create(connection)
+        table_rollup.create(connection)
 
         v = map(None, ResultIterator())
         for d in v:
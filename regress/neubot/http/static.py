@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/http/static.py '''
+
+import StringIO
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.http.message import Message
+from neubot.http import static
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+# Fake mtime, incremented at each _write(), to avoid sleeping
+MTIME = [1356998400]
+
+def _write(path, content):
+    ''' Write content into path and make sure its mtime changes '''
+    filep = open(path, 'wb')
+    filep.write(content)
+    filep.close()
+    MTIME[0] += 1
+    os.utime(path, (MTIME[0], MTIME[0]))
+
+def _request(**headers):
+    ''' Create a GET request with the given headers '''
+    request = Message(method='GET', uri='/', protocol='HTTP/1.1')
+    for key, value in headers.items():
+        request[key.replace('_', '-')] = value
+    return request
+
+def _serve(entry, request):
+    ''' Compose the response to request and return it with its body '''
+    response = Message()
+    entry.compose(request, response)
+    return response, response.body.read()
+
+class TestAcceptsGzip(unittest.TestCase):
+    ''' Regression tests for static.accepts_gzip() '''
+
+    def test_accepts_gzip(self):
+        ''' Make sure Accept-Encoding is parsed correctly '''
+        self.assertTrue(static.accepts_gzip('gzip'))
+        self.assertTrue(static.accepts_gzip('deflate, gzip;q=0.5'))
+        self.assertFalse(static.accepts_gzip(''))
+        self.assertFalse(static.accepts_gzip('identity'))
+        self.assertFalse(static.accepts_gzip('gzip;q=0'))
+        self.assertFalse(static.accepts_gzip('gzip;q=xo'))
+
+class TestStaticCache(unittest.TestCase):
+    ''' Regression tests for static.StaticCache '''
+
+    def setUp(self):
+        self.rootdir = tempfile.mkdtemp()
+        self.cache = static.StaticCache()
+        self.page = os.path.join(self.rootdir, 'index.html')
+        self.header = os.path.join(self.rootdir, 'header.html')
+        _write(self.header, 'HEADER ' * 64)
+        _write(self.page, '<!--#include virtual="/header.html"-->BODY')
+
+    def tearDown(self):
+        shutil.rmtree(self.rootdir)
+
+    def test_ssi(self):
+        ''' Make sure SSI is cached and invalidated by includes '''
+        entry = self.cache.lookup(self.rootdir, self.page, ssi=True)
+        self.assertTrue(entry.body.endswith('HEADER BODY'))
+        self.assertTrue(self.cache.lookup(self.rootdir, self.page,
+                                          ssi=True) is entry)
+        _write(self.header, 'NEW HEADER ')
+        entry = self.cache.lookup(self.rootdir, self.page, ssi=True)
+        self.assertEqual(entry.body, 'NEW HEADER BODY')
+
+    def test_missing(self):
+        ''' Make sure we raise when the file does not exist '''
+        self.assertRaises(IOError, self.cache.lookup, self.rootdir,
+                          os.path.join(self.rootdir, 'foo.html'))
+
+    def test_gzip(self):
+        ''' Make sure we send gzipped body only when asked to '''
+        entry = self.cache.lookup(self.rootdir, self.header)
+        response, body = _serve(entry, _request())
+        self.assertEqual(body, 'HEADER ' * 64)
+        self.assertEqual(response['content-encoding'], '')
+        self.assertEqual(response['vary'], 'Accept-Encoding')
+        response, body = _serve(entry, _request(accept_encoding='gzip'))
+        self.assertEqual(response['content-encoding'], 'gzip')
+        filep = gzip.GzipFile(fileobj=StringIO.StringIO(body))
+        self.assertEqual(filep.read(), 'HEADER ' * 64)
+        self.assertEqual(response['content-length'], str(len(body)))
+
+    def test_etag(self):
+        ''' Make sure we reply 304 when the ETag matches '''
+        entry = self.cache.lookup(self.rootdir, self.header)
+        response, body = _serve(entry, _request())
+        etag = response['etag']
+        response, body = _serve(entry, _request(if_none_match=etag))
+        self.assertEqual(response.code, '304')
+        self.assertEqual(body, '')
+        response, body = _serve(entry, _request(if_none_match=etag,
+                                                accept_encoding='gzip'))
+        self.assertEqual(response.code, '200')
+
+    def test_if_modified_since(self):
+        ''' Make sure we reply 304 when the file is not modified '''
+        entry = self.cache.lookup(self.rootdir, self.header)
+        response, body = _serve(entry, _request())
+        response, body = _serve(entry, _request(
+          if_modified_since=response['last-modified']))
+        self.assertEqual(response.code, '304')
+        response, body = _serve(entry, _request(
+          if_modified_since='Mon, 01 Jan 2001 00:00:00 GMT'))
+        self.assertEqual(response.code, '200')
+
+    def test_large(self):
+        ''' Make sure we don't keep large files in memory '''
+        saved_maxsize = static.MAXSIZE
+        static.MAXSIZE = 16
+        try:
+            entry = self.cache.lookup(self.rootdir, self.header)
+        finally:
+            static.MAXSIZE = saved_maxsize
+        self.assertEqual(entry.body, None)
+        response, body = _serve(entry, _request(accept_encoding='gzip'))
+        self.assertEqual(body, 'HEADER ' * 64)
+
+if __name__ == '__main__':
+    unittest.main()
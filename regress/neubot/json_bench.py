@@ -0,0 +1,76 @@
+# regress/neubot/json_bench.py
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+ Benchmark encoding and decoding of speedtest, bittorrent and raw
+ results with all the JSON backends available on this system.  This
+ file is not executable, so `make regress` does not run it; run it
+ by hand with:
+
+     python regress/neubot/json_bench.py [count]
+'''
+
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot import json_codec
+from neubot import utils
+
+from regress.neubot.database import table_bittorrent_gen
+from regress.neubot.database import table_raw
+from regress.neubot.database import table_speedtest_gen
+
+def _documents():
+    ''' Returns the documents to encode and decode '''
+    return (
+        ('speedtest', list(table_speedtest_gen.ResultIterator())),
+        ('bittorrent', list(table_bittorrent_gen.ResultIterator())),
+        ('raw', table_raw._make_result(utils.timestamp())),
+    )
+
+def _measure(function, argument, count):
+    ''' Returns the average time taken by function(argument) '''
+    begin = utils.ticks()
+    for _ in xrange(count):
+        function(argument)
+    return (utils.ticks() - begin) / count
+
+def main(args):
+    ''' Main function '''
+
+    count = 1000
+    if len(args) > 1:
+        count = int(args[1])
+
+    sys.stdout.write('selected backend: %s\n' % json_codec.BACKEND)
+    for label, document in _documents():
+        encoded = json_codec.REFERENCE.dumps(document)
+        sys.stdout.write('%s (%d bytes):\n' % (label, len(encoded)))
+        for name, dumps, loads in json_codec.available():
+            sys.stdout.write('    %-20s encode %10s, decode %10s\n' % (
+              name, utils.time_formatter(_measure(dumps, document, count)),
+              utils.time_formatter(_measure(loads, encoded, count))))
+
+if __name__ == '__main__':
+    main(sys.argv)
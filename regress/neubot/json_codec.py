@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013
+#     Nexa Center for Internet & Society, Politecnico di Torino (DAUIN)
+#     and Simone Basso <bassosimone@gmail.com>
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/json_codec.py '''
+
+import unittest
+import sys
+
+if __name__ == '__main__':
+    sys.path.insert(0, '.')
+
+from neubot.compat import json
+from neubot import json_codec
+from neubot import six
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+DOCUMENT = {
+            'download_speed': 0.1 + 0.2,
+            'vector': [1, 2.5, None, True, {'key': six.u('caf\\u00e9')}],
+           }
+
+class TestJsonCodec(unittest.TestCase):
+    ''' Regression test for json_codec '''
+
+    def test_compat(self):
+        ''' Make sure neubot.compat.json is the codec '''
+        self.assertTrue(json is json_codec)
+
+    def test_backends(self):
+        ''' Make sure all available backends agree '''
+        backends = json_codec.available()
+        self.assertTrue(backends)
+        for _, dumps, loads in backends:
+            self.assertEqual(json.loads(dumps(DOCUMENT)), DOCUMENT)
+            self.assertEqual(loads(json.dumps(DOCUMENT)), DOCUMENT)
+
+    def test_options(self):
+        ''' Make sure options are honored '''
+        self.assertEqual(json.dumps({'b': 1, 'a': 2}, sort_keys=True,
+                                    indent=4),
+                         '{\n    "a": 2, \n    "b": 1\n}')
+
+    def test_iterencode(self):
+        ''' Make sure iterencode() writes the whole document '''
+        stringio = six.StringIO()
+        document = [DOCUMENT] * 2000
+        json.iterencode(document, stringio)
+        self.assertEqual(json.loads(stringio.getvalue()), document)
+        self.assertEqual(json.load(six.StringIO(stringio.getvalue())),
+                         document)
+
+    def test_bytes(self):
+        ''' Make sure bytes in and bytes out work '''
+        octets = json.dumpb(DOCUMENT)
+        self.assertTrue(isinstance(octets, six.binary_type))
+        self.assertEqual(json.loadb(octets), DOCUMENT)
+        self.assertEqual(json.loadb(bytearray(octets)), DOCUMENT)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/listener.py '''
+
+import socket
+import sys
+import time
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.config import CONFIG
+from neubot.poller import POLLER
+from neubot import listener
+from neubot import utils_net
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+class Parent(object):
+    ''' Records the accepted sockets '''
+
+    def __init__(self):
+        self.accepted = []
+        self.errors = 0
+
+    def handle_listen(self, lst):
+        ''' Invoked when listening '''
+
+    def handle_accept(self, lst, sock, sslconfig, sslcert):
+        ''' Invoked when a connection is accepted '''
+        self.accepted.append(sock)
+
+    def handle_accept_error(self, lst):
+        ''' Invoked when accept fails '''
+        self.errors += 1
+
+class TestListener(unittest.TestCase):
+    ''' Regression test for Listener '''
+
+    def setUp(self):
+        self.budget = CONFIG['net.listen.accept_budget']
+        self.parent = Parent()
+        self.lsock = utils_net.listen(('127.0.0.1', 0), 0, 16)[0]
+        self.listener = listener.Listener(self.parent, self.lsock,
+                                          ('127.0.0.1', 0), 0, None)
+        self.clients = []
+        listener.ACCEPT_STATS.__init__()
+
+    def tearDown(self):
+        POLLER.unset_readable(self.listener)
+        for sock in self.clients + self.parent.accepted:
+            sock.close()
+        self.lsock.close()
+        CONFIG.conf['net.listen.accept_budget'] = self.budget
+
+    def _connect(self, count):
+        ''' Connect count clients and wait for the handshakes '''
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect(self.lsock.getsockname())
+            self.clients.append(sock)
+        time.sleep(0.1)
+
+    def test_drain(self):
+        ''' Make sure we accept all pending connections at once '''
+        self._connect(5)
+        self.listener.handle_read()
+        self.assertEqual(len(self.parent.accepted), 5)
+        self.assertEqual(self.parent.errors, 0)
+        sock = self.parent.accepted[0]
+        self.assertEqual(sock.gettimeout(), 0.0)
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET,
+                                        socket.SO_KEEPALIVE))
+        data = {}
+        listener.ACCEPT_STATS.snap(data)
+        self.assertEqual(data['listener']['accepted'], 5)
+        self.assertEqual(data['listener']['queue_depth'], 5)
+        self.assertEqual(data['listener']['budget_exhausted'], 0)
+
+    def test_budget(self):
+        ''' Make sure we don't accept more than the budget '''
+        CONFIG.conf['net.listen.accept_budget'] = 3
+        self._connect(5)
+        self.listener.handle_read()
+        self.assertEqual(len(self.parent.accepted), 3)
+        self.listener.handle_read()
+        self.assertEqual(len(self.parent.accepted), 5)
+        self.assertEqual(listener.ACCEPT_STATS.exhausted, 1)
+        self.assertEqual(listener.ACCEPT_STATS.max_depth, 3)
+
+    def test_empty(self):
+        ''' Make sure a spurious wakeup is not an error '''
+        self.listener.handle_read()
+        self.assertEqual(self.parent.accepted, [])
+        self.assertEqual(self.parent.errors, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -58,6 +58,14 @@ class MinimalHttpStream:
     def unregister_atclose(self, func):
         ''' Pretend to unregister atclosed hook '''
 
+def _new_server(cls=NegotiateServer):
+    ''' Create a server that does not sample the load of
+        this machine, so that the tests are repeatable '''
+    server = cls(None)
+    server.load.sysinfo = None
+    server.register_module('abc', NegotiateServerModule())
+    return server
+
 class GotRequestHeaders(unittest.TestCase):
 
     ''' Verifies the behavior of got_request_headers() method
@@ -140,12 +148,10 @@ class ProcessRequest(unittest.TestCase):
     def test_negotiate_delayed(self):
         ''' When a stream is already in queue the response is delayed '''
 
-        server = NegotiateServer(None)
-        stream = MinimalHttpStream()
-        server.queue.append(stream)
-        server.known.add(stream)
+        server = _new_server()
+        stream = _fill_queue(server, CONFIG['negotiate.parallelism'] + 1)[-1]
 
-        request = Message(uri='/negotiate/')
+        request = Message(uri='/negotiate/abc')
         server.process_request(stream, request)
 
         self.assertEqual(stream.opaque, request)
@@ -153,8 +159,7 @@ class ProcessRequest(unittest.TestCase):
     def test_negotiate_red(self):
         ''' Verify that random early discard works as expected '''
 
-        server = NegotiateServer(None)
-        server.register_module('abc', NegotiateServerModule())
+        server = _new_server()
 
         red_accepted, red_rejected, red_discarded = 0, 0, 0
         while True:
@@ -165,14 +170,14 @@ class ProcessRequest(unittest.TestCase):
             stream = MinimalHttpStream()
 
             # Should ALWAYS accept
-            if len(server.queue) < CONFIG['negotiate.min_thresh']:
+            if server.sched.length('abc') < CONFIG['negotiate.min_thresh']:
                 server.process_request(stream, request)
-                self.assertEquals(server.queue[-1], stream)
+                self.assertTrue(stream in server.sched)
 
             # MAY accept or reject
-            elif len(server.queue) < CONFIG['negotiate.max_thresh']:
+            elif server.sched.length('abc') < CONFIG['negotiate.max_thresh']:
                 server.process_request(stream, request)
-                if server.queue[-1] == stream:
+                if stream in server.sched:
                     red_accepted += 1
                 else:
                     red_rejected += 1
@@ -180,7 +185,7 @@ class ProcessRequest(unittest.TestCase):
             # MUST reject
             else:
                 server.process_request(stream, request)
-                self.assertNotEqual(server.queue[-1], stream)
+                self.assertFalse(stream in server.sched)
                 red_discarded += 1
                 if red_discarded == 64:
                     break
@@ -212,11 +217,11 @@ class ProcessRequest(unittest.TestCase):
     def test_negotiate_successful(self):
         ''' Make sure the response is OK when negotiate succeeds '''
 
-        server = NegotiateServer(None)
-        server.register_module('abc', NegotiateServerModule())
+        server = _new_server()
+        parallelism = CONFIG['negotiate.parallelism']
 
         # Want to check authorized and nonauthorized streams
-        for position in range(CONFIG['negotiate.parallelism'] + 3):
+        for position in range(parallelism + 3):
 
             stream = MinimalHttpStream()
             request = Message(uri='/negotiate/abc')
@@ -232,17 +237,17 @@ class ProcessRequest(unittest.TestCase):
 
             # Note: authorization is empty when you're choked
             body = json.loads(response.body)
-            if position < CONFIG['negotiate.parallelism']:
+            if position < parallelism:
                 self.assertEqual(body, {
                                         u'unchoked': 1,
-                                        u'queue_pos': position,
+                                        u'queue_pos': 0,
                                         u'real_address': u'abc',
                                         u'authorization': unicode(hash(stream))
                                        })
             else:
                 self.assertEqual(body, {
                                         u'unchoked': 0,
-                                        u'queue_pos': position,
+                                        u'queue_pos': position - parallelism,
                                         u'real_address': u'abc',
                                         u'authorization': u'',
                                        })
@@ -271,6 +276,23 @@ class NegotiateServerForUpdateQueue(NegotiateServer):
         else:
             self.negotiated.append(baton)
 
+def _fill_queue(server, count):
+    ''' Fill the queue of server with count streams and unchoke
+        as many of them as possible '''
+    streams = []
+    for _ in range(count):
+        stream = MinimalHttpStream()
+        server.sched.append('abc', stream)
+        streams.append(stream)
+    server.sched.schedule()
+    return streams
+
+def _wait(server, stream):
+    ''' Pretend that stream sent a comet request '''
+    request = Message(uri='/negotiate/abc')
+    server.process_request(stream, request)
+    return request
+
 class UpdateQueue(unittest.TestCase):
 
     ''' Verifies the behavior of _update_queue() method
@@ -279,84 +301,100 @@ class UpdateQueue(unittest.TestCase):
     def test_stream_before(self):
         ''' Verify what happens to a stream before the lost one '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for position in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
-            server.queue[-1].opaque = position
+        parallelism = CONFIG['negotiate.parallelism']
+        server = _new_server(NegotiateServerForUpdateQueue)
+        streams = _fill_queue(server, parallelism + 5)
 
-        server._update_queue(server.queue[-1], None)
+        server._update_queue(streams[-1], None)
 
-        self.assertEqual(len(server.queue), 4)
-        for position, stream in enumerate(server.queue):
-            self.assertEqual(stream.opaque, position)
-            self.assertTrue(stream in server.known)
+        waiting = streams[parallelism:-1]
+        self.assertEqual(list(server.sched.queues['abc']), waiting)
+        for position, stream in enumerate(waiting):
+            self.assertEqual(server.sched.position(stream), position)
 
     def test_stream_lost(self):
         ''' Verify what happens to the lost stream '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for _ in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
+        server = _new_server(NegotiateServerForUpdateQueue)
+        streams = _fill_queue(server, 5)
 
-        lost_stream = server.queue[3]
-        server._update_queue(lost_stream, None)
+        server._update_queue(streams[3], None)
 
-        self.assertTrue(lost_stream not in server.queue)
-        self.assertTrue(lost_stream not in server.known)
+        self.assertTrue(streams[3] not in server.sched)
+        self.assertEqual(len(server.sched), 4)
 
     def test_stream_after__no_send(self):
         ''' Verify what happens to streams after that don't have to send '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for _ in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
+        parallelism = CONFIG['negotiate.parallelism']
+        server = _new_server(NegotiateServerForUpdateQueue)
+        streams = _fill_queue(server, parallelism + 5)
 
-        lost_stream = server.queue[2]
-        server._update_queue(lost_stream, None)
+        server._update_queue(streams[parallelism + 2], None)
 
         self.assertEqual(server.negotiated, [])
+        self.assertEqual(server.sched.position(streams[-1]), 3)
 
     def test_stream_after__send(self):
         ''' Verify what happens to streams after that has to send '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for position in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
-            stream.opaque = position
+        parallelism = CONFIG['negotiate.parallelism']
+        server = _new_server(NegotiateServerForUpdateQueue)
+        streams = _fill_queue(server, parallelism + 2)
+        requests = [_wait(server, stream) for stream in
+                    streams[parallelism:]]
 
-        lost_stream = server.queue[2]
-        server._update_queue(lost_stream, None)
+        server._update_queue(streams[2], None)
 
+        # The first stream is unchoked, the second moves to the head
+        self.assertTrue(server.sched.is_running(streams[parallelism]))
         self.assertEqual(server.negotiated, [
-                                             (server.queue[2], 3, 2),
-                                             (server.queue[3], 4, 3),
-                                            ])
+                         (streams[parallelism], requests[0], 0),
+                         (streams[parallelism + 1], requests[1], 0),
+                         ])
+        self.assertEqual(streams[parallelism].opaque, None)
+        self.assertEqual(streams[parallelism + 1].opaque, None)
+
+    def test_stream_after__changed_enough(self):
+        ''' Verify that we only send significant updates '''
+
+        server = _new_server(NegotiateServerForUpdateQueue)
+        streams = _fill_queue(server, 64)
+        _wait(server, streams[-1])
+
+        positions = []
+        for stream in streams[:-1]:
+            server._update_queue(stream, None)
+            if server.negotiated:
+                positions.append(server.negotiated.pop()[2])
+                if not server.sched.is_running(streams[-1]):
+                    _wait(server, streams[-1])
+        self.assertEqual(server.negotiated, [])
+
+        # 56 -> 42 -> 32 -> 24 -> ... -> unchoked
+        self.assertEqual(positions[:3], [42, 32, 24])
+        self.assertEqual(positions[-2:], [0, 0])
+        self.assertTrue(server.sched.is_running(streams[-1]))
+        self.assertTrue(len(positions) < 20)
 
     def test_stream_after__error(self):
         ''' Verify what happens when a stream after raises an error '''
 
-        server = NegotiateServerForUpdateQueue(None)
-        for position in range(5):
-            stream = MinimalHttpStream()
-            server.queue.append(stream)
-            server.known.add(stream)
-            stream.opaque = position
+        parallelism = CONFIG['negotiate.parallelism']
+        server = _new_server(NegotiateServerForUpdateQueue)
+        streams = _fill_queue(server, parallelism + 2)
+        requests = [_wait(server, stream) for stream in
+                    streams[parallelism:]]
 
-        lost_stream = server.queue[2]
-        server.queue[3].generate_error = True
-        server._update_queue(lost_stream, None)
+        streams[parallelism].generate_error = True
+        server._update_queue(streams[2], None)
 
+        # The failed stream leaves room for the next stream
+        self.assertTrue(streams[parallelism] not in server.sched)
+        self.assertTrue(server.sched.is_running(streams[parallelism + 1]))
         self.assertEqual(server.negotiated, [
-                                             (server.queue[2], 4, 2),
-                                            ])
+                         (streams[parallelism + 1], requests[1], 0),
+                         ])
 
 if __name__ == "__main__":
     unittest.main()
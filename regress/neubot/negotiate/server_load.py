@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/negotiate/server_load.py '''
+
+import StringIO
+import sys
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.config import CONFIG
+from neubot.http.message import Message
+from neubot.negotiate.server import NegotiateServer
+from neubot.negotiate.server import NegotiateServerModule
+from neubot.negotiate.server_load import ServerLoad
+from neubot.negotiate.server_raw import NegotiateServerRaw
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+class FakeSysInfo(object):
+    ''' Fake resmon_linux that returns programmed values '''
+
+    def __init__(self):
+        self.cpu = (0, 0)
+        self.netload = {'rx_bytes': 0, 'tx_bytes': 0}
+
+    def get_cpu_times(self):
+        ''' Get busy and total jiffies '''
+        return self.cpu
+
+    def get_defaultgw(self):
+        ''' Get default gateway interface '''
+        return 'eth0'
+
+    def get_netload(self, dev):
+        ''' Get the load of dev '''
+        return dict(self.netload)
+
+class MinimalStream(object):
+    ''' Minimal HTTP stream '''
+
+    def send_response(self, request, response):
+        ''' Pretend to send the response '''
+
+class TestServerLoad(unittest.TestCase):
+    ''' Regression test for ServerLoad '''
+
+    def setUp(self):
+        self.saved = dict((name, CONFIG[name]) for name in (
+                          'negotiate.uplink', 'negotiate.parallelism'))
+        CONFIG['negotiate.uplink'] = 1000000
+        CONFIG['negotiate.parallelism'] = 8
+        self.sysinfo = FakeSysInfo()
+        self.load = ServerLoad(self.sysinfo)
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            CONFIG[name] = value
+
+    def _sample(self, now, busy, total, nbytes):
+        ''' Program the fake sysinfo and sample '''
+        self.sysinfo.cpu = (busy, total)
+        self.sysinfo.netload = {'rx_bytes': nbytes / 2, 'tx_bytes': nbytes}
+        self.load.update(now)
+
+    def test_unknown(self):
+        ''' Make sure we behave as before without telemetry '''
+        load = ServerLoad(None)
+        load.update(1.0)
+        load.update(3.0)
+        self.assertEqual(load.headroom(), 1.0)
+        self.assertEqual(load.parallelism('speedtest'), 8)
+        self.assertEqual(load.drop_probability('speedtest', 0),
+                         -32.0 / (64 - 32))
+
+    def test_cpu(self):
+        ''' Make sure parallelism shrinks when the CPU is busy '''
+        self._sample(1.0, 0, 100, 0)
+        self._sample(1.5, 99, 200, 0)
+        self.assertEqual(self.load.cpu, None)
+        self._sample(2.0, 70, 200, 0)
+        self.assertEqual(self.load.cpu, 0.7)
+        self.assertEqual(self.load.parallelism('speedtest'), 8)
+        self._sample(3.0, 165, 300, 0)
+        self.assertEqual(self.load.cpu, 0.95)
+        self.assertEqual(self.load.parallelism('speedtest'), 1)
+
+    def test_rate(self):
+        ''' Make sure we measure the busiest direction '''
+        self._sample(1.0, 0, 100, 0)
+        self._sample(2.0, 0, 200, 800000)
+        self.assertEqual(self.load.rate, 800000)
+        self.assertAlmostEqual(self.load.headroom(), 0.6)
+        self.assertEqual(self.load.parallelism('speedtest'), 4)
+        # A raw test costs two slots
+        self.assertEqual(self.load.parallelism('raw'), 2)
+
+    def test_goodput(self):
+        ''' Make sure parallelism depends on the goodput of the module '''
+        self.load.add_goodput('raw', 300000)
+        self.load.add_goodput('raw', 0)
+        self.assertEqual(self.load.parallelism('raw'), 3)
+        self.assertEqual(self.load.parallelism('speedtest'), 8)
+        self.load.add_goodput('raw', 700000)
+        self.assertEqual(self.load.goodput['raw'], 400000)
+        self.assertEqual(self.load.parallelism('raw'), 2)
+
+        # The queue of raw is four times shorter
+        self.assertEqual(self.load.drop_probability('raw', 8), 0.0)
+        self.assertEqual(self.load.drop_probability('raw', 16), 1.0)
+
+class TestCollectGoodput(unittest.TestCase):
+    ''' Make sure /collect feeds the goodput '''
+
+    def test_speedtest(self):
+        ''' Make sure we use the largest of download and upload '''
+        server = NegotiateServer(None)
+        server.register_module('speedtest', NegotiateServerModule())
+        request = Message(uri='/collect/speedtest')
+        request.body = StringIO.StringIO('{"download_speed": 1000.0, '
+                                         '"upload_speed": 3000.0}')
+        server.process_request(MinimalStream(), request)
+        self.assertEqual(server.load.goodput['speedtest'], 3000.0)
+
+    def test_raw(self):
+        ''' Make sure the raw test reports the client goodput '''
+        module = NegotiateServerRaw()
+        self.assertEqual(module.goodput({'goodput': {'bytesdiff': 1000,
+                         'timediff': 0.5}}), 2000.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/negotiate/server_queue.py '''
+
+import random
+import sys
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.negotiate.server_queue import NegotiateQueue
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+class TestNegotiateQueue(unittest.TestCase):
+    ''' Compare NegotiateQueue with a list '''
+
+    def test_basic(self):
+        ''' Make sure append, remove and position work '''
+        queue = NegotiateQueue()
+        self.assertEqual([queue.append(name) for name in 'abcde'],
+                         range(5))
+        queue.remove('b')
+        self.assertEqual(list(queue), ['a', 'c', 'd', 'e'])
+        self.assertEqual(queue.position('e'), 3)
+        self.assertTrue('b' not in queue)
+        self.assertRaises(RuntimeError, queue.append, 'a')
+
+    def test_wait(self):
+        ''' Make sure streams are woken up in order '''
+        queue = NegotiateQueue()
+        for name in 'abcdefgh':
+            queue.append(name)
+        queue.wait('h', 5)
+        queue.wait('f', 3)
+        queue.wait('g', 0)
+        queue.remove('a')
+        self.assertEqual(queue.due(), [])
+        queue.remove('b')
+        self.assertEqual(queue.due(), ['f', 'h'])
+        self.assertEqual(queue.due(), [])
+        for name in 'cde':
+            queue.remove(name)
+        self.assertEqual(queue.due(), [])
+        queue.remove('f')
+        self.assertEqual(queue.due(), ['g'])
+
+    def test_random(self):
+        ''' Compare with a list, many times '''
+        rng = random.Random(7)
+        queue, model, targets = NegotiateQueue(), [], {}
+        counter = 0
+        for _ in range(4000):
+            choice = rng.random()
+            if choice < 0.4 or not model:
+                counter += 1
+                self.assertEqual(queue.append(counter), len(model))
+                model.append(counter)
+            elif choice < 0.8:
+                stream = rng.choice(model)
+                queue.remove(stream)
+                model.remove(stream)
+                targets.pop(stream, None)
+            else:
+                stream = rng.choice(model)
+                targets[stream] = rng.randint(0, len(model))
+                queue.wait(stream, targets[stream])
+
+            expected = [elem for elem in model if elem in targets
+                        and model.index(elem) <= targets[elem]]
+            self.assertEqual(queue.due(), expected)
+            for stream in expected:
+                del targets[stream]
+
+            self.assertEqual(list(queue), model)
+            self.assertEqual(queue.first(), model[0] if model else None)
+            self.assertEqual(len(queue), len(model))
+            if model:
+                stream = rng.choice(model)
+                self.assertEqual(queue.position(stream),
+                                 model.index(stream))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/negotiate/server_sched.py '''
+
+import sys
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.config import CONFIG
+from neubot.negotiate.server_sched import NegotiateScheduler
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+class FakeLoad(object):
+    ''' Load with programmed capacity and costs '''
+
+    def __init__(self, capacity, costs):
+        self.slots = capacity
+        self.costs = costs
+
+    def capacity(self):
+        ''' Returns the number of test slots '''
+        return self.slots
+
+    def cost(self, module):
+        ''' Returns the cost of a test of module '''
+        return self.costs[module]
+
+class TestNegotiateScheduler(unittest.TestCase):
+    ''' Regression test for NegotiateScheduler '''
+
+    def setUp(self):
+        self.saved = dict((name, CONFIG.get(name, 1.0)) for name in
+                          ('negotiate.a.weight', 'negotiate.b.weight'))
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            CONFIG[name] = value
+
+    def _fill(self, sched, name, count):
+        ''' Enqueue count streams for module name '''
+        for index in range(count):
+            sched.append(name, '%s%04d' % (name, index))
+
+    def _run(self, load, rounds):
+        ''' Keep both modules busy and count the tests that
+            each of them completes '''
+        sched = NegotiateScheduler(load)
+        sched.add_module('a')
+        sched.add_module('b')
+        self._fill(sched, 'a', 1000)
+        self._fill(sched, 'b', 1000)
+        completed = {'a': 0, 'b': 0}
+        running = sched.schedule()
+        for _ in range(rounds):
+            stream = running.pop(0)
+            completed[sched.running[stream][0]] += 1
+            sched.remove(stream)
+            running.extend(sched.schedule())
+        return sched, completed
+
+    def test_capacity(self):
+        ''' Make sure we unchoke no more than the capacity '''
+        sched = NegotiateScheduler(FakeLoad(4, {'a': 1.0}))
+        sched.add_module('a')
+        self._fill(sched, 'a', 6)
+        self.assertEqual(sched.schedule(), ['a0000', 'a0001',
+                                            'a0002', 'a0003'])
+        self.assertEqual(sched.schedule(), [])
+        self.assertEqual(sched.position('a0005'), 1)
+        sched.remove('a0001')
+        self.assertEqual(sched.schedule(), ['a0004'])
+        self.assertEqual(sched.in_use, 4.0)
+
+    def test_minimum(self):
+        ''' Make sure one test runs even without capacity '''
+        sched = NegotiateScheduler(FakeLoad(0, {'a': 3.0}))
+        sched.add_module('a')
+        self._fill(sched, 'a', 2)
+        self.assertEqual(sched.schedule(), ['a0000'])
+        self.assertEqual(sched.schedule(), [])
+
+    def test_fairness(self):
+        ''' Make sure a busy module does not starve the others '''
+        sched = NegotiateScheduler(FakeLoad(2, {'a': 1.0, 'b': 1.0}))
+        sched.add_module('a')
+        sched.add_module('b')
+        self._fill(sched, 'a', 100)
+        self.assertEqual(sched.schedule(), ['a0000', 'a0001'])
+        self._fill(sched, 'b', 1)
+        sched.remove('a0000')
+        self.assertEqual(sched.schedule(), ['a0002'])
+        sched.remove('a0001')
+        self.assertEqual(sched.schedule(), ['b0000'])
+
+    def test_weights(self):
+        ''' Make sure the slots are shared according to weights '''
+        CONFIG['negotiate.a.weight'] = 3.0
+        CONFIG['negotiate.b.weight'] = 1.0
+        completed = self._run(FakeLoad(4, {'a': 1.0, 'b': 1.0}), 800)[1]
+        self.assertAlmostEqual(completed['a'] / 3.0, completed['b'], delta=5)
+
+    def test_costs(self):
+        ''' Make sure expensive tests get the same share of slots '''
+        CONFIG['negotiate.a.weight'] = 1.0
+        CONFIG['negotiate.b.weight'] = 1.0
+        sched, completed = self._run(FakeLoad(8, {'a': 1.0, 'b': 4.0}), 800)
+        self.assertAlmostEqual(completed['a'] / 4.0, completed['b'], delta=5)
+        self.assertTrue(sched.in_use <= 8)
+
+if __name__ == "__main__":
+    unittest.main()
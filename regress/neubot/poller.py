@@ -29,6 +29,7 @@ if __name__ == '__main__':
     sys.path.insert(0, '.')
 
 from neubot.poller import Poller
+from neubot import poller as poller_module
 
 class TestCheckTimeoutStream(object):
     ''' Fake stream for TestCheckTimeout '''
@@ -110,5 +111,68 @@ class TestCheckTimeout(unittest.TestCase):
         # Make sure the writable set is consistent
         self.assertEqual(sorted(poller.writeset), range(16, 128, 2))
 
+class TestInstrumentStream(object):
+    ''' Fake stream for TestInstrument '''
+
+    def __init__(self, fileno):
+        self._fileno = fileno
+
+    def fileno(self):
+        ''' Return file number '''
+        return self._fileno
+
+    def handle_read(self):
+        ''' Invoked when readable '''
+
+    def handle_write(self):
+        ''' Invoked when writable '''
+        raise RuntimeError('write failed')
+
+    def handle_close(self):
+        ''' Invoked when this stream is closed '''
+
+class TestInstrument(unittest.TestCase):
+    ''' Regression test for the poller instrumentation '''
+
+    def test_disabled(self):
+        ''' Make sure there are no stats by default '''
+        poller = Poller(1)
+        data = {}
+        poller.snap(data)
+        self.assertFalse('stats' in data['poller'])
+
+    def test_streams(self):
+        ''' Make sure we time read and write callbacks '''
+        poller = Poller(1)
+        poller.instrument()
+        stream = TestInstrumentStream(3)
+        poller.set_readable(stream)
+        poller.set_writable(stream)
+        poller._call_handle_read(3)
+        poller._call_handle_read(3)
+        poller._call_handle_write(3)
+        sites = poller.stats.sites
+        self.assertEqual(sites['TestInstrumentStream.handle_read']['count'], 2)
+        self.assertEqual(sites['TestInstrumentStream.handle_write']['count'],
+                         1)
+        self.assertEqual(sum(sites['TestInstrumentStream.handle_read'][
+                         'buckets']), 2)
+
+    def test_tasks(self):
+        ''' Make sure we time tasks and measure the loop lag '''
+        poller = Poller(1)
+        poller.instrument(slow=0.0)
+        poller._run_task(self.test_disabled, (), poller_module.ticks() - 0.5)
+        data = {}
+        poller.snap(data)
+        stats = data['poller']['stats']
+        self.assertEqual(stats['sites']['TestInstrument.test_disabled'][
+                         'count'], 1)
+        self.assertEqual(stats['slow_count'], 1)
+        self.assertEqual(stats['lag']['count'], 1)
+        self.assertTrue(stats['lag']['max'] >= 0.5)
+        self.assertEqual(stats['lag']['buckets'][-1], 0)
+        self.assertEqual(stats['lag']['buckets'][-2], 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/rendezvous/redir_trie.py '''
+
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.rendezvous import redir_trie
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+CSV = '''"130.192.0.0","130.192.255.255","2193620992","2193686527","IT","Italy"
+"130.193.0.0","130.193.0.9","2193686528","2193686537","FR","France"
+"2001:760::", "2001:760:ffff:ffff:ffff:ffff:ffff:ffff", "0", "0", "IT", "Italy"
+"2001:7a8::", "2001:7a8:ffff:ffff:ffff:ffff:ffff:ffff", "0", "0", "NZ", "New Zealand"
+'''
+
+TABLE = {
+         'IT': ['a.example.com:8080', 'b.example.com:8080'],
+         'FR': ['c.example.com:8080'],
+        }
+
+class TestRangeToPrefixes(unittest.TestCase):
+    ''' Regression test for range_to_prefixes '''
+
+    def test_prefixes(self):
+        ''' Make sure we split ranges into CIDR prefixes '''
+        self.assertEqual(redir_trie.range_to_prefixes(32, 0, 2 ** 32 - 1),
+                         [(0, 0)])
+        self.assertEqual(redir_trie.range_to_prefixes(8, 1, 10),
+                         [(1, 8), (2, 7), (4, 6), (8, 7), (10, 8)])
+
+class TestRedirTrie(unittest.TestCase):
+    ''' Regression test for RedirTrie '''
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'redir_table.bin')
+        builder = redir_trie.RedirTrieBuilder(TABLE)
+        builder.insert_geoip_csv(StringIO.StringIO(CSV))
+        builder.write(self.path)
+        self.trie = redir_trie.RedirTrie()
+        self.trie.open(self.path)
+
+    def tearDown(self):
+        self.trie.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_lookup(self):
+        ''' Make sure lookup works for IPv4 and IPv6 '''
+        italy = ('IT', TABLE['IT'])
+        self.assertEqual(self.trie.lookup('130.192.91.211'), italy)
+        self.assertEqual(self.trie.lookup('::ffff:130.192.0.1'), italy)
+        self.assertEqual(self.trie.lookup('2001:760::1'), italy)
+        self.assertEqual(self.trie.lookup('130.193.0.9'), ('FR',
+                         TABLE['FR']))
+        self.assertEqual(self.trie.lookup('2001:7a8::1'), ('NZ', []))
+        self.assertEqual(self.trie.lookup('130.193.0.10'), None)
+        self.assertEqual(self.trie.lookup('2001:761::1'), None)
+        self.assertEqual(self.trie.lookup('not-an-address'), None)
+
+    def test_reload(self):
+        ''' Make sure we notice when the table changes '''
+        self.assertFalse(self.trie.reload())
+        builder = redir_trie.RedirTrieBuilder({'IT': ['d.example.com']})
+        builder.insert_range('130.192.0.0', '130.192.0.255', 'IT')
+        builder.write(self.path)
+        self.assertTrue(self.trie.reload())
+        self.assertEqual(self.trie.lookup('130.192.0.1'), ('IT',
+                         ['d.example.com']))
+        self.assertEqual(self.trie.lookup('130.192.91.211'), None)
+
+    def test_invalid(self):
+        ''' Make sure we refuse files that are not tables '''
+        filep = open(self.path, 'wb')
+        filep.write('x' * 64)
+        filep.close()
+        self.assertRaises(ValueError, self.trie.open, self.path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/rendezvous/server.py '''
+
+import StringIO
+import sys
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.config import CONFIG
+from neubot.http.message import Message
+from neubot.rendezvous import server
+
+from neubot.compat import json
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+class FakeGeolocator(object):
+    ''' Geolocator that does not know any address '''
+
+    def lookup_country(self, address):
+        ''' Lookup for country entry '''
+        return ''
+
+class MinimalHttpStream(object):
+    ''' Minimal HTTP stream '''
+
+    def __init__(self):
+        self.response = None
+        self.peername = ('130.192.91.211', 0)
+
+    def send_response(self, request, response):
+        ''' Keep around a copy of the response '''
+        self.response = response
+
+JSON_REQUEST = '''{"accept": ["speedtest", "bittorrent"], "version": "%s",
+ "privacy_informed": 1, "privacy_can_collect": 1, "privacy_can_share": 1}'''
+
+XML_REQUEST = '''<rendezvous_request><accept>speedtest</accept>
+<version>0.3.6</version></rendezvous_request>'''
+
+class TestProcessRequest(unittest.TestCase):
+    ''' Regression test for ServerRendezvous.process_request '''
+
+    def setUp(self):
+        server.CACHE.geolocator = FakeGeolocator()
+        self.server = server.ServerRendezvous(None)
+        self.server.configure(CONFIG)
+
+    def _rendezvous(self, body, mimetype):
+        ''' Send a rendezvous request and return the response '''
+        request = Message(uri='/rendezvous')
+        request['content-type'] = mimetype
+        request.body = StringIO.StringIO(body)
+        stream = MinimalHttpStream()
+        self.server.process_request(stream, request)
+        return stream.response
+
+    def test_json(self):
+        ''' Make sure JSON requests get a JSON response '''
+        response = self._rendezvous(JSON_REQUEST % '0.4.2',
+                                    'application/json')
+        self.assertEqual(response['content-type'], 'application/json')
+        body = json.loads(response.body)
+        self.assertEqual(body['available'], {
+          'speedtest': ['http://master.neubot.org/speedtest'],
+          'bittorrent': ['http://master.neubot.org/'],
+        })
+        self.assertEqual(body['update']['version'],
+                         CONFIG['rendezvous.server.update_version'])
+
+    def test_xml(self):
+        ''' Make sure old clients get a XML response '''
+        response = self._rendezvous(XML_REQUEST, 'application/xml')
+        self.assertEqual(response['content-type'], 'text/xml')
+        self.assertTrue('<update' in response.body)
+
+    def test_cache(self):
+        ''' Make sure we compose the response just once '''
+        self._rendezvous(JSON_REQUEST % '0.4.2', 'application/json')
+        self._rendezvous(JSON_REQUEST % '0.4.2', 'application/json')
+        self.assertEqual(len(self.server.responses), 1)
+        response = self._rendezvous(JSON_REQUEST % '0.4.16.9',
+                                    'application/json')
+        self.assertEqual(len(self.server.responses), 2)
+        self.assertEqual(json.loads(response.body)['update'], {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/rendezvous/server_cache.py '''
+
+import sqlite3
+import sys
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.config import CONFIG
+from neubot.database import table_geoloc
+from neubot.rendezvous import server_cache
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+
+class FakeGeolocator(object):
+    ''' Geolocator that counts lookups '''
+
+    def __init__(self):
+        self.lookups = []
+
+    def lookup_country(self, address):
+        ''' Lookup for country entry '''
+        self.lookups.append(address)
+        if address.startswith('130.192.'):
+            return 'IT'
+        return None
+
+class TestRendezvousCache(unittest.TestCase):
+    ''' Regression test for RendezvousCache '''
+
+    def setUp(self):
+        self.saved = CONFIG.get('rendezvous.server.cache_size', 4096)
+        self.connection = sqlite3.connect(':memory:')
+        table_geoloc.create(self.connection)
+        self.geolocator = FakeGeolocator()
+        self.cache = server_cache.RendezvousCache(self.geolocator)
+
+    def tearDown(self):
+        CONFIG['rendezvous.server.cache_size'] = self.saved
+
+    def test_country(self):
+        ''' Make sure we don't call GeoIP twice for an address '''
+        self.assertEqual(self.cache.lookup_country('130.192.91.211'), 'IT')
+        self.assertEqual(self.cache.lookup_country('130.192.91.211'), 'IT')
+        self.assertEqual(self.cache.lookup_country('130.192.91.1'), 'IT')
+        self.assertEqual(self.geolocator.lookups,
+                         ['130.192.91.211', '130.192.91.1'])
+
+    def test_negative(self):
+        ''' Make sure we also cache addresses that GeoIP does not know '''
+        self.assertEqual(self.cache.lookup_country('8.8.8.8'), '')
+        self.assertEqual(self.cache.lookup_country('8.8.8.8'), '')
+        self.assertEqual(self.geolocator.lookups, ['8.8.8.8'])
+        self.assertEqual(self.cache.snap()['hits'], 1)
+
+    def test_lru(self):
+        ''' Make sure we evict the least recently used address '''
+        CONFIG['rendezvous.server.cache_size'] = 2
+        for address in ('130.192.1.1', '130.192.2.1', '130.192.1.1',
+                        '130.192.3.1', '130.192.1.1', '130.192.2.1'):
+            self.cache.lookup_country(address)
+        self.assertEqual(self.geolocator.lookups, ['130.192.1.1',
+                         '130.192.2.1', '130.192.3.1', '130.192.2.1'])
+        self.assertEqual(len(self.cache.countries), 2)
+
+    def test_servers(self):
+        ''' Make sure the table is reloaded when it changes '''
+        table_geoloc.insert_server(self.connection, 'IT', 'a.example.com')
+        self.cache.load(self.connection)
+        self.assertEqual(self.cache.lookup_servers(self.connection, 'IT'),
+                         ['a.example.com'])
+        self.assertEqual(self.cache.lookup_servers(self.connection, 'FR'), [])
+        table_geoloc.insert_server(self.connection, 'FR', 'b.example.com')
+        self.assertEqual(self.cache.lookup_servers(self.connection, 'FR'),
+                         ['b.example.com'])
+
+if __name__ == "__main__":
+    unittest.main()
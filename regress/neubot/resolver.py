@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/resolver.py '''
+
+import socket
+import sys
+import time
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.defer import Deferred
+from neubot import resolver
+from neubot import utils
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+class FakePoller(object):
+    ''' Poller that keeps track of the readset '''
+
+    def __init__(self):
+        self.readset = {}
+
+    def set_readable(self, stream):
+        ''' Monitor for readability '''
+        self.readset[stream.fileno()] = stream
+
+    def unset_readable(self, stream):
+        ''' Stop monitoring for readability '''
+        self.readset.pop(stream.fileno(), None)
+
+class FakeResolver(resolver.Resolver):
+    ''' Resolver that counts lookups and knows just one name '''
+
+    def __init__(self, poller):
+        resolver.Resolver.__init__(self, poller)
+        self.lookups = []
+
+    def lookup(self, key):
+        self.lookups.append(key)
+        if key[0] != 'www.example.com':
+            raise socket.gaierror(socket.EAI_NONAME, 'Name not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                 ('192.0.2.1', key[1]))]
+
+class TestResolver(unittest.TestCase):
+    ''' Regression test for Resolver '''
+
+    def setUp(self):
+        self.poller = FakePoller()
+        self.resolver = FakeResolver(self.poller)
+        self.results = []
+
+    def _resolve(self, epnt):
+        ''' Start resolving epnt '''
+        deferred = Deferred()
+        deferred.add_callback(self.results.append)
+        deferred.add_errback(lambda failure: self.results.append(
+                             failure.value.__class__))
+        self.resolver.getaddrinfo(epnt, deferred)
+
+    def _wait(self):
+        ''' Wait for the workers and dispatch their results '''
+        for _ in range(500):
+            if len(self.resolver.results) >= len(self.resolver.waiting):
+                break
+            time.sleep(0.01)
+        for stream in list(self.poller.readset.values()):
+            stream.handle_read()
+
+    def test_numeric(self):
+        ''' Make sure numeric hosts are resolved in place '''
+        self._resolve(('127.0.0.1', 80))
+        self.assertEqual(self.results[0][0][4], ('127.0.0.1', 80))
+        self.assertEqual(self.resolver.lookups, [])
+        self.assertEqual(self.poller.readset, {})
+
+    def test_cached(self):
+        ''' Make sure we coalesce and cache lookups '''
+        self._resolve(('www.example.com', 80))
+        self._resolve(('www.example.com', 80))
+        self.assertEqual(self.results, [])
+        self.assertEqual(len(self.poller.readset), 1)
+        self._wait()
+        self.assertEqual(len(self.results), 2)
+        self.assertEqual(self.results[0][0][4], ('192.0.2.1', 80))
+        self.assertEqual(self.poller.readset, {})
+        self._resolve(('www.example.com', 80))
+        self.assertEqual(len(self.results), 3)
+        self.assertEqual(self.resolver.lookups, [('www.example.com', 80)])
+
+    def test_negative(self):
+        ''' Make sure we cache failures for less time '''
+        self._resolve(('www.example.org', 80))
+        self._wait()
+        self._resolve(('www.example.org', 80))
+        self.assertEqual(self.results, [socket.gaierror, socket.gaierror])
+        self.assertEqual(len(self.resolver.lookups), 1)
+        expires = self.resolver.cache[('www.example.org', 80)][0]
+        self.assertTrue(expires - utils.ticks() <= resolver.NEGATIVE_TTL)
+        self.resolver.cache[('www.example.org', 80)] = (0, None)
+        self._resolve(('www.example.org', 80))
+        self._wait()
+        self.assertEqual(len(self.resolver.lookups), 2)
+
+if __name__ == "__main__":
+    unittest.main()
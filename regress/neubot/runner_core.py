@@ -22,6 +22,7 @@
 
 ''' Regression test for runner_core module '''
 
+import collections
 import unittest
 import sys
 import logging
@@ -34,10 +35,14 @@ from neubot.defer import Deferred
 from neubot.log import LOG
 from neubot.notify import NOTIFIER
 from neubot.runner_core import RunnerCore
+from neubot.runner_hosts import RUNNER_HOSTS
+from neubot.runner_policy import RUNNER_POLICY
 from neubot.runner_tests import RUNNER_TESTS
 
 from neubot import bittorrent
 from neubot import privacy
+from neubot import runner_core
+from neubot import runner_mlabns
 
 class TestIsRunningTest(unittest.TestCase):
     ''' Regression test for test_is_running() '''
@@ -200,5 +205,73 @@ class RunQueueTest(unittest.TestCase):
         self.assertTrue(log_error[0])
         self.assertFalse(NOTIFIER.is_subscribed("testdone"))
 
+class PrefetchTest(unittest.TestCase):
+    ''' Make sure the next test uses the prefetched host '''
+
+    #
+    # We have too many public methods and we know that
+    # pylint: disable=R0904
+    #
+
+    def test_prefetch(self):
+        ''' Prefetch during bittorrent, then run raw, and so on '''
+
+        # Register the prefetches and the raw connections
+        prefetches = []
+        connects = []
+
+        def on_prefetch(test, policy, prefer_ipv6):
+            ''' Register prefetch() and simulate mlab-ns response '''
+            # pylint: disable=W0613
+            prefetches.append((test, policy))
+            RUNNER_HOSTS.set_host(test, policy, {'fqdn': 'neubot.%s.org'
+                                                 % test})
+
+        class FakeRawNegotiate(object):
+            ''' Register RawNegotiate.connect() invokation '''
+            @staticmethod
+            def connect(endpoint, prefer_ipv6, sslconfig, extra):
+                ''' Register connect() invokation '''
+                # pylint: disable=W0613
+                connects.append(endpoint)
+
+        # Setup (we will restore that later)
+        saved_run = bittorrent.run
+        saved_prefetch = runner_mlabns.prefetch
+        saved_raw_negotiate = runner_core.RawNegotiate
+        saved_sequence = RUNNER_POLICY.sequence
+        bittorrent.run = lambda poller, conf: None
+        runner_mlabns.prefetch = on_prefetch
+        runner_core.RawNegotiate = FakeRawNegotiate
+        RUNNER_POLICY.sequence = collections.deque(['bittorrent', 'raw'])
+        RUNNER_TESTS.update({'bittorrent': '/'})
+
+        CONFIG.conf['privacy.can_publish'] = 1
+        CONFIG.conf['privacy.informed'] = 1
+        CONFIG.conf['privacy.can_collect'] = 1
+        core = RunnerCore()
+        core.run(RUNNER_POLICY.get_next_test(), Deferred(), False)
+        NOTIFIER.publish('testdone')
+        core.run(RUNNER_POLICY.get_next_test(), Deferred())
+        queue = [elem[0] for elem in core.queue]
+        NOTIFIER.publish('testdone')
+        RUNNER_TESTS.update({})
+        uri = RUNNER_TESTS.test_to_negotiate_uri('bittorrent')
+
+        # Restore
+        bittorrent.run = saved_run
+        runner_mlabns.prefetch = saved_prefetch
+        runner_core.RawNegotiate = saved_raw_negotiate
+        RUNNER_POLICY.sequence = saved_sequence
+        RUNNER_TESTS.update({})
+
+        # Worked as expected?
+        self.assertEqual(prefetches, [('raw', 'random'), ('bittorrent', '')])
+        self.assertEqual(queue, ['raw'])
+        self.assertEqual(connects, [('neubot.raw.org', 8080)])
+        self.assertFalse(RUNNER_HOSTS.has_host('raw', 'random'))
+        # Without rendezvous, bittorrent uses the prefetched closest host
+        self.assertEqual(uri, 'http://neubot.bittorrent.org:8080/')
+
 if __name__ == '__main__':
     unittest.main()
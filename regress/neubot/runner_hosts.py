@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/runner_hosts.py '''
+
+import sys
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot.runner_hosts import RunnerHosts
+from neubot.runner_hosts import STATIC_TABLE
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+CLOSEST = {'fqdn': 'neubot.mlab.mlab1.trn01.measurement-lab.org'}
+RANDOM = {'fqdn': 'neubot.mlab.mlab2.syd01.measurement-lab.org'}
+
+class TestRunnerHosts(unittest.TestCase):
+    ''' Regression test for RunnerHosts '''
+
+    def test_closest(self):
+        ''' Make sure the closest host is fresh, then stale, then
+            forgotten '''
+        hosts = RunnerHosts()
+        hosts.set_host('speedtest', '', CLOSEST, now=1000)
+        self.assertFalse(hosts.needs_refresh('speedtest', '', now=2000))
+        self.assertEqual(hosts.get_host('speedtest', '', now=2000),
+                         CLOSEST['fqdn'])
+        self.assertEqual(hosts.get_host('speedtest', '', now=2000),
+                         CLOSEST['fqdn'])
+        self.assertTrue(hosts.needs_refresh('speedtest', '', now=5000))
+        self.assertEqual(hosts.get_host('speedtest', '', now=5000),
+                         CLOSEST['fqdn'])
+        self.assertEqual(hosts.get_host('speedtest', '', now=12000), None)
+        self.assertFalse(hosts.has_host('speedtest', ''))
+        self.assertTrue(hosts.get_closest_host('speedtest') in STATIC_TABLE)
+
+    def test_random(self):
+        ''' Make sure the random host is used just once, even when
+            it is stale '''
+        hosts = RunnerHosts()
+        hosts.set_host('raw', 'random', RANDOM, now=1000)
+        self.assertFalse(hosts.needs_refresh('raw', 'random', now=2000))
+        self.assertTrue(hosts.needs_refresh('raw', 'random', now=3000))
+        self.assertTrue(hosts.has_host('raw', 'random', now=3000))
+        self.assertEqual(hosts.get_host('raw', 'random', now=3000),
+                         RANDOM['fqdn'])
+        self.assertFalse(hosts.has_host('raw', 'random'))
+        self.assertTrue(hosts.get_random_host('raw') in STATIC_TABLE)
+
+    def test_per_test(self):
+        ''' Make sure each test has its own host '''
+        hosts = RunnerHosts()
+        hosts.set_closest_host('speedtest', CLOSEST)
+        self.assertTrue(hosts.has_host('speedtest', ''))
+        self.assertFalse(hosts.has_host('bittorrent', ''))
+        self.assertFalse(hosts.has_host('speedtest', 'random'))
+
+    def test_refresh(self):
+        ''' Make sure we don't refresh twice in parallel '''
+        hosts = RunnerHosts()
+        self.assertTrue(hosts.needs_refresh('raw', 'random'))
+        self.assertTrue(hosts.begin_refresh('raw', 'random'))
+        self.assertFalse(hosts.begin_refresh('raw', 'random'))
+        self.assertFalse(hosts.needs_refresh('raw', 'random'))
+        self.assertTrue(hosts.needs_refresh('speedtest', ''))
+        hosts.end_refresh('raw', 'random')
+        self.assertTrue(hosts.needs_refresh('raw', 'random'))
+
+if __name__ == "__main__":
+    unittest.main()
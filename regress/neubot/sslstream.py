@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2013 Simone Basso <bassosimone@gmail.com>,
+#  NEXA Center for Internet & Society at Politecnico di Torino
+#
+# This file is part of Neubot <http://www.neubot.org/>.
+#
+# Neubot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Neubot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Neubot.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+''' Regression test for neubot/sslstream.py '''
+
+import sys
+import unittest
+
+if __name__ == "__main__":
+    sys.path.insert(0, ".")
+
+from neubot import sslstream
+
+#
+# We don't maintain unittest, so we don't care about the number
+# of methods.
+#
+# pylint: disable=R0904
+#
+
+class FakeSSLSocket(object):
+    ''' SSL socket with a session '''
+
+    def __init__(self, session):
+        self.session = session
+
+class TestSessions(unittest.TestCase):
+    ''' Regression test for the client sessions cache '''
+
+    def setUp(self):
+        sslstream.SESSIONS.clear()
+
+    def test_save(self):
+        ''' Make sure we remember the sessions of clients only '''
+        sslstream.save_session(FakeSSLSocket('abc'), ('127.0.0.1', 443))
+        sslstream.save_session(FakeSSLSocket('def'), None)
+        sslstream.save_session(FakeSSLSocket(None), ('127.0.0.2', 443))
+        self.assertEqual(list(sslstream.SESSIONS.items()),
+                         [(('127.0.0.1', 443), 'abc')])
+
+    def test_bounded(self):
+        ''' Make sure we forget the least recently saved sessions '''
+        for index in range(sslstream.MAX_SESSIONS + 2):
+            sslstream.save_session(FakeSSLSocket(index), ('10.0.0.1', index))
+        self.assertEqual(len(sslstream.SESSIONS), sslstream.MAX_SESSIONS)
+        self.assertFalse(('10.0.0.1', 0) in sslstream.SESSIONS)
+        self.assertFalse(('10.0.0.1', 1) in sslstream.SESSIONS)
+        sslstream.save_session(FakeSSLSocket('x'), ('10.0.0.1', 2))
+        self.assertEqual(list(sslstream.SESSIONS.keys())[-1],
+                         ('10.0.0.1', 2))
+
+class TestContexts(unittest.TestCase):
+    ''' Regression test for the shared contexts '''
+
+    def test_client(self):
+        ''' Make sure clients share the same context '''
+        context = sslstream.get_context('')
+        if context is None:
+            return  # No SSLContext in this Python
+        self.assertTrue(sslstream.get_context('') is context)
+        data = {}
+        sslstream.snap(data)
+        self.assertTrue('client' in data['sslstream']['contexts'])
+
+if __name__ == "__main__":
+    unittest.main()